@@ -18,7 +18,9 @@ import string
 
 import base64
 import binascii
+import functools
 
+from eventlet import greenpool
 import pecan
 
 from oslo_log import log
@@ -28,8 +30,11 @@ from oslo_utils import units
 from oslo_utils import uuidutils
 import six
 
+from kongming.common import cpuset
 from kongming.common import exception
+from kongming.common import placement
 from kongming.common import states
+from kongming.common import topology
 from kongming.common import utils
 from kongming.conf import CONF
 #from kongming.agent import rpcapi
@@ -39,6 +44,9 @@ from kongming import objects
 
 LOG = log.getLogger(__name__)
 
+# Number of concurrent Nova lookups of a batch request.
+LOOKUP_CONCURRENCY = 10
+
 
 class API(object):
     """API for interacting with the agent manager."""
@@ -51,6 +59,92 @@ class API(object):
     def _get_instance(self, context, instance_uuid):
         return self.compute_api.get_instance(context, instance_uuid)
 
+    def _get_instances(self, context, instance_uuids):
+        """Look several instances up in Nova concurrently.
+
+        :returns: a dict mapping the instance uuids to the Nova servers.
+        """
+        pool = greenpool.GreenPool(LOOKUP_CONCURRENCY)
+        return dict(zip(instance_uuids,
+                        pool.imap(functools.partial(self._get_instance,
+                                                    context),
+                                  instance_uuids)))
+
+    def _new_operation(self, context, mapping, action):
+        return objects.MappingOperation(
+            context, uuid=uuidutils.generate_uuid(),
+            instance_uuid=mapping.instance_uuid,
+            project_id=mapping.project_id, user_id=mapping.user_id,
+            action=action, status=states.QUEUED,
+            cpu_mappings=mapping.cpu_mappings)
+
+    def _create_operation(self, context, mapping, action):
+        operation = self._new_operation(context, mapping, action)
+        operation.create()
+        return operation
+
+    def _check_conflicts(self, context, mappings):
+        """Validate the mappings of a batch together.
+
+        An instance can only appear once in a batch and the explicit
+        pinnings of the batch must not share host CPUs. Automatic mappings
+        are placed by the conductor around the CPUs used by the others.
+
+        :raises: BadRequest or InstanceCPUMappingConflict.
+        """
+        host_cpus = {}
+        pinned_by_host = {}
+        seen = set()
+        for mapping in mappings:
+            if mapping.instance_uuid in seen:
+                raise exception.BadRequest(
+                    reason='instance %s is listed more than once' %
+                           mapping.instance_uuid)
+            seen.add(mapping.instance_uuid)
+            if (not mapping.host or
+                    placement.get_auto_policy(mapping.cpu_mappings)):
+                continue
+
+            if mapping.host not in host_cpus:
+                try:
+                    host_cpus[mapping.host] = topology.get_host_cpus(
+                        objects.Host.get(context,
+                                         mapping.host).cpu_topology)
+                except exception.HostNotFound:
+                    host_cpus[mapping.host] = cpuset.CPUSet()
+            pinned = cpuset.CPUSet()
+            for cpus in cpuset.parse_vcpu_pinning(
+                    mapping.cpu_mappings).values():
+                pinned = pinned | cpus
+            if host_cpus[mapping.host] and \
+                    host_cpus[mapping.host].issubset(pinned):
+                # Floating vCPUs allowed on every host CPU.
+                continue
+
+            host_pinned = pinned_by_host.setdefault(mapping.host, [])
+            for other_uuid, other_pinned in host_pinned:
+                shared = pinned & other_pinned
+                if shared:
+                    raise exception.InstanceCPUMappingConflict(
+                        uuid=mapping.instance_uuid, other=other_uuid,
+                        cpus=shared.to_spec(), host=mapping.host)
+            host_pinned.append((mapping.instance_uuid, pinned))
+
+    def _dispatch(self, context, mappings, operations):
+        """Cast the mappings to the conductor, one batch per host."""
+        batches = {}
+        for mapping, operation in zip(mappings, operations):
+            if not mapping.host:
+                continue
+            host_mappings, operation_uuids = batches.setdefault(
+                mapping.host, ([], {}))
+            host_mappings.append(mapping)
+            operation_uuids[mapping.instance_uuid] = operation.uuid
+
+        for host, (host_mappings, operation_uuids) in batches.items():
+            pecan.request.conductor_api.update_instance_cpu_mappings(
+                context, host_mappings, operation_uuids)
+
     def create_instance_cpu_mapping(self, context, mapping_dict,
                                     wait_until_active):
         if wait_until_active:
@@ -74,14 +168,26 @@ class API(object):
             # 2. call the agent on the instance.host to do the job
 
         new_mapping.create()
+        # A mapping waiting for its instance stays queued until the
+        # conductor applies it once the instance is active.
+        operation = self._create_operation(context, new_mapping,
+                                           states.CREATE)
 
         if not wait_until_active:
             pecan.request.conductor_api.create_instance_cpu_mapping(
-                context, new_mapping)
+                context, new_mapping, operation_uuid=operation.uuid)
+
+        return new_mapping, operation
 
-        return new_mapping
+    def update_instance_cpu_mapping(self, context, db_mapping, if_match=None):
+        """Save and apply the changes of a mapping.
 
-    def update_instance_cpu_mapping(self, context, db_mapping):
+        :param if_match: the version of the mapping the changes are based
+                         on, if None the changes are applied on top of
+                         concurrent updates.
+        :raises: PreconditionFailed if the mapping is not at the if_match
+                 version.
+        """
         inst_dict = self._get_instance(
             context, db_mapping.instance_uuid)
         if inst_dict['OS-EXT-STS:vm_state'] != 'active':
@@ -89,9 +195,97 @@ class API(object):
                 reason='Instance should with active vm_state to update '
                        'the instance cpu mappings.')
 
-        pecan.request.conductor_api.update_instance_cpu_mapping(
-            context, db_mapping)
         db_mapping.status = states.PENDING
-        db_mapping.save()
+        if if_match is None:
+            db_mapping.save_with_retry(context)
+        else:
+            if db_mapping.version != if_match:
+                raise exception.PreconditionFailed(
+                    reason='the mapping is at version %s, not %s' %
+                           (db_mapping.version, if_match))
+            try:
+                db_mapping.save(context)
+            except exception.ConcurrentUpdate:
+                raise exception.PreconditionFailed(
+                    reason='the mapping has been updated concurrently')
+        operation = self._create_operation(context, db_mapping,
+                                           states.UPDATE)
+        pecan.request.conductor_api.update_instance_cpu_mapping(
+            context, db_mapping, operation_uuid=operation.uuid)
+
+        return db_mapping, operation
+
+    def create_instance_cpu_mappings(self, context, mapping_dicts):
+        """Create a batch of mappings.
+
+        The mappings and their operations are written in one transaction,
+        then sent to the conductor grouped per host.
+
+        :param mapping_dicts: dicts of the mapping values, with a
+                              wait_until_active key.
+        :returns: a list of (mapping, operation) tuples.
+        """
+        instances = self._get_instances(
+            context, [mapping_dict['instance_uuid']
+                      for mapping_dict in mapping_dicts
+                      if not mapping_dict['wait_until_active']])
+
+        mappings = []
+        for mapping_dict in mapping_dicts:
+            mapping_dict = dict(mapping_dict)
+            wait_until_active = mapping_dict.pop('wait_until_active')
+            mapping = objects.InstanceCPUMapping(context, **mapping_dict)
+            mapping.status = states.PENDING
+            if not wait_until_active:
+                inst_dict = instances[mapping.instance_uuid]
+                if inst_dict['OS-EXT-STS:vm_state'] != 'active':
+                    raise exception.BadRequest(
+                        reason='Instance %s should with active vm_state if '
+                               'creating cpu mapping without '
+                               '"wait_until_active=True".' %
+                               mapping.instance_uuid)
+                mapping.host = inst_dict['OS-EXT-SRV-ATTR:host']
+            mappings.append(mapping)
+
+        self._check_conflicts(context, mappings)
+        operations = [self._new_operation(context, mapping, states.CREATE)
+                      for mapping in mappings]
+        objects.InstanceCPUMappingList.bulk_create(context, mappings,
+                                                   operations)
+        self._dispatch(context, mappings, operations)
+        return list(zip(mappings, operations))
+
+    def update_instance_cpu_mappings(self, context, cpu_mappings):
+        """Update a batch of mappings.
+
+        :param cpu_mappings: a dict mapping instance uuids to their new
+                             cpu_mappings.
+        :returns: a list of (mapping, operation) tuples.
+        """
+        mappings = objects.InstanceCPUMapping.list(
+            context, filters={'instance_uuid': list(cpu_mappings)},
+            project_only=False)
+        missing = set(cpu_mappings) - set(mapping.instance_uuid
+                                          for mapping in mappings)
+        if missing:
+            raise exception.InstanceCPUMappingNotFound(
+                uuid=', '.join(sorted(missing)))
+
+        instances = self._get_instances(context, list(cpu_mappings))
+        for mapping in mappings:
+            inst_dict = instances[mapping.instance_uuid]
+            if inst_dict['OS-EXT-STS:vm_state'] != 'active':
+                raise exception.BadRequest(
+                    reason='Instance %s should with active vm_state to '
+                           'update the instance cpu mappings.' %
+                           mapping.instance_uuid)
+            mapping.cpu_mappings = cpu_mappings[mapping.instance_uuid]
+            mapping.status = states.PENDING
 
-        return db_mapping
+        self._check_conflicts(context, mappings)
+        operations = [self._new_operation(context, mapping, states.UPDATE)
+                      for mapping in mappings]
+        objects.InstanceCPUMappingList.bulk_save(context, mappings,
+                                                 operations)
+        self._dispatch(context, mappings, operations)
+        return list(zip(mappings, operations))
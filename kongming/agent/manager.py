@@ -13,17 +13,25 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
-import libvirt
-from xml.dom import minidom
+import hashlib
 
+from eventlet import greenpool
+from eventlet import semaphore
+from oslo_concurrency import lockutils
+from oslo_context import context as oslo_context
 from oslo_log import log as logging
 import oslo_messaging as messaging
+from oslo_serialization import jsonutils
 from oslo_service import periodic_task
+from oslo_utils import timeutils
+import six
 
-from kongming.common import utils
+from kongming.common import cpuset
+from kongming.common import states
 from kongming.conductor import rpcapi as conductor_rpcapi
 from kongming.conf import CONF
 from kongming import objects
+from kongming.virt import driver
 
 
 LOG = logging.getLogger(__name__)
@@ -32,17 +40,40 @@ LOG = logging.getLogger(__name__)
 class AgentManager(periodic_task.PeriodicTasks):
     """Kongming Agent manager main class."""
 
-    RPC_API_VERSION = '1.0'
+    RPC_API_VERSION = '1.1'
     target = messaging.Target(version=RPC_API_VERSION)
 
     def __init__(self, topic, host=None):
         super(AgentManager, self).__init__(CONF)
         self.topic = topic
         self.host = host or CONF.host
-        self.conn = libvirt.open('qemu:///system')
-        self.hostname = self.conn.getHostname()
-        self.maxcpu = self.conn.getInfo()[2]
+        self._events_enabled = False
+        self._last_full_sync = None
+        # Last reported (status, vcpu pin info) per domain, only the
+        # domains that differ from it are sent to the conductor.
+        self._instance_fingerprints = {}
+        self._instance_generation = 0
+        self._instances_resync_required = True
+        # Instance reports of the events and of the full walk are sent one
+        # at a time, each one follows the generation of the previous one.
+        self._report_lock = semaphore.Semaphore()
+        self._mappings_reconciled = not CONF.agent.reconcile_on_startup
+        # Fingerprint of the last reported host cpu topology.
+        self._host_fingerprint = None
+        # vCPU pinning per domain, only trusted when events are enabled.
+        self._vcpu_pin_cache = {}
+        self.driver = driver.load_driver()
+        self.hostname = self.driver.get_hostname()
+        self.maxcpu = self.driver.get_max_cpu()
         self.conductor_api = conductor_rpcapi.ConductorAPI()
+        self._worker_pool = greenpool.GreenPool(size=CONF.agent.pin_workers)
+        self._mapping_pool = greenpool.GreenPool(
+            size=CONF.agent.mapping_workers)
+        # Adjustments of the same domain are serialized, only the newest
+        # mapping received for a domain is applied.
+        self._domain_locks = lockutils.Semaphores()
+        self._mapping_seq = 0
+        self._latest_mappings = {}
         self._started = False
         LOG.info('The maximum cpu of host %s is %s',
                   self.hostname, self.maxcpu)
@@ -57,9 +88,24 @@ class AgentManager(periodic_task.PeriodicTasks):
             raise RuntimeError(_('Attempt to start an already running '
                                  'engine manager'))
 
+        if CONF.agent.enable_libvirt_events and self.driver.supports_events:
+            self.driver.register_event_handler(self._handle_events)
+            self._events_enabled = True
+
         self._started = True
 
+    def _handle_events(self, instance_uuids):
+        """Sync the domains that changed according to driver events."""
+        context = oslo_context.get_admin_context()
+        for instance_uuid in instance_uuids:
+            try:
+                self._update_instances(context, instance_uuid=instance_uuid)
+            except Exception:
+                LOG.exception('Failed to sync instance %s after domain '
+                              'event.', instance_uuid)
+
     def del_host(self):
+        self._mapping_pool.waitall()
         self._worker_pool.waitall()
         self._started = False
 
@@ -77,89 +123,290 @@ class AgentManager(periodic_task.PeriodicTasks):
 
         :param context: security context
         """
+        if (self._events_enabled and
+                self._last_full_sync is not None and
+                not timeutils.is_older_than(self._last_full_sync,
+                                            CONF.agent.full_sync_interval)):
+            # Domain changes are already delivered by driver events, the
+            # full walk is only kept as a safety net.
+            return
+
         self._update_host_resources(context)
         self._update_instances(context)
+        self._last_full_sync = timeutils.utcnow()
 
-    def _update_host_resources(self, context):
-        host_cpu_topology = {}
-        capsXML = self.conn.getCapabilities()
+        if not self._mappings_reconciled:
+            # The instances of the host are known by the conductor now,
+            # have their mappings applied again in case the pinning has
+            # been lost, e.g. by a host reboot.
+            self.conductor_api.reconcile_instance_cpu_mappings(
+                context, self.hostname)
+            self._mappings_reconciled = True
 
-        caps = minidom.parseString(capsXML)
-        cells = caps.getElementsByTagName('cells')[0]
+    def _update_host_resources(self, context, force=False):
+        """Report the host cpu topology to the conductor.
 
-        for cell in cells.getElementsByTagName('cell'):
-            id = str(cell.getAttribute('id'))
-            cpus = cell.getElementsByTagName('cpus')[0]
-            cpu_list = [int(cpu.getAttribute('id')) for cpu in
-                        cpus.getElementsByTagName('cpu')]
-            host_cpu_topology[id] = cpu_list
+        The topology is only reported when its fingerprint differs from
+        the last reported one, at startup or when force is set.
+        """
+        cpu_topology = self.driver.get_cpu_topology()
+        fingerprint = hashlib.sha1(jsonutils.dump_as_bytes(
+            cpu_topology, sort_keys=True)).hexdigest()
+        if not force and fingerprint == self._host_fingerprint:
+            return
 
         host = objects.Host(context, host_name=self.hostname,
-                            cpu_topology=host_cpu_topology)
-
+                            cpu_topology=cpu_topology)
         self.conductor_api.check_and_update_host_resources(
             context, host)
+        self._host_fingerprint = fingerprint
+
+    def _collect_instances(self, context, instance_uuid=None):
+        """Collect the active instances and their fingerprints.
+
+        :param context: security context
+        :param instance_uuid: only collect the given domain instead of
+                              walking every active domain on the host.
+        :returns: a tuple of two dicts keyed by instance uuid, the first
+                  one holding Instance objects, the second one their
+                  (status, vcpu pin info) fingerprints.
+        """
+        instances = {}
+        fingerprints = {}
+
+        if instance_uuid:
+            stats = self.driver.get_instance_stats(instance_uuid)
+            # Keep the same semantic as the full walk which only lists
+            # active domains.
+            domains = [stats] if stats else []
+            # The domain has just changed, do not trust the cache.
+            self._vcpu_pin_cache.pop(instance_uuid, None)
+        else:
+            domains = self.driver.list_instances()
+            active = set(uuid for uuid, status, vcpus in domains)
+            for uuid in list(self._vcpu_pin_cache):
+                if uuid not in active:
+                    del self._vcpu_pin_cache[uuid]
+
+        for uuid, status, vcpus in domains:
+            cpu_maps = self._get_vcpu_pin_info(uuid, vcpus)
+            # The pinning is reported as cpuset strings, a cpumap list of
+            # booleans per vCPU would be hundreds of values on large hosts.
+            instances[uuid] = objects.Instance(
+                context, status=status, uuid=uuid, host=self.hostname,
+                cpu_mappings=cpuset.encode_vcpu_cpus(
+                    dict(enumerate(cpu_maps))))
+            fingerprints[uuid] = (status, cpu_maps)
+
+        return instances, fingerprints
+
+    def _get_vcpu_pin_info(self, uuid, vcpus):
+        """Return the vCPU pinning of a domain as a tuple of cpumaps.
+
+        The vCPU pinning is not part of the bulk domain stats. When events
+        are enabled, pin changes are delivered by tuning events which
+        invalidate the cached pinning of the domain, so that the full walk
+        only queries the domains that are new, changed or whose vCPU count
+        differs from the cached pinning.
+        """
+        cpu_maps = self._vcpu_pin_cache.get(uuid)
+        if (cpu_maps is not None and self._events_enabled and
+                (vcpus is None or vcpus == len(cpu_maps))):
+            return cpu_maps
+
+        cpu_maps = self.driver.get_vcpu_pin_info(uuid)
+        self._vcpu_pin_cache[uuid] = cpu_maps
+        return cpu_maps
 
     def _update_instances(self, context, instance_uuid=None):
-        instances = []
+        """Report the instances changed since the last report.
+
+        Only added, changed and removed instances are sent together with
+        a generation number, a full report is sent on startup or when the
+        conductor detects that the generations diverged.
+
+        :param context: security context
+        :param instance_uuid: only check the given domain instead of
+                              walking every active domain on the host.
+        """
+        with self._report_lock:
+            self._report_instances(context, instance_uuid)
+
+    def _report_instances(self, context, instance_uuid=None):
+        """Report the changed instances, with the report lock held."""
+        if self._instances_resync_required:
+            self._report_all_instances(context)
+            return
+
+        instances, fingerprints = self._collect_instances(
+            context, instance_uuid)
 
         if instance_uuid:
-            doms = [self.conn.lookupByUUIDString(instance_uuid)]
+            checked = [instance_uuid]
         else:
-            doms = self.conn.listAllDomains(
-                libvirt.VIR_CONNECT_LIST_DOMAINS_ACTIVE)
-
-        for dom in doms:
-            status, reason = dom.state()
-            status = self._map_domain_state(str(status))
-            cpu_maps = dom.vcpuPinInfo()
-            cpu_map = {}
-            cpu_num = 0
-            for map in cpu_maps:
-                cpu_map[str(cpu_num)] = list(map)
-                cpu_num += 1
-            instance = objects.Instance(
-                context, status=status, uuid=dom.UUIDString(),
-                host=self.hostname, cpu_mappings=cpu_map)
-            instances.append(instance)
-
-        instance_list_obj = objects.InstanceList(objects=instances)
+            checked = self._instance_fingerprints.keys()
+
+        changed = [instance for uuid, instance in instances.items()
+                   if self._instance_fingerprints.get(uuid) !=
+                   fingerprints[uuid]]
+        removed = [uuid for uuid in checked
+                   if uuid in self._instance_fingerprints and
+                   uuid not in instances]
+
+        if not changed and not removed:
+            return
+
+        generation = self._instance_generation + 1
+        try:
+            accepted = self.conductor_api.update_instances_delta(
+                context, self.hostname, generation,
+                objects.InstanceList(objects=changed), removed)
+        except Exception:
+            # We can't tell whether the delta has been applied or not.
+            self._instances_resync_required = True
+            raise
+
+        if not accepted:
+            # The conductor lost track of this host, e.g. its record has
+            # been deleted, report the topology again before the instances.
+            self._update_host_resources(context, force=True)
+            self._report_all_instances(context)
+            return
+
+        self._instance_generation = generation
+        for uuid in removed:
+            self._instance_fingerprints.pop(uuid, None)
+        self._instance_fingerprints.update(fingerprints)
+
+    def _report_all_instances(self, context):
+        """Send the complete set of active instances to the conductor.
+
+        Called with the report lock held.
+        """
+        self._instances_resync_required = True
+        instances, fingerprints = self._collect_instances(context)
+        generation = self._instance_generation + 1
+
+        instance_list_obj = objects.InstanceList(
+            objects=list(instances.values()))
         self.conductor_api.check_and_update_instances(
-            context, self.hostname, instance_list_obj)
-
-    def _map_domain_state(self, status):
-        state_dict = {
-            "0": "No State",
-            "1": "Running",
-            "2": "Blocked",
-            "3": "Paused",
-            "4": "Shutdown",
-            "5": "Shutoff",
-            "6": "Crashed",
-            "7": "Suspended",
-            "8": "Last"
-        }
-        return state_dict[status]
+            context, self.hostname, instance_list_obj, generation)
+
+        self._instance_generation = generation
+        self._instance_fingerprints = fingerprints
+        self._instances_resync_required = False
 
     def adjust_instance_cpu_mapping(self, context, mapping):
+        """Pin the vCPUs of an instance as described by the mapping."""
+        seq = self._register_mapping(mapping)
+        return self._adjust_instance(mapping, seq) is None
+
+    def adjust_instance_cpu_mappings(self, context, mappings):
+        """Apply a batch of mappings sent by the conductor.
+
+        The instances are adjusted concurrently on the mapping worker pool.
+        When an instance is listed several times, or a newer mapping of
+        the instance is received while an older one waits for its lock,
+        only the newest one is applied.
+
+        :returns: a dict mapping the instance uuids to None if their
+                  mapping has been applied, to states.SUPERSEDED if a
+                  newer mapping of the instance has been applied instead,
+                  or to the reason it failed.
+        """
+        seqs = [self._register_mapping(mapping) for mapping in mappings]
+        pile = greenpool.GreenPile(self._mapping_pool)
+        for mapping, seq in zip(mappings, seqs):
+            pile.spawn(self._adjust_instance, mapping, seq)
+
+        results = {}
+        for mapping, error in zip(mappings, pile):
+            # The result of the newest mapping of an instance wins.
+            results[mapping['instance_uuid']] = error
+        return results
+
+    def _register_mapping(self, mapping):
+        """Record a mapping as the newest one of its instance."""
+        self._mapping_seq += 1
+        self._latest_mappings[mapping['instance_uuid']] = self._mapping_seq
+        return self._mapping_seq
+
+    def _adjust_instance(self, mapping, seq):
+        """Apply a mapping under the lock of its instance.
+
+        :returns: None if the mapping has been applied, states.SUPERSEDED
+                  if a newer mapping of the instance is applied instead, or
+                  the reason it has not.
+        """
+        instance_uuid = mapping['instance_uuid']
+        try:
+            with lockutils.lock(instance_uuid,
+                                semaphores=self._domain_locks):
+                if self._latest_mappings.get(instance_uuid) != seq:
+                    LOG.info('Skip a cpu mapping of instance %s superseded '
+                             'by a newer one.', instance_uuid)
+                    return states.SUPERSEDED
+                if self._pin_instance(mapping):
+                    return None
+                return ('Failed to pin the vCPUs of instance %s on host '
+                        '%s.' % (instance_uuid, self.host))
+        except Exception as e:
+            LOG.exception('Failed to adjust the cpu mapping of instance '
+                          '%s.', instance_uuid)
+            return six.text_type(e) or e.__class__.__name__
+        finally:
+            if self._latest_mappings.get(instance_uuid) == seq:
+                del self._latest_mappings[instance_uuid]
+
+    def _pin_instance(self, mapping):
+        """Pin the vCPUs of an instance as described by the mapping.
+
+        The cpu_mappings of the mapping is a per-vCPU pinning spec, see
+        kongming.common.cpuset.parse_vcpu_pinning(). vCPUs already pinned
+        as requested are skipped and the others are pinned concurrently.
+        """
         instance_uuid = mapping['instance_uuid']
-        cpu_mapping = mapping['cpu_mappings']
-        pinng_map = utils.calculate_cpumap(cpu_mapping, self.maxcpu)
-        LOG.info('The calculated CPU map is ' + str(pinng_map))
-        dom = self.conn.lookupByUUIDString(instance_uuid)
-        instance_cpu_num = dom.info()[3]
-        LOG.info('Pin domain vcpus to host cpu %s.', pinng_map)
-        for i in xrange(0, instance_cpu_num):
-            LOG.info('Pin domain vcpu %s to host cpu %s with'
-                     'flag: %s...' % (i, pinng_map,
-                                      libvirt.VIR_DOMAIN_AFFECT_LIVE))
-            ret = dom.pinVcpuFlags(i, pinng_map,
-                                   libvirt.VIR_DOMAIN_AFFECT_LIVE)
-            if ret == 0:
-                LOG.info('...Success')
-            else:
-                LOG.info('...Failed')
-
-        LOG.info('VCPU ping for instance %s finished', instance_uuid)
-
-        return True
+        persistent = CONF.agent.persistent_pinning
+        pinning = cpuset.parse_vcpu_pinning(
+            mapping['cpu_mappings'], self.maxcpu)
+        current_maps = self.driver.get_vcpu_pin_info(instance_uuid)
+        config_maps = None
+        if persistent:
+            config_maps = self.driver.get_vcpu_pin_info(instance_uuid,
+                                                        config=True)
+        for vcpu in pinning:
+            if vcpu is not None and vcpu >= len(current_maps):
+                LOG.warning('Instance %(uuid)s has no vCPU %(vcpu)s, '
+                            'ignore its pinning.',
+                            {'uuid': instance_uuid, 'vcpu': vcpu})
+
+        pile = greenpool.GreenPile(self._worker_pool)
+        for vcpu, current_map in enumerate(current_maps):
+            cpu_set = pinning.get(vcpu, pinning.get(None))
+            if cpu_set is None:
+                continue
+            pinning_map = cpu_set.to_cpumap(self.maxcpu)
+            if (tuple(current_map) == pinning_map and
+                    (not config_maps or vcpu >= len(config_maps) or
+                     tuple(config_maps[vcpu]) == pinning_map)):
+                LOG.debug('vCPU %(vcpu)s of instance %(uuid)s is already '
+                          'pinned to host cpu %(cpus)s.',
+                          {'vcpu': vcpu, 'uuid': instance_uuid,
+                           'cpus': cpu_set})
+                continue
+            pile.spawn(self._pin_vcpu, instance_uuid, vcpu, cpu_set,
+                       persistent)
+
+        result = all(list(pile))
+        self._vcpu_pin_cache.pop(instance_uuid, None)
+        LOG.info('VCPU pin for instance %s finished', instance_uuid)
+
+        return result
+
+    def _pin_vcpu(self, instance_uuid, vcpu, cpu_set, persistent=False):
+        LOG.info('Pin vcpu %(vcpu)s of instance %(uuid)s to host cpu '
+                 '%(cpus)s...',
+                 {'vcpu': vcpu, 'uuid': instance_uuid, 'cpus': cpu_set})
+        return self.driver.pin_vcpu(instance_uuid, vcpu,
+                                    cpu_set.to_cpumap(self.maxcpu),
+                                    persistent=persistent)
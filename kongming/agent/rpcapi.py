@@ -31,10 +31,11 @@ class EngineAPI(object):
     API version history:
 
     |    1.0 - Initial version.
+    |    1.1 - Add adjust_instance_cpu_mappings.
 
     """
 
-    RPC_API_VERSION = '1.0'
+    RPC_API_VERSION = '1.1'
 
     def __init__(self, topic=None):
         super(EngineAPI, self).__init__()
@@ -50,7 +51,24 @@ class EngineAPI(object):
                                      serializer=serializer)
 
     def update_instance_cpu_mapping(self, context, mapping):
-        cctxt = self.client.prepare(server=mapping.host,
-                                    version=self.RPC_API_VERSION)
+        cctxt = self.client.prepare(server=mapping.host, version='1.0')
         return cctxt.call(context, 'adjust_instance_cpu_mapping',
                           mapping=mapping)
+
+    def update_instance_cpu_mappings(self, context, host, mappings):
+        """Apply several mappings of a host with a single call.
+
+        :returns: a dict mapping the instance uuids to None if their
+                  mapping has been applied, to states.SUPERSEDED if a
+                  newer mapping of the instance has been applied instead,
+                  or to the reason it failed.
+        """
+        if not self.client.can_send_version('1.1'):
+            return dict(
+                (mapping.instance_uuid,
+                 None if self.update_instance_cpu_mapping(context, mapping)
+                 else 'The agent failed to pin the vCPUs.')
+                for mapping in mappings)
+        cctxt = self.client.prepare(server=host, version='1.1')
+        return cctxt.call(context, 'adjust_instance_cpu_mappings',
+                          mappings=mappings)
@@ -43,4 +43,19 @@ class APIBase(wtypes.Base):
 
         for k in self.as_dict():
             if k not in except_list:
-                setattr(self, k, wsme.Unset)
\ No newline at end of file
+                setattr(self, k, wsme.Unset)
+
+
+def record_as_dict(record):
+    """Render a read only record of an object as a dict.
+
+    The values are rendered like the same fields of the API types, so
+    that the dict can be returned as the JSON of a resource.
+    """
+    result = {}
+    for name in record.__slots__:
+        value = getattr(record, name)
+        if isinstance(value, datetime.datetime):
+            value = value.isoformat()
+        result[name] = value
+    return result
@@ -28,6 +28,19 @@ def build_url(resource, resource_args, bookmark=False, base_url=None):
     return template % {'url': base_url, 'res': resource, 'args': resource_args}
 
 
+def make_links(resource, resource_args, url=None):
+    """Return the self and bookmark links of a resource as dicts.
+
+    These are the links built with Link.make_link(), for the responses
+    rendered without the API types.
+    """
+    return [{'href': build_url(resource, resource_args, base_url=url),
+             'rel': 'self'},
+            {'href': build_url(resource, resource_args, bookmark=True,
+                               base_url=url),
+             'rel': 'bookmark'}]
+
+
 class Link(base.APIBase):
     """A link representation."""
 
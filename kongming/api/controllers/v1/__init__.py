@@ -24,6 +24,7 @@ from kongming.api.controllers import link
 from kongming.api.controllers.v1 import hosts
 from kongming.api.controllers.v1 import instances
 from kongming.api.controllers.v1 import instance_cpu_mappings
+from kongming.api.controllers.v1 import mapping_operations
 from kongming.api import expose
 
 
@@ -36,6 +37,9 @@ class V1(base.APIBase):
     instance_cpu_mappings = [link.Link]
     """Links to the mapping resource"""
 
+    mapping_operations = [link.Link]
+    """Links to the mapping operation resource"""
+
     hosts = [link.Link]
     """Links to the host resource"""
 
@@ -52,6 +56,12 @@ class V1(base.APIBase):
             link.Link.make_link('bookmark', pecan.request.public_url,
                                 'instance_cpu_mappings', '', bookmark=True)
             ]
+        v1.mapping_operations = [
+            link.Link.make_link('self', pecan.request.public_url,
+                                'mapping_operations', ''),
+            link.Link.make_link('bookmark', pecan.request.public_url,
+                                'mapping_operations', '', bookmark=True)
+            ]
         v1.hosts = [
             link.Link.make_link('self', pecan.request.public_url,
                                 'hosts', ''),
@@ -72,6 +82,7 @@ class Controller(rest.RestController):
 
     instance_cpu_mappings = \
         instance_cpu_mappings.InstanceCPUMappingsController()
+    mapping_operations = mapping_operations.MappingOperationsController()
     hosts = hosts.HostsController()
     instances = instances.InstancesController()
 
@@ -0,0 +1,74 @@
+# Copyright 2018 Huawei Technologies Co.,LTD.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import pecan
+from six.moves.urllib import parse as urlparse
+from wsme import types as wtypes
+
+from kongming.api.controllers import base
+from kongming.api.controllers import link
+
+
+class Collection(base.APIBase):
+
+    next = wtypes.text
+    """A link to retrieve the next subset of the collection"""
+
+    # Name of the attribute holding the items, the url of the resource and
+    # the item attribute used as marker. Override these in subclasses.
+    _type = None
+    _resource = None
+    _marker_field = 'uuid'
+
+    @property
+    def collection(self):
+        return getattr(self, self._type)
+
+    def has_next(self, limit):
+        """Return whether collection has more items."""
+        return len(self.collection) and len(self.collection) == limit
+
+    def get_next(self, limit, **kwargs):
+        """Return a link to the next subset of the collection."""
+        if not self.has_next(limit):
+            return wtypes.Unset
+
+        return self._build_next(
+            limit, getattr(self.collection[-1], self._marker_field),
+            **kwargs)
+
+    @classmethod
+    def _build_next(cls, limit, marker, **kwargs):
+        args = dict((key, value) for key, value in kwargs.items()
+                    if value is not None)
+        args['limit'] = limit
+        args['marker'] = marker
+        next_args = '?' + urlparse.urlencode(sorted(args.items()))
+
+        return link.Link.make_link('next', pecan.request.public_url,
+                                   cls._resource, next_args).href
+
+    @classmethod
+    def convert_items(cls, items, limit=None, **kwargs):
+        """Return a collection of items rendered as dicts, as a dict.
+
+        The list API calls render the items from read only records instead
+        of building an API object per item, see base.record_as_dict().
+        """
+        collection = {cls._type: items}
+        if limit is not None and items and len(items) == limit:
+            collection['next'] = cls._build_next(
+                limit, items[-1][cls._marker_field], **kwargs)
+        return collection
@@ -23,13 +23,17 @@ from oslo_log import log
 
 from kongming.api.controllers import base
 from kongming.api.controllers import link
+from kongming.api.controllers.v1 import collection
 from kongming.api.controllers.v1 import types
 from kongming.api.controllers.v1 import utils as api_utils
 from kongming.api import expose
 from kongming.common import exception
 from kongming.common import policy
 from kongming.common import clients
+from kongming.common import cpuset
+from kongming.common import placement
 from kongming.common import states
+from kongming.common import topology
 from kongming import compute
 from kongming import objects
 
@@ -54,6 +58,15 @@ class Host(base.APIBase):
     instances = [types.jsontype]
     """The instances on this host"""
 
+    pinned_cpus = wtypes.text
+    """The host cpus pinned by the instances on this host"""
+
+    cpu_usage = types.jsontype
+    """The total, pinned and free cpus of every NUMA cell of this host"""
+
+    instance_count = int
+    """The number of instances on this host"""
+
     links = wsme.wsattr([link.Link], readonly=True)
     """A list containing a self link"""
 
@@ -65,6 +78,8 @@ class Host(base.APIBase):
                 continue
             self.fields.append(field)
             setattr(self, field, kwargs.get(field, wtypes.Unset))
+        for field in ('pinned_cpus', 'cpu_usage', 'instance_count'):
+            setattr(self, field, kwargs.get(field, wtypes.Unset))
 
     @classmethod
     def _handle_instance(cls, instance):
@@ -72,29 +87,48 @@ class Host(base.APIBase):
         instance_dict.pop('created_at')
         instance_dict.pop('updated_at')
         instance_dict.pop('host')
-        cpu_map = cpu_maps['0']
-        for raw_cpu_map in cpu_maps.values():
-            for i in xrange(len(cpu_map)):
-                cpu_map[i - 1] = cpu_map[i - 1] or raw_cpu_map[i - 1]
-        instance_dict['cpu_mappings'] = cpu_map
+        cpus = cpuset.CPUSet()
+        for vcpu_cpus in (instance_dict['cpu_mappings'] or {}).values():
+            cpus = cpus | cpuset.decode_cpus(vcpu_cpus)
+        instance_dict['cpu_mappings'] = cpus.to_spec()
         return instance_dict
 
+    @staticmethod
+    def _convert_topology(cpu_topology):
+        if topology.is_structured(cpu_topology):
+            return cpu_topology
+        return dict(('NUMA_' + key, value)
+                    for key, value in (cpu_topology or {}).items())
+
+    @staticmethod
+    def _get_usage(cpu_topology, pcpu_usage):
+        """Return the pinned cpus and the cpu usage of a host, as a dict."""
+        pinned_cpus = cpuset.CPUSet(pcpu_usage)
+        return {
+            'pinned_cpus': pinned_cpus.to_spec(),
+            'cpu_usage': dict(
+                ('NUMA_' + key, value)
+                for key, value in placement.get_cell_usage(
+                    cpu_topology, pinned_cpus).items()),
+        }
+
     @classmethod
-    def convert_with_links(cls, obj_host):
-        host_dict = {}
+    def convert_with_links(cls, obj_host, pcpu_usage):
+        """Convert a Host object to its API representation.
+
+        :param pcpu_usage: a dict mapping the host CPUs pinned by the
+                           instances of the host to their number of vCPUs.
+        """
+        host_dict = cls._get_usage(obj_host.cpu_topology, pcpu_usage)
         for field in obj_host:
             if field == 'instances':
-                instance_dict_list = []
-                for instance in getattr(obj_host, field):
-                    instance_dict = Host._handle_instance(instance)
-                    instance_dict_list.append(instance_dict)
-                host_dict[field] = instance_dict_list
+                host_dict['instance_count'] = len(obj_host.instances)
+                host_dict[field] = [
+                    Host._handle_instance(instance)
+                    for instance in obj_host.instances]
             elif field == 'cpu_topology':
-                host_dict[field] = getattr(obj_host, field)
-                keys = host_dict[field].keys()
-                for key in keys:
-                    host_dict[field]['NUMA_' + key] = host_dict[field].pop(
-                        key)
+                host_dict[field] = cls._convert_topology(
+                    obj_host.cpu_topology)
             else:
                 host_dict[field] = getattr(obj_host, field)
 
@@ -111,25 +145,70 @@ class Host(base.APIBase):
             ]
         return api_host
 
-
-class HostCollection(base.APIBase):
+    @classmethod
+    def convert_record_with_links(cls, record, pcpu_usage, instance_count):
+        """Render a HostRecord as a dict, see convert_with_links()."""
+        host = base.record_as_dict(record)
+        host.update(cls._get_usage(record.cpu_topology, pcpu_usage))
+        host['cpu_topology'] = cls._convert_topology(record.cpu_topology)
+        host['instance_count'] = instance_count
+        host['links'] = link.make_links('hosts', record.host_name,
+                                        url=pecan.request.public_url)
+        return host
+
+
+class HostCollection(collection.Collection):
     """API representation of a collection of Host."""
 
     hosts = [Host]
     """A list containing host objects"""
 
-    @classmethod
-    def convert_with_links(cls, obj_hosts):
-        collection = cls()
-        collection.hosts = [
-            Host.convert_with_links(obj_host)
-            for obj_host in obj_hosts]
-        return collection
+    _type = 'hosts'
+    _resource = 'hosts'
+    _marker_field = 'host_name'
 
 
 class HostsController(rest.RestController):
     """REST controller for Host."""
 
+    _sort_keys = ['id', 'host_name', 'created_at', 'updated_at']
+
+    @policy.authorize_wsgi("kongming:host", "get")
+    @expose.expose(types.jsontype, int, types.string, wtypes.text,
+                   wtypes.text)
+    def get_all(self, limit=None, marker=None, sort_key='id',
+                sort_dir='asc'):
+        """Retrieve a list of hosts with their cpu usage.
+
+        :param limit: maximum number of hosts to return.
+        :param marker: host_name of the last host of the previous page.
+        :param sort_key: column to sort the results by. Default: id.
+        :param sort_dir: direction to sort. "asc" or "desc". Default: asc.
+        """
+        limit = api_utils.validate_limit(limit)
+        sort_key = api_utils.validate_sort_key(sort_key, self._sort_keys)
+        sort_dir = api_utils.validate_sort_dir(sort_dir)
+
+        context = pecan.request.context
+        # The hosts are only read, they are rendered from records rather
+        # than from objects and API types.
+        records = objects.Host.list_records(
+            context, limit=limit, marker=marker, sort_key=sort_key,
+            sort_dir=sort_dir)
+        # The usage of the whole page is read from the vCPU pin and
+        # instance indexes instead of loading the instances.
+        host_names = [record.host_name for record in records]
+        pcpu_usage = objects.InstanceVCPUPinList.get_pcpu_usage(
+            context, host_names)
+        instance_counts = objects.Instance.count_by_host_names(
+            context, host_names)
+        return HostCollection.convert_items(
+            [Host.convert_record_with_links(
+                record, pcpu_usage[record.host_name],
+                instance_counts[record.host_name])
+             for record in records],
+            limit=limit, sort_key=sort_key, sort_dir=sort_dir)
+
     @policy.authorize_wsgi("kongming:host", "get")
     @expose.expose(Host, types.string)
     def get_one(self, host_name):
@@ -137,6 +216,9 @@ class HostsController(rest.RestController):
 
         :param host_name: name of the host.
         """
+        context = pecan.request.context
         db_host = objects.Host.get(
-            pecan.request.context, host_name, expected_attrs=['instances'])
-        return Host.convert_with_links(db_host)
+            context, host_name, expected_attrs=['instances'])
+        pcpu_usage = objects.InstanceVCPUPinList.get_pcpu_usage(
+            context, [host_name])
+        return Host.convert_with_links(db_host, pcpu_usage[host_name])
@@ -23,6 +23,7 @@ from oslo_log import log
 
 from kongming.api.controllers import base
 from kongming.api.controllers import link
+from kongming.api.controllers.v1 import collection
 from kongming.api.controllers.v1 import types
 from kongming.api.controllers.v1 import utils as api_utils
 from kongming.api import expose
@@ -66,6 +67,10 @@ class InstanceCPUMapping(base.APIBase):
     links = wsme.wsattr([link.Link], readonly=True)
     """A list containing a self link"""
 
+    operation = wsme.wsattr([link.Link], readonly=True)
+    """Links to the operation applying the mapping, only set in the
+    responses of the requests changing the mapping"""
+
     def __init__(self, **kwargs):
         self.fields = []
         for field in objects.InstanceCPUMapping.fields:
@@ -76,7 +81,7 @@ class InstanceCPUMapping(base.APIBase):
             setattr(self, field, kwargs.get(field, wtypes.Unset))
 
     @classmethod
-    def convert_with_links(cls, obj_mapping):
+    def convert_with_links(cls, obj_mapping, operation=None):
         api_mapping = cls(**obj_mapping.as_dict())
         url = pecan.request.public_url
         api_mapping.links = [
@@ -88,27 +93,44 @@ class InstanceCPUMapping(base.APIBase):
                 api_mapping.instance_uuid,
                 bookmark=True)
             ]
+        if operation is not None:
+            api_mapping.operation = [
+                link.Link.make_link(
+                    'self', url, 'mapping_operations', operation.uuid),
+                link.Link.make_link(
+                    'bookmark', url, 'mapping_operations', operation.uuid,
+                    bookmark=True)
+                ]
         return api_mapping
 
+    @staticmethod
+    def convert_record_with_links(record):
+        """Render an InstanceCPUMappingRecord as a dict."""
+        mapping = base.record_as_dict(record)
+        mapping['links'] = link.make_links(
+            'instance_cpu_mappings', record.instance_uuid,
+            url=pecan.request.public_url)
+        return mapping
+
 
-class InstanceCPUMappingCollection(base.APIBase):
+class InstanceCPUMappingCollection(collection.Collection):
     """API representation of a collection of InstanceCPUMapping."""
 
     mappings = [InstanceCPUMapping]
     """A list containing mapping objects"""
 
-    @classmethod
-    def convert_with_links(cls, obj_mappings):
-        collection = cls()
-        collection.mappings = [
-            InstanceCPUMapping.convert_with_links(obj_mapping)
-            for obj_mapping in obj_mappings]
-        return collection
+    _type = 'mappings'
+    _resource = 'instance_cpu_mappings'
+    _marker_field = 'instance_uuid'
 
 
 class InstanceCPUMappingsController(rest.RestController):
     """REST controller for InstanceCPUMapping."""
 
+    _custom_actions = {
+        'batch': ['POST', 'PUT'],
+    }
+
     @policy.authorize_wsgi("kongming:instance_cpu_mapping", "get")
     @expose.expose(InstanceCPUMapping, types.uuid)
     def get_one(self, instance_uuid):
@@ -118,24 +140,155 @@ class InstanceCPUMappingsController(rest.RestController):
         """
         db_mapping = objects.InstanceCPUMapping.get(
             pecan.request.context, instance_uuid)
+        api_utils.set_etag(db_mapping.version)
         return InstanceCPUMapping.convert_with_links(db_mapping)
 
+    _sort_keys = ['id', 'instance_uuid', 'host', 'status', 'project_id',
+                  'created_at', 'updated_at']
+
     @policy.authorize_wsgi("kongming:instance_cpu_mapping", "get")
-    @expose.expose(InstanceCPUMappingCollection)
-    def get_all(self):
-        """Retrieve a list of instance_cpu_mappings."""
-        mappings = objects.InstanceCPUMapping.list(pecan.request.context)
-        return InstanceCPUMappingCollection.convert_with_links(mappings)
+    @expose.expose(types.jsontype, int, types.uuid,
+                   wtypes.text, wtypes.text, wtypes.text, wtypes.text,
+                   wtypes.text)
+    def get_all(self, limit=None, marker=None, sort_key='id',
+                sort_dir='asc', host=None, status=None, project_id=None):
+        """Retrieve a list of instance_cpu_mappings.
+
+        :param limit: maximum number of mappings to return.
+        :param marker: instance_uuid of the last mapping of the previous
+                       page.
+        :param sort_key: column to sort the results by. Default: id.
+        :param sort_dir: direction to sort. "asc" or "desc". Default: asc.
+        :param host: only return the mappings of this host.
+        :param status: only return the mappings with this status.
+        :param project_id: only return the mappings of this project, only
+                           admins can list the mappings of other projects.
+        """
+        context = pecan.request.context
+        limit = api_utils.validate_limit(limit)
+        sort_key = api_utils.validate_sort_key(sort_key, self._sort_keys)
+        sort_dir = api_utils.validate_sort_dir(sort_dir)
+
+        filters = {}
+        if host:
+            filters['host'] = host
+        if status:
+            filters['status'] = status
+        project_only = True
+        if project_id:
+            filters['project_id'] = project_id
+            project_only = not context.is_admin
+
+        # The mappings are only read, they are rendered from records
+        # rather than from objects and API types.
+        records = objects.InstanceCPUMapping.list_records(
+            context, limit=limit, marker=marker, sort_key=sort_key,
+            sort_dir=sort_dir, filters=filters, project_only=project_only)
+        return InstanceCPUMappingCollection.convert_items(
+            [InstanceCPUMapping.convert_record_with_links(record)
+             for record in records],
+            limit=limit, sort_key=sort_key, sort_dir=sort_dir,
+            host=host, status=status, project_id=project_id)
 
     @policy.authorize_wsgi("kongming:instance_cpu_mapping", "create")
-    @expose.expose(InstanceCPUMapping, body=types.jsontype,
-                   status_code=http_client.CREATED)
-    def post(self, mapping):
+    @expose.expose(InstanceCPUMapping, int, body=types.jsontype,
+                   status_code=http_client.ACCEPTED)
+    def post(self, wait=None, mapping=None):
         """Create a new cpu mapping for the given instance.
 
+        The mapping is applied asynchronously, the Location header of the
+        response points to the operation tracking its application.
+
+        :param wait: number of seconds to wait for the mapping to be
+                     applied before answering, capped to [api]max_wait.
         :param mapping: a mapping within the request body.
-        :return:
         """
+        mapping_dict = self._get_mapping_dict(mapping)
+        wait_until_active = mapping.get('wait_until_active')
+
+        LOG.debug('Wait until active is %s for this call',
+                  wait_until_active)
+        context = pecan.request.context
+        mapping, operation = \
+            pecan.request.agent_api.create_instance_cpu_mapping(
+                context, mapping_dict, wait_until_active)
+
+        return self._wait_and_convert(context, mapping, operation, wait)
+
+    @policy.authorize_wsgi("kongming:instance_cpu_mapping", "create")
+    @expose.expose(InstanceCPUMappingCollection, int, body=types.jsontype,
+                   status_code=http_client.ACCEPTED)
+    def post_batch(self, wait=None, batch=None):
+        """Create the cpu mappings of several instances.
+
+        The mappings are validated together and created in one
+        transaction, then applied asynchronously host by host.
+
+        :param wait: number of seconds to wait for all the mappings to be
+                     applied before answering, capped to [api]max_wait.
+        :param batch: a dict with a "mappings" list, every item being a
+                      mapping like in the body of a single creation.
+        """
+        mappings = self._get_batch(batch)
+        mapping_dicts = []
+        for mapping in mappings:
+            mapping_dict = self._get_mapping_dict(mapping)
+            mapping_dict['wait_until_active'] = bool(
+                mapping.get('wait_until_active'))
+            mapping_dicts.append(mapping_dict)
+
+        context = pecan.request.context
+        results = pecan.request.agent_api.create_instance_cpu_mappings(
+            context, mapping_dicts)
+        return self._wait_and_convert_batch(context, results, wait)
+
+    @policy.authorize_wsgi("kongming:instance_cpu_mapping", "update")
+    @expose.expose(InstanceCPUMappingCollection, int, body=types.jsontype,
+                   status_code=http_client.ACCEPTED)
+    def put_batch(self, wait=None, batch=None):
+        """Update the cpu mappings of several instances.
+
+        :param wait: number of seconds to wait for all the mappings to be
+                     applied before answering, capped to [api]max_wait.
+        :param batch: a dict with a "mappings" list, every item having the
+                      "instance_uuid" and the new "cpu_mappings".
+        """
+        cpu_mappings = {}
+        for mapping in self._get_batch(batch):
+            for key in mapping:
+                if key not in ['instance_uuid', 'cpu_mappings']:
+                    raise exception.PatchError(
+                        patch=mapping,
+                        reason=('invalid field %s provided for update', key))
+            try:
+                instance_uuid = mapping['instance_uuid']
+                cpu_mappings[instance_uuid] = \
+                    api_utils.normalize_cpu_mappings(mapping['cpu_mappings'])
+            except KeyError as e:
+                raise exception.BadRequest(
+                    reason='Missing %s in batch item' % e)
+
+        if len(cpu_mappings) != len(batch['mappings']):
+            raise exception.BadRequest(
+                reason='An instance is listed more than once')
+
+        context = pecan.request.context
+        results = pecan.request.agent_api.update_instance_cpu_mappings(
+            context, cpu_mappings)
+        return self._wait_and_convert_batch(context, results, wait)
+
+    @staticmethod
+    def _get_batch(batch):
+        if not isinstance(batch, dict) or \
+                not isinstance(batch.get('mappings'), list):
+            raise exception.BadRequest(
+                reason='The body must hold a "mappings" list')
+        api_utils.validate_batch_size(batch['mappings'])
+        return batch['mappings']
+
+    @staticmethod
+    def _get_mapping_dict(mapping):
+        """Return the values of a mapping to create from a request."""
         provided_project_id = mapping.get('project_id')
         provided_user_id = mapping.get('user_id')
         if provided_project_id or provided_user_id:
@@ -144,40 +297,82 @@ class InstanceCPUMappingsController(rest.RestController):
                     reason='Only admins can create mappings with '
                     'project_id and user_id.'
                 )
-        mapping_dict = {
+        return {
             'instance_uuid': mapping['instance_uuid'],
-            'cpu_mappings': mapping['cpu_mappings'],
+            'cpu_mappings': api_utils.normalize_cpu_mappings(
+                mapping['cpu_mappings']),
             'wait_until_active': False,
             'project_id': (provided_project_id or
                            pecan.request.context.project_id),
             'user_id': provided_user_id or pecan.request.context.user_id
         }
 
-        wait_until_active = mapping.get('wait_until_active')
-
-        LOG.debug('Wait until active is %s for this call',
-                  wait_until_active)
-        mapping = pecan.request.agent_api.create_instance_cpu_mapping(
-            pecan.request.context, mapping_dict, wait_until_active)
+    def _wait_and_convert_batch(self, context, results, wait):
+        """Wait for the operations of a batch, return the API mappings."""
+        mappings = [mapping for mapping, operation in results]
+        operations = [operation for mapping, operation in results]
+        if wait:
+            operations = api_utils.wait_for_operations(context, operations,
+                                                       wait)
+            finished = [operation.instance_uuid for operation in operations
+                        if operation.finished]
+            if finished:
+                refreshed = dict(
+                    (mapping.instance_uuid, mapping) for mapping in
+                    objects.InstanceCPUMapping.list(
+                        context, filters={'instance_uuid': finished},
+                        project_only=False))
+                mappings = [refreshed.get(mapping.instance_uuid, mapping)
+                            for mapping in mappings]
+
+        collection = InstanceCPUMappingCollection()
+        collection.mappings = [
+            InstanceCPUMapping.convert_with_links(mapping,
+                                                  operation=operation)
+            for mapping, operation in zip(mappings, operations)]
+        return collection
 
-        pecan.response.location = link.build_url('instance_cpu_mappings',
-                                                 mapping.instance_uuid)
-        return InstanceCPUMapping.convert_with_links(mapping)
+    def _wait_and_convert(self, context, mapping, operation, wait):
+        """Wait for a mapping operation and return the API mapping."""
+        if wait:
+            operation = api_utils.wait_for_operation(context, operation,
+                                                     wait)
+            if operation.finished:
+                mapping = objects.InstanceCPUMapping.get(
+                    context, mapping.instance_uuid)
+
+        pecan.response.location = link.build_url('mapping_operations',
+                                                 operation.uuid)
+        api_utils.set_etag(mapping.version)
+        return InstanceCPUMapping.convert_with_links(mapping,
+                                                     operation=operation)
 
     @policy.authorize_wsgi("kongming:instance_cpu_mapping", "update")
-    @expose.expose(InstanceCPUMapping, body=types.jsontype)
-    def put(self, instance_uuid, mapping):
+    @expose.expose(InstanceCPUMapping, types.uuid, int,
+                   body=types.jsontype, status_code=http_client.ACCEPTED)
+    def put(self, instance_uuid, wait=None, mapping=None):
         """Update an instance cpu mapping.
 
+        Like on creation, the mapping is applied asynchronously. With an
+        If-Match header holding the ETag of the mapping, the update is only
+        applied if the mapping did not change since it has been read, 412
+        is returned otherwise.
+
         :param instance_uuid: the uuid of the cpu mapping to be updated.
-        :param patch: a mapping to apply to this update.
+        :param wait: number of seconds to wait for the mapping to be
+                     applied before answering, capped to [api]max_wait.
+        :param mapping: a mapping to apply to this update.
         """
         for key in mapping:
             if key not in ['cpu_mappings']:
                 raise exception.PatchError(
                     patch=mapping,
                     reason=('invalid field %s provided for update', key))
+        if 'cpu_mappings' in mapping:
+            mapping['cpu_mappings'] = api_utils.normalize_cpu_mappings(
+                mapping['cpu_mappings'])
 
+        if_match = api_utils.get_if_match_version()
         db_mapping = objects.InstanceCPUMapping.get(
             pecan.request.context, instance_uuid)
 
@@ -191,10 +386,13 @@ class InstanceCPUMappingsController(rest.RestController):
             if db_mapping[field] != patch_val:
                 db_mapping[field] = patch_val
 
-        updated_mapping = pecan.request.agent_api.update_instance_cpu_mapping(
-            pecan.request.context, db_mapping)
+        context = pecan.request.context
+        updated_mapping, operation = \
+            pecan.request.agent_api.update_instance_cpu_mapping(
+                context, db_mapping, if_match=if_match)
 
-        return InstanceCPUMapping.convert_with_links(updated_mapping)
+        return self._wait_and_convert(context, updated_mapping, operation,
+                                      wait)
 
     @policy.authorize_wsgi("kongming:instance_cpu_mapping", "delete")
     @expose.expose(None, types.uuid, status_code=http_client.NO_CONTENT)
@@ -0,0 +1,118 @@
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import datetime
+
+import pecan
+from pecan import rest
+import wsme
+from wsme import types as wtypes
+
+from oslo_log import log
+
+from kongming.api.controllers import base
+from kongming.api.controllers import link
+from kongming.api.controllers.v1 import types
+from kongming.api.controllers.v1 import utils as api_utils
+from kongming.api import expose
+from kongming.common import policy
+from kongming import objects
+
+
+LOG = log.getLogger(__name__)
+
+
+class MappingOperation(base.APIBase):
+    """API representation of a mapping operation.
+
+    An operation tracks the asynchronous application of an instance cpu
+    mapping by the conductor and the agent of the instance host.
+    """
+
+    uuid = types.uuid
+    """The UUID of the operation"""
+
+    instance_uuid = types.uuid
+    """The UUID of the instance of the applied mapping"""
+
+    project_id = types.uuid
+    """The project UUID of the mapping"""
+
+    user_id = types.uuid
+    """The user UUID of the mapping"""
+
+    action = wtypes.text
+    """The action of the operation: create, update or sync"""
+
+    status = wtypes.text
+    """The status of the operation: queued, running, succeeded, failed or
+    superseded by a newer mapping of the instance"""
+
+    cpu_mappings = wtypes.text
+    """The cpu mappings being applied"""
+
+    error = wtypes.text
+    """The reason of the failure of a failed operation"""
+
+    started_at = datetime.datetime
+    """The time in UTC at which the operation started"""
+
+    finished_at = datetime.datetime
+    """The time in UTC at which the operation finished"""
+
+    links = wsme.wsattr([link.Link], readonly=True)
+    """A list containing a self link"""
+
+    def __init__(self, **kwargs):
+        self.fields = []
+        for field in objects.MappingOperation.fields:
+            # Skip fields we do not expose.
+            if not hasattr(self, field):
+                continue
+            self.fields.append(field)
+            setattr(self, field, kwargs.get(field, wtypes.Unset))
+
+    @classmethod
+    def convert_with_links(cls, obj_operation):
+        api_operation = cls(**obj_operation.as_dict())
+        url = pecan.request.public_url
+        api_operation.links = [
+            link.Link.make_link(
+                'self', url, 'mapping_operations', api_operation.uuid),
+            link.Link.make_link(
+                'bookmark', url, 'mapping_operations', api_operation.uuid,
+                bookmark=True)
+            ]
+        return api_operation
+
+
+class MappingOperationsController(rest.RestController):
+    """REST controller for MappingOperation."""
+
+    def _get_resource(self, uuid, *args, **kwargs):
+        return objects.MappingOperation.get(pecan.request.context, uuid)
+
+    @policy.authorize_wsgi("kongming:mapping_operation", "get")
+    @expose.expose(MappingOperation, types.uuid, int)
+    def get_one(self, uuid, wait=None):
+        """Retrieve information about the given operation.
+
+        :param uuid: UUID of an operation.
+        :param wait: number of seconds to wait for the operation to finish
+                     before answering, capped to [api]max_wait.
+        """
+        context = pecan.request.context
+        operation = objects.MappingOperation.get(context, uuid)
+        operation = api_utils.wait_for_operation(context, operation, wait)
+        return MappingOperation.convert_with_links(operation)
@@ -13,11 +13,125 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import time
+
 import jsonpatch
+import pecan
+import six
 import wsme
 
 
+from kongming.common import cpuset
+from kongming.common import exception
 from kongming.common.i18n import _
+from kongming.common import placement
+from kongming import objects
+
+# Bounds of the interval between two checks of a waited operation.
+_WAIT_INTERVAL = 0.1
+_MAX_WAIT_INTERVAL = 1.0
+
+
+def validate_limit(limit):
+    """Return the page size to use, capped to [api]max_limit."""
+    if limit is None:
+        return pecan.request.cfg.api.max_limit
+
+    if limit <= 0:
+        raise wsme.exc.ClientSideError(_("Limit must be positive"))
+
+    return min(pecan.request.cfg.api.max_limit, limit)
+
+
+def get_if_match_version():
+    """Return the version required by the If-Match header of the request.
+
+    The ETag of a versioned resource is its quoted version, e.g. '"3"'.
+
+    :returns: the version, None without If-Match or with "If-Match: *".
+    :raises: BadRequest if the header does not hold a single ETag.
+    """
+    header = (pecan.request.headers.get('If-Match') or '').strip()
+    if not header or header == '*':
+        return None
+    if len(header) < 3 or header[0] != '"' or header[-1] != '"':
+        raise exception.BadRequest(
+            reason='If-Match must hold a single ETag, got %s' % header)
+    try:
+        return int(header[1:-1])
+    except ValueError:
+        # Not an ETag of ours, it can not match.
+        raise exception.PreconditionFailed(
+            reason='ETag %s does not match' % header)
+
+
+def set_etag(version):
+    """Set the ETag of the response to a resource version."""
+    pecan.response.headers['ETag'] = '"%s"' % version
+
+
+def validate_sort_key(sort_key, allowed_keys):
+    if sort_key not in allowed_keys:
+        raise wsme.exc.ClientSideError(
+            _("Invalid sort key: %(key)s. Acceptable values are "
+              "'%(keys)s'") % {'key': sort_key,
+                               'keys': "', '".join(allowed_keys)})
+    return sort_key
+
+
+def validate_sort_dir(sort_dir):
+    if sort_dir not in ['asc', 'desc']:
+        raise wsme.exc.ClientSideError(_("Invalid sort direction: %s. "
+                                         "Acceptable values are "
+                                         "'asc' or 'desc'") % sort_dir)
+    return sort_dir
+
+
+def wait_for_operations(context, operations, wait):
+    """Wait for mapping operations to finish.
+
+    The operations are polled with an exponential backoff until they all
+    finish or the wait time, capped to [api]max_wait, expires.
+
+    :param operations: the MappingOperation objects to wait for.
+    :param wait: number of seconds to wait, None or 0 to return at once.
+    :returns: the last state of the operations.
+    """
+    if wait is None:
+        return operations
+    if wait < 0:
+        raise wsme.exc.ClientSideError(_("Wait must not be negative"))
+
+    operations = list(operations)
+    deadline = time.time() + min(wait, pecan.request.cfg.api.max_wait)
+    interval = _WAIT_INTERVAL
+    while not all(operation.finished for operation in operations):
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            break
+        time.sleep(min(interval, remaining))
+        interval = min(interval * 2, _MAX_WAIT_INTERVAL)
+        operations = [
+            operation if operation.finished else
+            objects.MappingOperation.get(context, operation.uuid)
+            for operation in operations]
+    return operations
+
+
+def wait_for_operation(context, operation, wait):
+    """Wait for a mapping operation to finish, see wait_for_operations."""
+    return wait_for_operations(context, [operation], wait)[0]
+
+
+def validate_batch_size(items):
+    """Check the number of items of a batch request."""
+    if not items:
+        raise wsme.exc.ClientSideError(_("The batch is empty"))
+    max_batch_size = pecan.request.cfg.api.max_batch_size
+    if len(items) > max_batch_size:
+        raise wsme.exc.ClientSideError(
+            _("The batch has %(size)d items, more than the maximum of "
+              "%(max)d") % {'size': len(items), 'max': max_batch_size})
 
 
 JSONPATCH_EXCEPTIONS = (jsonpatch.JsonPatchException,
@@ -33,3 +147,24 @@ def apply_jsonpatch(doc, patch):
                         ' the resource is not allowed')
                 raise wsme.exc.ClientSideError(msg % p['path'])
     return jsonpatch.apply_patch(doc, jsonpatch.JsonPatch(patch))
+
+
+def normalize_cpu_mappings(cpu_mappings):
+    """Validate the cpu_mappings of a request and return its string form.
+
+    :param cpu_mappings: either a pinning spec string, e.g. "0:4;1:5;8-15",
+                         "auto" or "auto:<policy>" for automatic placement,
+                         or a dict mapping vCPU ids to cpuset strings, the
+                         "*" key being used for every other vCPU.
+    :raises: InvalidCPUSet if the mappings can not be parsed.
+    """
+    if isinstance(cpu_mappings, dict):
+        return cpuset.format_vcpu_pinning(cpu_mappings)
+    if not isinstance(cpu_mappings, six.string_types):
+        raise exception.InvalidCPUSet(spec=cpu_mappings,
+                                      reason='not a string or a dict')
+    policy = placement.get_auto_policy(cpu_mappings)
+    if policy:
+        return '%s:%s' % (placement.AUTO, policy)
+    cpuset.parse_vcpu_pinning(cpu_mappings)
+    return cpu_mappings
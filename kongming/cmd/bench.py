@@ -0,0 +1,354 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Scale benchmark of the KongMing services.
+
+The API application, a conductor and a number of agents using the fake
+hypervisor driver run in a single process. They are connected by the fake
+oslo.messaging transport and share a file backed SQLite database, the
+compute API is replaced by an in-memory one knowing the simulated
+instances. The results are printed as JSON so that releases can be
+compared.
+"""
+
+import json
+import os
+import sys
+import tempfile
+import time
+
+from eventlet import greenpool
+from eventlet import greenthread
+from oslo_config import cfg
+from oslo_context import context as oslo_context
+from oslo_db.sqlalchemy import enginefacade
+from oslo_log import log
+import oslo_messaging as messaging
+from pecan import hooks
+from sqlalchemy import event
+import webob
+
+from kongming.agent import api as agent_api
+from kongming.agent import manager as agent_manager
+from kongming.api import app
+from kongming.common import config
+from kongming.common import constants
+from kongming.common import exception
+from kongming.common.i18n import _
+from kongming.common import rpc
+from kongming.common import states
+from kongming.conductor import manager as conductor_manager
+from kongming.conf import CONF
+from kongming.db import migration
+from kongming import objects
+from kongming.objects import base as objects_base
+from kongming.virt import fake
+
+
+LOG = log.getLogger(__name__)
+
+# Seconds between two polls of the operation of a created mapping.
+_POLL_INTERVAL = 0.01
+
+bench_opts = [
+    cfg.IntOpt('hosts',
+               default=10,
+               min=1,
+               help=_('Number of simulated hosts, one agent per host.')),
+    cfg.IntOpt('instances-per-host',
+               default=20,
+               min=1,
+               help=_('Number of simulated instances per host.')),
+    cfg.IntOpt('mappings',
+               default=100,
+               min=0,
+               help=_('Number of instance cpu mappings to create through '
+                      'the API.')),
+    cfg.StrOpt('cpu-mappings',
+               default='auto',
+               help=_('cpu_mappings of the created mappings.')),
+    cfg.IntOpt('concurrency',
+               default=10,
+               min=1,
+               help=_('Number of concurrent API requests and agent syncs.')),
+    cfg.IntOpt('syncs',
+               default=3,
+               min=1,
+               help=_('Number of periodic sync rounds of all the agents.')),
+    cfg.IntOpt('apply-timeout',
+               default=60,
+               min=1,
+               help=_('Number of seconds to wait for a created mapping to '
+                      'be applied by the conductor and the agent.')),
+    cfg.StrOpt('db-file',
+               help=_('SQLite database file, a temporary file is used by '
+                      'default.')),
+    cfg.StrOpt('output',
+               help=_('File to write the JSON results to, defaults to the '
+                      'standard output.')),
+]
+
+
+class FakeComputeAPI(object):
+    """Compute API returning the instances simulated by the fake driver."""
+
+    def __init__(self, hostnames, instances_per_host):
+        self.servers = {}
+        for hostname in hostnames:
+            for index in range(instances_per_host):
+                instance_uuid = fake.get_instance_uuid(hostname, index)
+                self.servers[instance_uuid] = {
+                    'id': instance_uuid,
+                    'OS-EXT-STS:vm_state': 'active',
+                    'OS-EXT-SRV-ATTR:host': hostname}
+
+    def get_instance(self, context, instance_uuid):
+        try:
+            return dict(self.servers[instance_uuid])
+        except KeyError:
+            raise exception.InstanceNotFound(reason=instance_uuid)
+
+
+class FakeComputeHook(hooks.PecanHook):
+    """Attach an agent_api object using the fake compute API."""
+
+    def __init__(self, compute_api):
+        self.agent_api = agent_api.API(compute_api=compute_api)
+
+    def before(self, state):
+        state.request.agent_api = self.agent_api
+
+
+class WriteCounter(object):
+    """Count the rows written by the INSERT, UPDATE and DELETE of an engine.
+
+    An executemany() of a bulk insert or update counts one write per row.
+    """
+
+    def __init__(self, engine):
+        self.count = 0
+        event.listen(engine, 'after_cursor_execute', self._count)
+
+    def _count(self, conn, cursor, statement, parameters, context,
+               executemany):
+        if statement.lstrip()[:6].upper() not in ('INSERT', 'UPDATE',
+                                                  'DELETE'):
+            return
+        rowcount = cursor.rowcount
+        if rowcount is None or rowcount < 0:
+            # The driver does not tell the rows of an executemany().
+            rowcount = len(parameters) if executemany else 1
+        self.count += rowcount
+
+
+def _percentiles(samples):
+    """Return the latency summary of a list of durations, in ms."""
+    if not samples:
+        return {}
+    samples = sorted(samples)
+
+    def percentile(p):
+        index = min(len(samples) - 1, int(round(p / 100.0 * len(samples))))
+        return round(samples[index] * 1000, 3)
+
+    return {'count': len(samples),
+            'mean': round(sum(samples) / len(samples) * 1000, 3),
+            'p50': percentile(50),
+            'p90': percentile(90),
+            'p99': percentile(99),
+            'max': round(samples[-1] * 1000, 3)}
+
+
+def _start_server(topic, server, manager):
+    target = messaging.Target(topic=topic, server=server)
+    rpcserver = rpc.get_server(target, [manager],
+                               objects_base.KongmingObjectSerializer())
+    rpcserver.start()
+    return rpcserver
+
+
+def _start_agents(hostnames):
+    agents = []
+    for hostname in hostnames:
+        # The fake driver reads its host name when it is loaded.
+        CONF.set_override('hostname', hostname, group='fake_driver')
+        agent = agent_manager.AgentManager(constants.AGENT_TOPIC, hostname)
+        agent.init_host()
+        _start_server(constants.AGENT_TOPIC, hostname, agent)
+        agents.append(agent)
+    return agents
+
+
+def _sync_round(agents, concurrency, writes):
+    """Run a periodic sync of every agent and measure it."""
+    context = oslo_context.get_admin_context()
+    pool = greenpool.GreenPool(concurrency)
+    writes_before = writes.count
+    start = time.time()
+    for agent in agents:
+        pool.spawn_n(agent._update_resources, context)
+    pool.waitall()
+    elapsed = time.time() - start
+    return {'seconds': round(elapsed, 3),
+            'hosts_per_second': round(len(agents) / elapsed, 1),
+            'db_writes': writes.count - writes_before,
+            'db_writes_per_host': round(
+                float(writes.count - writes_before) / len(agents), 2)}
+
+
+def _wait_for_operation(context, operation_uuid, timeout):
+    """Poll a mapping operation until it finishes or the timeout expires.
+
+    :returns: the last state of the operation.
+    """
+    deadline = time.time() + timeout
+    while True:
+        operation = objects.MappingOperation.get(context, operation_uuid)
+        if operation.finished or time.time() >= deadline:
+            return operation
+        greenthread.sleep(_POLL_INTERVAL)
+
+
+def _create_mappings(api, instance_uuids, cpu_mappings, concurrency,
+                     apply_timeout):
+    """Create a mapping per instance through the API and time them.
+
+    The API answers once the mapping is queued, the operation of every
+    mapping is then polled until the agent has applied it, so that the
+    end-to-end latency is measured and the DB writes of the whole
+    application are done when the call returns.
+    """
+    context = oslo_context.get_admin_context()
+    headers = {'X-Roles': 'admin',
+               'X-User-Id': 'bench',
+               'X-Project-Id': 'bench'}
+    latencies = []
+    apply_latencies = []
+    errors = []
+    failed = []
+    timeouts = []
+
+    def create(instance_uuid):
+        request = webob.Request.blank(
+            '/v1/instance_cpu_mappings', method='POST', headers=headers,
+            content_type='application/json',
+            body=json.dumps({'instance_uuid': instance_uuid,
+                             'cpu_mappings': cpu_mappings}).encode('utf-8'))
+        start = time.time()
+        response = request.get_response(api)
+        latencies.append(time.time() - start)
+        if response.status_int >= 400:
+            errors.append(response.status_int)
+            return
+
+        # The Location header points to the operation of the mapping.
+        operation = _wait_for_operation(
+            context, response.location.rstrip('/').rsplit('/', 1)[-1],
+            apply_timeout)
+        if not operation.finished:
+            timeouts.append(instance_uuid)
+            return
+        apply_latencies.append(time.time() - start)
+        if operation.status != states.SUCCEEDED:
+            failed.append(instance_uuid)
+
+    pool = greenpool.GreenPool(concurrency)
+    start = time.time()
+    for instance_uuid in instance_uuids:
+        pool.spawn_n(create, instance_uuid)
+    pool.waitall()
+    elapsed = time.time() - start
+
+    result = _percentiles(latencies)
+    result['errors'] = len(errors)
+    result['apply'] = _percentiles(apply_latencies)
+    result['apply']['failed'] = len(failed)
+    result['apply']['timeouts'] = len(timeouts)
+    if elapsed:
+        result['requests_per_second'] = round(len(latencies) / elapsed, 1)
+        result['applied_per_second'] = round(
+            len(apply_latencies) / elapsed, 1)
+    return result
+
+
+def _setup(argv):
+    """Parse the options and wire the services to fake backends."""
+    CONF.register_cli_opts(bench_opts, group='bench')
+    log.register_options(CONF)
+    config.parse_args(argv)
+    log.setup(CONF, 'kongming')
+    objects.register_all()
+
+    # Replace the configured transport by the in-process one.
+    rpc.cleanup()
+    CONF.set_override('transport_url', 'fake://')
+    rpc.init(CONF)
+
+    db_file = CONF.bench.db_file
+    if not db_file:
+        fd, db_file = tempfile.mkstemp(prefix='kongming-bench-',
+                                       suffix='.sqlite')
+        os.close(fd)
+        os.unlink(db_file)
+    CONF.set_override('connection', 'sqlite:///%s' % db_file,
+                      group='database')
+    migration.create_schema()
+
+    CONF.set_override('driver', 'fake.FakeDriver', group='agent')
+    # Every sync round must walk all the instances.
+    CONF.set_override('enable_libvirt_events', False, group='agent')
+    CONF.set_override('instances', CONF.bench.instances_per_host,
+                      group='fake_driver')
+    return db_file
+
+
+def main():
+    db_file = _setup(sys.argv)
+    bench = CONF.bench
+
+    writes = WriteCounter(enginefacade.writer.get_engine())
+
+    hostnames = ['bench-host-%05d' % index for index in range(bench.hosts)]
+    conductor = conductor_manager.ConductorManager(
+        constants.CONDUCTOR_TOPIC, 'bench-conductor')
+    _start_server(constants.CONDUCTOR_TOPIC, 'bench-conductor', conductor)
+    agents = _start_agents(hostnames)
+
+    compute_api = FakeComputeAPI(hostnames, bench.instances_per_host)
+    # Skip the keystone auth_token middleware wrapping the application.
+    api = app.setup_app(extra_hooks=[FakeComputeHook(compute_api)]).app
+
+    syncs = [_sync_round(agents, bench.concurrency, writes)
+             for index in range(bench.syncs)]
+
+    instance_uuids = sorted(compute_api.servers)[:bench.mappings]
+    writes_before = writes.count
+    mappings = _create_mappings(api, instance_uuids, bench.cpu_mappings,
+                                bench.concurrency, bench.apply_timeout)
+    mappings['db_writes'] = writes.count - writes_before
+
+    results = {
+        'config': {'hosts': bench.hosts,
+                   'instances_per_host': bench.instances_per_host,
+                   'mappings': bench.mappings,
+                   'cpu_mappings': bench.cpu_mappings,
+                   'concurrency': bench.concurrency,
+                   'database': db_file},
+        'sync': syncs,
+        'mapping_create': mappings,
+    }
+    output = json.dumps(results, indent=2, sort_keys=True)
+    if bench.output:
+        with open(bench.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
@@ -0,0 +1,333 @@
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Host CPU sets backed by an integer bitmask.
+
+A CPU set can be built from the libvirt cpuset syntax, e.g. "0-7,^3,16",
+and converted to the cpumap tuples and bytes used by the libvirt bindings.
+
+CPU sets are stored and sent over RPC as canonical cpuset strings, e.g.
+"0-15,32-47", see encode_cpus() and decode_cpus().
+"""
+
+import threading
+
+import six
+
+from kongming.common import exception
+
+
+_PARSE_CACHE = {}
+_PARSE_CACHE_SIZE = 1024
+_PARSE_CACHE_LOCK = threading.Lock()
+
+
+class CPUSet(object):
+    """An immutable set of host CPU ids."""
+
+    __slots__ = ('_mask',)
+
+    def __init__(self, cpus=None):
+        mask = 0
+        for cpu in cpus or ():
+            mask |= 1 << int(cpu)
+        self._mask = mask
+
+    @classmethod
+    def from_mask(cls, mask):
+        cpuset = cls()
+        cpuset._mask = mask
+        return cpuset
+
+    @classmethod
+    def from_cpumap(cls, cpumap):
+        """Build a CPU set from a libvirt cpumap tuple of booleans."""
+        mask = 0
+        for cpu, pinned in enumerate(cpumap):
+            if pinned:
+                mask |= 1 << cpu
+        return cls.from_mask(mask)
+
+    @classmethod
+    def from_bytes(cls, data):
+        """Build a CPU set from a libvirt cpumap byte string."""
+        mask = 0
+        for index, byte in enumerate(bytearray(data)):
+            mask |= byte << (8 * index)
+        return cls.from_mask(mask)
+
+    @classmethod
+    def parse(cls, spec, max_cpu=None):
+        """Parse a libvirt cpuset string.
+
+        The spec is a comma separated list of CPU ids ("3"), ranges ("0-7")
+        and exclusions ("^3" or "^2-3"). Exclusions are applied after all
+        the inclusions regardless of their position. Parsed specs are
+        memoized per (spec, max_cpu).
+
+        :param spec: the cpuset string.
+        :param max_cpu: number of CPUs of the host, if given every CPU of
+                        the spec must be lower than it.
+        :raises: InvalidCPUSet if the spec can not be parsed.
+        """
+        key = (spec, max_cpu)
+        cpuset = _PARSE_CACHE.get(key)
+        if cpuset is None:
+            cpuset = cls._parse(spec, max_cpu)
+            with _PARSE_CACHE_LOCK:
+                if len(_PARSE_CACHE) >= _PARSE_CACHE_SIZE:
+                    _PARSE_CACHE.clear()
+                _PARSE_CACHE[key] = cpuset
+        return cpuset
+
+    @classmethod
+    def _parse(cls, spec, max_cpu):
+        if not isinstance(spec, six.string_types):
+            raise exception.InvalidCPUSet(spec=spec, reason='not a string')
+
+        include = 0
+        exclude = 0
+        for token in spec.split(','):
+            token = token.strip()
+            excluded = token.startswith('^')
+            if excluded:
+                token = token[1:].strip()
+            if not token:
+                raise exception.InvalidCPUSet(spec=spec,
+                                              reason='empty element')
+
+            start, sep, end = token.partition('-')
+            try:
+                start = int(start)
+                end = int(end) if sep else start
+            except ValueError:
+                raise exception.InvalidCPUSet(
+                    spec=spec, reason='invalid element "%s"' % token)
+            if start < 0 or end < start:
+                raise exception.InvalidCPUSet(
+                    spec=spec, reason='invalid range "%s"' % token)
+            if max_cpu is not None and end >= max_cpu:
+                raise exception.InvalidCPUSet(
+                    spec=spec, reason='CPU %s is out of range, the host has '
+                                      '%s CPUs' % (end, max_cpu))
+
+            bits = ((1 << (end - start + 1)) - 1) << start
+            if excluded:
+                exclude |= bits
+            else:
+                include |= bits
+
+        mask = include & ~exclude
+        if not mask:
+            raise exception.InvalidCPUSet(spec=spec, reason='no CPU selected')
+        return cls.from_mask(mask)
+
+    def to_cpumap(self, max_cpu):
+        """Return the libvirt cpumap tuple of booleans for this set."""
+        mask = self._mask
+        return tuple(bool(mask >> cpu & 1) for cpu in range(max_cpu))
+
+    def to_bytes(self, max_cpu):
+        """Return the libvirt cpumap byte string for this set."""
+        mask = self._mask
+        return bytes(bytearray((mask >> (8 * index)) & 0xff
+                               for index in range((max_cpu + 7) // 8)))
+
+    def to_spec(self):
+        """Return the canonical cpuset string, e.g. "0-3,8"."""
+        ranges = []
+        start = prev = None
+        for cpu in self:
+            if prev is not None and cpu == prev + 1:
+                prev = cpu
+                continue
+            if start is not None:
+                ranges.append((start, prev))
+            start = prev = cpu
+        if start is not None:
+            ranges.append((start, prev))
+        return ','.join(str(first) if first == last else
+                        '%s-%s' % (first, last) for first, last in ranges)
+
+    @property
+    def mask(self):
+        return self._mask
+
+    def issubset(self, other):
+        return self._mask & ~other._mask == 0
+
+    def isdisjoint(self, other):
+        return self._mask & other._mask == 0
+
+    def __or__(self, other):
+        return CPUSet.from_mask(self._mask | other._mask)
+
+    def __and__(self, other):
+        return CPUSet.from_mask(self._mask & other._mask)
+
+    def __sub__(self, other):
+        return CPUSet.from_mask(self._mask & ~other._mask)
+
+    def __iter__(self):
+        mask = self._mask
+        cpu = 0
+        while mask:
+            if mask & 1:
+                yield cpu
+            mask >>= 1
+            cpu += 1
+
+    def __len__(self):
+        return bin(self._mask).count('1')
+
+    def __contains__(self, cpu):
+        return bool(self._mask >> cpu & 1)
+
+    def __bool__(self):
+        return self._mask != 0
+
+    __nonzero__ = __bool__
+
+    def __eq__(self, other):
+        return isinstance(other, CPUSet) and self._mask == other._mask
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self._mask)
+
+    def __str__(self):
+        return self.to_spec()
+
+    def __repr__(self):
+        return 'CPUSet(%r)' % self.to_spec()
+
+
+def decode_cpus(value):
+    """Build a CPU set from its stored or wire form.
+
+    The canonical form is a cpuset string, the empty string being the empty
+    set. Older releases stored and sent a cpumap list of booleans or a list
+    of CPU ids, both are decoded as well.
+
+    :raises: InvalidCPUSet if a string can not be parsed.
+    """
+    if isinstance(value, CPUSet):
+        return value
+    if isinstance(value, six.string_types):
+        return CPUSet.parse(value) if value.strip() else CPUSet()
+    value = list(value or ())
+    if value and all(isinstance(cpu, bool) for cpu in value):
+        return CPUSet.from_cpumap(value)
+    return CPUSet(value)
+
+
+def encode_cpus(value):
+    """Return the canonical cpuset string of a CPU set in any form."""
+    return decode_cpus(value).to_spec()
+
+
+def encode_vcpu_cpus(cpu_mappings):
+    """Return the canonical form of the vCPU pinning of an instance.
+
+    :param cpu_mappings: a dict mapping vCPU ids to their host CPUs, in any
+                         form accepted by decode_cpus().
+    :returns: a dict mapping vCPU id strings to cpuset strings.
+    """
+    return dict((str(vcpu), encode_cpus(cpus))
+                for vcpu, cpus in (cpu_mappings or {}).items())
+
+
+def decode_vcpu_cpumaps(cpu_mappings):
+    """Return the vCPU pinning of an instance as cpumap lists.
+
+    This is the form used by older releases, a list of booleans per vCPU.
+    The host size is unknown, so the lists stop at the highest pinned CPU.
+
+    :param cpu_mappings: a dict mapping vCPU ids to their host CPUs, in any
+                         form accepted by decode_cpus().
+    """
+    vcpu_cpus = dict((str(vcpu), decode_cpus(cpus))
+                     for vcpu, cpus in (cpu_mappings or {}).items())
+    max_cpu = max([max(cpus) + 1 for cpus in vcpu_cpus.values() if cpus] or
+                  [0])
+    return dict((vcpu, list(cpus.to_cpumap(max_cpu)))
+                for vcpu, cpus in vcpu_cpus.items())
+
+
+def parse_vcpu_pinning(spec, max_cpu=None):
+    """Parse a per-vCPU pinning spec.
+
+    The spec is a ';' separated list of "<vcpu>:<cpuset>" entries pinning a
+    single vCPU, plus at most one bare "<cpuset>" entry applied to every
+    vCPU not listed explicitly, e.g. "0:4;1:5;8-15". A plain cpuset such as
+    "0-3,^2" therefore keeps pinning every vCPU to the same host CPUs.
+
+    :param spec: the pinning spec.
+    :param max_cpu: number of CPUs of the host.
+    :returns: a dict mapping vCPU ids to CPUSet, the None key holds the
+              CPU set of the vCPUs not listed explicitly.
+    :raises: InvalidCPUSet if the spec can not be parsed.
+    """
+    if not isinstance(spec, six.string_types):
+        raise exception.InvalidCPUSet(spec=spec, reason='not a string')
+
+    pinning = {}
+    for entry in spec.split(';'):
+        vcpu, sep, cpus = entry.partition(':')
+        if sep:
+            try:
+                vcpu = int(vcpu)
+            except ValueError:
+                raise exception.InvalidCPUSet(
+                    spec=spec, reason='invalid vCPU "%s"' % vcpu.strip())
+            if vcpu < 0:
+                raise exception.InvalidCPUSet(
+                    spec=spec, reason='invalid vCPU "%s"' % vcpu)
+        else:
+            vcpu, cpus = None, entry
+        if vcpu in pinning:
+            raise exception.InvalidCPUSet(
+                spec=spec, reason='vCPU "%s" is pinned more than once' %
+                                  ('*' if vcpu is None else vcpu))
+        pinning[vcpu] = CPUSet.parse(cpus.strip(), max_cpu)
+    return pinning
+
+
+def format_vcpu_pinning(pinning):
+    """Build a per-vCPU pinning spec from a dict.
+
+    :param pinning: a dict mapping vCPU ids to cpuset strings or CPUSet,
+                    the None key (or "*") is used for every other vCPU.
+    :returns: the canonical pinning spec, e.g. "0:4;1:5;8-15".
+    """
+    default = None
+    entries = []
+    for vcpu, cpus in pinning.items():
+        if not isinstance(cpus, CPUSet):
+            cpus = CPUSet.parse(cpus)
+        if vcpu is None or vcpu == '*':
+            default = cpus
+            continue
+        try:
+            entries.append((int(vcpu), cpus))
+        except ValueError:
+            raise exception.InvalidCPUSet(
+                spec=pinning, reason='invalid vCPU "%s"' % vcpu)
+    spec = ['%s:%s' % (vcpu, cpus.to_spec())
+            for vcpu, cpus in sorted(entries, key=lambda entry: entry[0])]
+    if default is not None:
+        spec.append(default.to_spec())
+    return ';'.join(spec)
@@ -119,6 +119,15 @@ class InvalidParameterValue(Invalid):
     _msg_fmt = _("%(err)s")
 
 
+class InvalidCPUSet(Invalid):
+    _msg_fmt = _("Invalid CPU set '%(spec)s': %(reason)s.")
+
+
+class InvalidPlacementPolicy(Invalid):
+    _msg_fmt = _("Invalid placement policy '%(policy)s', supported policies "
+                 "are: %(policies)s.")
+
+
 class PatchError(Invalid):
     _msg_fmt = _("Couldn't apply patch '%(patch)s'. Reason: %(reason)s")
 
@@ -142,6 +151,10 @@ class InstanceCPUMappingNotFound(NotFound):
                  "not be found.")
 
 
+class MappingOperationNotFound(NotFound):
+    _msg_fmt = _("Mapping operation %(uuid)s could not be found.")
+
+
 class DeployableNotFound(NotFound):
     _msg_fmt = _("Deployable %(uuid)s could not be found.")
 
@@ -151,6 +164,26 @@ class Conflict(KongMingException):
     code = http_client.CONFLICT
 
 
+class InstanceCPUMappingConflict(Conflict):
+    _msg_fmt = _("Instance CPU mappings of instances %(uuid)s and "
+                 "%(other)s both pin host CPUs %(cpus)s on host %(host)s.")
+
+
+class ConcurrentUpdate(Conflict):
+    _msg_fmt = _("%(resource)s %(id)s has been updated concurrently, its "
+                 "version is %(version)s instead of %(expected)s.")
+
+
+class CPUClaimConflict(Conflict):
+    _msg_fmt = _("Host CPUs of host %(host)s placed for instance %(uuid)s "
+                 "have been claimed concurrently by another instance.")
+
+
+class PreconditionFailed(KongMingException):
+    _msg_fmt = _("Precondition failed: %(reason)s.")
+    code = http_client.PRECONDITION_FAILED
+
+
 class DuplicateAcceleratorName(Conflict):
     _msg_fmt = _("An accelerator with name %(name)s already exists.")
 
@@ -181,6 +214,11 @@ class ObjectActionError(KongMingException):
     _msg_fmt = _('Object action %(action)s failed because: %(reason)s')
 
 
+class CPUPlacementFailed(KongMingException):
+    _msg_fmt = _("Unable to place %(vcpus)s vCPUs with policy %(policy)s, "
+                 "free host CPUs: %(free)s.")
+
+
 class InvalidInstanceStatus(KongMingException):
     _msg_fmt = _('Mapping creation failed for instance: %(instance)s, '
                  'the instance should be in ACTIVE status.')
@@ -191,6 +229,11 @@ class NovaConnectionFailed(Invalid):
                  '%(reason)s.')
 
 
+class InvalidAPIVersionProvided(KongMingException):
+    _msg_fmt = _("The API version provided for %(service)s should be "
+                 "between %(min_version)s and %(max_version)s.")
+
+
 class NotAuthorized(NotAuthorized):
     msg_fmt = _("Forbidden.")
     code = 403
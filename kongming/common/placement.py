@@ -0,0 +1,199 @@
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Automatic host CPU placement for "auto" instance CPU mappings.
+
+The policies are:
+
+- pack: prefer the NUMA cell with the fewest free CPUs that fits the
+  instance and fill partially used cores first, to limit fragmentation.
+- spread: prefer the NUMA cell with the most free CPUs and use one thread
+  per core before using hyperthread siblings.
+- isolate: give every vCPU a whole free core, its hyperthread siblings are
+  part of the vCPU pinning so that nothing else is placed on them.
+
+A single NUMA cell is always preferred, the instance is only spread over
+several cells when no cell can hold it. Within a cell, the CPUs sharing a
+last level cache are preferred so that the instance does not straddle L3
+cache (CCX) boundaries when it fits in one of them.
+"""
+
+import six
+
+from kongming.common import cpuset
+from kongming.common import exception
+from kongming.common import topology
+
+
+AUTO = 'auto'
+PACK = 'pack'
+SPREAD = 'spread'
+ISOLATE = 'isolate'
+POLICIES = (PACK, SPREAD, ISOLATE)
+DEFAULT_POLICY = PACK
+
+
+def get_auto_policy(cpu_mappings):
+    """Return the placement policy of an automatic mapping.
+
+    :param cpu_mappings: the cpu_mappings of a mapping, "auto" or
+                         "auto:<policy>" for automatic placement.
+    :returns: the policy name, or None if the mapping is not automatic.
+    :raises: InvalidPlacementPolicy if the policy is unknown.
+    """
+    if not isinstance(cpu_mappings, six.string_types):
+        return None
+    name, sep, policy = cpu_mappings.partition(':')
+    if name.strip() != AUTO:
+        return None
+    policy = policy.strip() or DEFAULT_POLICY
+    if policy not in POLICIES:
+        raise exception.InvalidPlacementPolicy(policy=policy,
+                                               policies=', '.join(POLICIES))
+    return policy
+
+
+def get_used_cpus(instances, host_cpus, exclude_uuid=None):
+    """Return the CPUSet of host CPUs pinned by instances.
+
+    vCPUs allowed to run on every host CPU are floating and do not use
+    any CPU.
+
+    :param instances: Instance objects or dicts of the host.
+    :param host_cpus: CPUSet of all the host CPUs.
+    :param exclude_uuid: uuid of an instance to ignore.
+    """
+    used = cpuset.CPUSet()
+    for instance in instances:
+        if instance['uuid'] == exclude_uuid:
+            continue
+        for cpus in (instance['cpu_mappings'] or {}).values():
+            pinned = cpuset.decode_cpus(cpus)
+            if not host_cpus.issubset(pinned):
+                used = used | pinned
+    return used
+
+
+def get_cell_usage(cpu_topology, used_cpus):
+    """Return the CPU usage of every NUMA cell of a host.
+
+    :param cpu_topology: the cpu_topology of the host.
+    :param used_cpus: CPUSet of the host CPUs already pinned.
+    :returns: a dict mapping NUMA cell ids to a dict with the "total",
+              "pinned" and "free" number of CPUs of the cell.
+    """
+    usage = {}
+    for cell_id, cell_cpus in topology.get_cells(cpu_topology).items():
+        pinned = len(cell_cpus & used_cpus)
+        usage[cell_id] = {'total': len(cell_cpus),
+                          'pinned': pinned,
+                          'free': len(cell_cpus) - pinned}
+    return usage
+
+
+def _pick(cores, free, vcpus, policy):
+    """Pick the CPUs of vcpus vCPUs from the free threads of cores.
+
+    :returns: a list with the CPUSet of every vCPU, or None if the cores
+              can not hold the vCPUs.
+    """
+    cores = [(core, core & free) for core in cores]
+    cores = [(core, available) for core, available in cores if available]
+
+    if policy == ISOLATE:
+        whole = [core for core, available in cores if core == available]
+        if len(whole) < vcpus:
+            return None
+        return whole[:vcpus]
+
+    if policy == SPREAD:
+        cores.sort(key=lambda core: (-len(core[1]), min(core[1])))
+        rounds = [list(available) for core, available in cores]
+        picked = []
+        while rounds and len(picked) < vcpus:
+            for threads in rounds:
+                picked.append(threads.pop(0))
+            rounds = [threads for threads in rounds if threads]
+    else:
+        cores.sort(key=lambda core: (len(core[1]), min(core[1])))
+        picked = [cpu for core, available in cores for cpu in available]
+
+    if len(picked) < vcpus:
+        return None
+    return [cpuset.CPUSet([cpu]) for cpu in picked[:vcpus]]
+
+
+def _pick_in_cell(cores, caches, free, vcpus, policy):
+    """Pick the CPUs of vcpus vCPUs in a NUMA cell.
+
+    The free CPUs of a single last level cache are tried first, starting
+    with the fullest one for pack and isolate and the emptiest one for
+    spread, then the free CPUs of the whole cell. With spread a cache is
+    only used if it can give every vCPU a core of its own.
+    """
+    domains = [free & cache for cache in caches]
+    domains = [domain for domain in domains if domain and domain != free]
+    if policy == SPREAD:
+        domains = [domain for domain in domains
+                   if len([core for core in cores if core & domain]) >=
+                   vcpus]
+    domains.sort(key=lambda domain: (len(domain), min(domain)),
+                 reverse=policy == SPREAD)
+    for domain in domains:
+        picked = _pick(cores, domain, vcpus, policy)
+        if picked:
+            return picked
+    return _pick(cores, free, vcpus, policy)
+
+
+def solve(cpu_topology, used_cpus, vcpus, policy=DEFAULT_POLICY):
+    """Compute the host CPUs of an instance.
+
+    :param cpu_topology: the cpu_topology of the host.
+    :param used_cpus: CPUSet of the host CPUs already pinned.
+    :param vcpus: number of vCPUs of the instance.
+    :param policy: one of POLICIES.
+    :returns: a per-vCPU pinning spec, e.g. "0:4;1:5".
+    :raises: CPUPlacementFailed if the host can not hold the instance.
+    """
+    cells = topology.get_cells(cpu_topology)
+    cores = topology.get_cores(cpu_topology)
+    caches = topology.get_cache_groups(cpu_topology)
+
+    candidates = []
+    for cell_id, cell_cpus in cells.items():
+        free = cell_cpus - used_cpus
+        picked = _pick_in_cell(cores[cell_id], caches, free, vcpus, policy)
+        if picked:
+            candidates.append((len(free), cell_id, picked))
+
+    if candidates:
+        if policy == SPREAD:
+            candidates.sort(key=lambda c: (-c[0], c[1]))
+        else:
+            candidates.sort(key=lambda c: (c[0], c[1]))
+        picked = candidates[0][2]
+    else:
+        host_cpus = cpuset.CPUSet()
+        for cell_cpus in cells.values():
+            host_cpus = host_cpus | cell_cpus
+        all_cores = [core for cell_cores in cores.values()
+                     for core in cell_cores]
+        picked = _pick(all_cores, host_cpus - used_cpus, vcpus, policy)
+        if not picked:
+            raise exception.CPUPlacementFailed(
+                vcpus=vcpus, policy=policy,
+                free=(host_cpus - used_cpus).to_spec() or 'none')
+
+    return cpuset.format_vcpu_pinning(dict(enumerate(picked)))
@@ -89,6 +89,12 @@ mapping_policies = [
                        description='Update Mapping records'),
 ]
 
+operation_policies = [
+    policy.RuleDefault('kongming:mapping_operation:get',
+                       'rule:default',
+                       description='Retrieve mapping operation records'),
+]
+
 instance_policies = [
     policy.RuleDefault('kongming:instance:get',
                        'rule:default',
@@ -103,7 +109,7 @@ host_policies = [
 
 
 def list_policies():
-    policies = (default_policies + mapping_policies
+    policies = (default_policies + mapping_policies + operation_policies
                 + instance_policies + host_policies)
     return policies
 
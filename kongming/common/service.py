@@ -51,6 +51,7 @@ class RPCService(service.Service):
 
     def start(self):
         super(RPCService, self).start()
+        self.manager.init_host()
         target = messaging.Target(topic=self.topic, server=self.host)
         endpoints = [self.manager]
         serializer = objects_base.KongmingObjectSerializer()
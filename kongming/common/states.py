@@ -22,3 +22,25 @@ LOG = logging.getLogger(__name__)
 
 PENDING = 'pending'
 SUCCEED = 'succeed'
+FAILED = 'failed'
+
+############################
+# Mapping Operation Status #
+############################
+
+QUEUED = 'queued'
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+# FAILED is shared with the mapping status.
+# Not applied by the agent, which applied a newer mapping of the instance.
+SUPERSEDED = 'superseded'
+
+FINISHED_STATES = (SUCCEEDED, FAILED, SUPERSEDED)
+
+#############################
+# Mapping Operation Actions #
+#############################
+
+CREATE = 'create'
+UPDATE = 'update'
+SYNC = 'sync'
@@ -0,0 +1,143 @@
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Host CPU topology model.
+
+The cpu_topology of a host is a dict of the form::
+
+    {
+        "sockets": {
+            "0": {
+                "cells": {
+                    "0": {
+                        "cores": {"0": "0,16", "1": "1,17", ...}
+                    },
+                    ...
+                }
+            },
+            ...
+        },
+        "caches": ["0-3,16-19", ...]
+    }
+
+where every core holds the cpuset string of its hyperthread siblings and
+"caches" lists the groups of CPUs sharing a last level cache (an L3 cache,
+i.e. a CCX on AMD hosts).
+
+Hosts reported by older agents have a flat ``{cell id: [cpu ids]}``
+topology without sockets, cores or caches, every CPU is then considered
+as a core of its own. Older releases also stored the CPUs as lists of CPU
+ids instead of cpuset strings, the helpers accept both forms.
+"""
+
+from kongming.common import cpuset
+
+
+SOCKETS = 'sockets'
+CELLS = 'cells'
+CORES = 'cores'
+CACHES = 'caches'
+
+
+def is_structured(cpu_topology):
+    """Return whether the topology is a structured one."""
+    return bool(cpu_topology) and SOCKETS in cpu_topology
+
+
+def _convert_groups(cpu_topology, convert):
+    """Return a topology with every group of CPUs converted."""
+    if not cpu_topology:
+        return cpu_topology
+    if not is_structured(cpu_topology):
+        return dict((cell_id, convert(cpus))
+                    for cell_id, cpus in cpu_topology.items())
+
+    sockets = {}
+    for socket_id, socket in cpu_topology[SOCKETS].items():
+        cells = {}
+        for cell_id, cell in socket[CELLS].items():
+            cells[cell_id] = dict(cell, **{CORES: dict(
+                (core_id, convert(threads))
+                for core_id, threads in cell[CORES].items())})
+        sockets[socket_id] = dict(socket, **{CELLS: cells})
+    return dict(cpu_topology, **{
+        SOCKETS: sockets,
+        CACHES: [convert(cpus) for cpus in cpu_topology.get(CACHES) or []]})
+
+
+def compact(cpu_topology):
+    """Return a topology with every group of CPUs as a cpuset string."""
+    return _convert_groups(cpu_topology, cpuset.encode_cpus)
+
+
+def expand(cpu_topology):
+    """Return a topology with every group of CPUs as a list of CPU ids.
+
+    This is the form used by the releases before compact().
+    """
+    return _convert_groups(cpu_topology,
+                           lambda cpus: list(cpuset.decode_cpus(cpus)))
+
+
+def _iter_cells(cpu_topology):
+    """Yield (socket id, cell id, cell dict) of a structured topology."""
+    for socket_id, socket in sorted(cpu_topology[SOCKETS].items()):
+        for cell_id, cell in sorted(socket[CELLS].items()):
+            yield socket_id, cell_id, cell
+
+
+def get_cores(cpu_topology):
+    """Return a dict mapping NUMA cell ids to the cores of the cell.
+
+    Every core is the CPUSet of its hyperthread siblings. Without sibling
+    information every CPU is considered as a core of its own.
+    """
+    if not is_structured(cpu_topology):
+        return dict((cell_id, [cpuset.CPUSet([cpu])
+                               for cpu in cpuset.decode_cpus(cpus)])
+                    for cell_id, cpus in (cpu_topology or {}).items())
+
+    cores = {}
+    for socket_id, cell_id, cell in _iter_cells(cpu_topology):
+        cores.setdefault(cell_id, []).extend(sorted(
+            (cpuset.decode_cpus(threads)
+             for threads in cell[CORES].values()), key=min))
+    return cores
+
+
+def get_cells(cpu_topology):
+    """Return a dict mapping NUMA cell ids to the CPUSet of the cell."""
+    cells = {}
+    for cell_id, cores in get_cores(cpu_topology).items():
+        cell_cpus = cpuset.CPUSet()
+        for core in cores:
+            cell_cpus = cell_cpus | core
+        cells[cell_id] = cell_cpus
+    return cells
+
+
+def get_cache_groups(cpu_topology):
+    """Return the list of CPUSet sharing a last level cache."""
+    if not is_structured(cpu_topology):
+        return []
+    return [cpuset.decode_cpus(cpus)
+            for cpus in cpu_topology.get(CACHES) or []]
+
+
+def get_host_cpus(cpu_topology):
+    """Return the CPUSet of all the CPUs of the host."""
+    host_cpus = cpuset.CPUSet()
+    for cell_cpus in get_cells(cpu_topology).values():
+        host_cpus = host_cpus | cell_cpus
+    return host_cpus
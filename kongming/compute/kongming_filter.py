@@ -18,8 +18,13 @@ import functools
 import os
 import six
 import sys
+import threading
+import time
 
+from kongming.common import cpuset
+from kongming.common import exception
 from kongming.common.i18n import _ #noqa
+from kongming.common import topology
 
 from nova.scheduler import filters
 from oslo_config import cfg
@@ -43,10 +48,26 @@ client_opts = [
                     'use for communication with OpenStack services.'),
 ]
 
+filter_opts = [
+    cfg.IntOpt('host_snapshot_ttl',
+               default=30,
+               help='Lifetime of the snapshot of the hosts CPU topology and '
+                    'pinned CPUs fetched from KongMing, in seconds. The '
+                    'snapshot is refreshed with a single request once it '
+                    'expires.'),
+    cfg.IntOpt('host_snapshot_retry_interval',
+               default=5,
+               help='Interval between two attempts to refresh the snapshot '
+                    'of the hosts when KongMing can not be reached, in '
+                    'seconds. The previous snapshot, if any, is used '
+                    'meanwhile.'),
+]
+
 GROUP = "kongming_credentials"
 CONF = cfg.CONF
 
 CONF.register_opts(client_opts, group=GROUP)
+CONF.register_opts(filter_opts, group=GROUP)
 
 ka_loading.register_session_conf_options(CONF, GROUP)
 ka_loading.register_auth_conf_options(CONF, GROUP)
@@ -73,14 +94,96 @@ def get_kongmingclient():
     )
 
 
+def _get_requested_cpus(requested_mapping):
+    """Return the CPUSet of the host CPUs used by a cpu mappings spec."""
+    cpus = cpuset.CPUSet()
+    for vcpu_cpus in cpuset.parse_vcpu_pinning(requested_mapping).values():
+        cpus = cpus | vcpu_cpus
+    return cpus
+
+
+class HostSnapshotUnavailable(Exception):
+    """The hosts could not be fetched from KongMing yet."""
+
+
+class HostSnapshot(object):
+    """In-process snapshot of the hosts known by KongMing.
+
+    All the hosts are fetched with one request per page and kept for
+    host_snapshot_ttl seconds, so that filtering does not need any request
+    to KongMing per host.
+    """
+
+    def __init__(self):
+        # None until the hosts have been fetched once.
+        self._hosts = None
+        self._expires_at = 0
+        self._lock = threading.Lock()
+
+    def _refresh(self):
+        interface = CONF.kongming_credentials.os_endpoint_type
+        endpoint_filter = {
+            'service_type': 'resource_pin',
+            'interface': interface.replace('URL', ''),
+            'region_name': CONF.kongming_credentials.os_region_name}
+        hosts = {}
+        url = '/hosts'
+        while url:
+            body = _get_session().get(
+                url, endpoint_filter=endpoint_filter).json()
+            for host in body['hosts']:
+                hosts[host['host_name']] = {
+                    'cpus': topology.get_host_cpus(host.get('cpu_topology')),
+                    'pinned_cpus': cpuset.decode_cpus(
+                        host.get('pinned_cpus'))}
+            # Follow the pages of the collection, the API caps the number
+            # of hosts returned per request.
+            url = None
+            if body.get('next') and body['hosts']:
+                url = '/hosts?' + six.moves.urllib.parse.urlencode(
+                    {'marker': body['hosts'][-1]['host_name']})
+        self._hosts = hosts
+
+    def get(self, host_name):
+        """Return the CPUs and pinned CPUs of a host, None if unknown.
+
+        :raises: HostSnapshotUnavailable if the hosts have never been
+                 fetched successfully.
+        """
+        if time.time() >= self._expires_at:
+            with self._lock:
+                if time.time() >= self._expires_at:
+                    self._try_refresh()
+        if self._hosts is None:
+            raise HostSnapshotUnavailable()
+        return self._hosts.get(host_name)
+
+    def _try_refresh(self):
+        conf = CONF.kongming_credentials
+        try:
+            self._refresh()
+        except Exception:
+            # Do not retry on every host to filter, each attempt may wait
+            # for the whole request timeout.
+            self._expires_at = time.time() + conf.host_snapshot_retry_interval
+            if self._hosts is None:
+                raise
+            LOG.warning("Unable to refresh the hosts from kongming, the "
+                        "previous snapshot is used.", exc_info=True)
+            return
+        self._expires_at = time.time() + conf.host_snapshot_ttl
+
+
 class KongmingFilter(filters.BaseHostFilter):
     """KongMing Filter for nova-scheduler."""
 
     run_filter_once_per_request = True
 
-    def resource_pin_request(self, host_state, spec_obj, requested_mapping):
+    def __init__(self):
+        super(KongmingFilter, self).__init__()
+        self.snapshot = HostSnapshot()
 
-        # 1. store requested mapping in KongMing
+    def _store_mapping(self, spec_obj, requested_mapping):
         client = get_kongmingclient()
         try:
             client.instance_cpu_mappings.create(
@@ -91,15 +194,55 @@ class KongmingFilter(filters.BaseHostFilter):
                 user_id=spec_obj.user_id)
         except Exception:
             LOG.debug("Unable to connect to kongming, PASS.")
+            return False
+        return True
+
+    def filter_all(self, filter_obj_list, spec_obj):
+        """Store the requested mapping once and filter the hosts."""
+        requested_mapping = spec_obj.get_scheduler_hint('resource_pin')
+        if requested_mapping and not self._store_mapping(
+                spec_obj, requested_mapping):
+            return filter_obj_list
+        return super(KongmingFilter, self).filter_all(filter_obj_list,
+                                                      spec_obj)
+
+    def resource_pin_request(self, host_state, spec_obj, requested_mapping):
+        try:
+            host = (self.snapshot.get(host_state.host) or
+                    self.snapshot.get(host_state.nodename))
+        except Exception:
+            LOG.debug("Unable to fetch hosts from kongming, PASS.")
             return True
-        # 2. Perform filtering process
-        # To Do
 
-        return True
+        if host is None:
+            LOG.debug("Host %s is not managed by kongming, it can not "
+                      "satisfy the resource_pin request.", host_state.host)
+            return False
+
+        free_cpus = host['cpus'] - host['pinned_cpus']
+        name, sep, policy = requested_mapping.partition(':')
+        if name.strip() == 'auto':
+            passes = len(free_cpus) >= spec_obj.vcpus
+        else:
+            try:
+                requested_cpus = _get_requested_cpus(requested_mapping)
+            except exception.InvalidCPUSet:
+                LOG.debug("Unable to parse resource_pin request %s, PASS.",
+                          requested_mapping)
+                return True
+            passes = requested_cpus.issubset(free_cpus)
+
+        if not passes:
+            LOG.debug("Host %(host)s can not satisfy the resource_pin "
+                      "request %(request)s, free cpus: %(free)s.",
+                      {'host': host_state.host,
+                       'request': requested_mapping,
+                       'free': sorted(free_cpus)})
+        return passes
 
     def host_passes(self, host_state, spec_obj):
         """
-        Check for hosts' CPU/NUMA ability and store mapping in Kongming.
+        Check for hosts' CPU/NUMA ability to satisfy the requested mapping.
         """
 
         # Find which Pools the user wants to use (if any)
@@ -3,8 +3,11 @@ import functools
 import os
 import six
 import sys
+import threading
+import time
 
 from oslo_config import cfg
+from oslo_log import log as logging
 from oslo_utils import encodeutils
 
 from keystoneauth1 import loading as ka_loading
@@ -15,6 +18,7 @@ from novaclient import exceptions as nova_exceptions
 
 from kongming.common import exception
 
+LOG = logging.getLogger(__name__)
 
 client_opts = [
     cfg.StrOpt('os-region-name',
@@ -36,8 +40,13 @@ ka_loading.register_session_conf_options(CONF, GROUP)
 ka_loading.register_auth_conf_options(CONF, GROUP)
 
 _session = None
+_client = None
+_client_checked_at = 0
+_client_lock = threading.Lock()
+_instance_cache = {}
 
 NOVA_MIN_API_VERSION = '2.1'
+INSTANCE_CACHE_MAX_SIZE = 1024
 
 
 def _get_session():
@@ -49,7 +58,7 @@ def _get_session():
     return _session
 
 
-def get_novaclient():
+def _negotiate_novaclient():
 
     def do_get_client(api_version=2.1):
         session = _get_session()
@@ -72,6 +81,29 @@ def get_novaclient():
     return do_get_client(version)
 
 
+def get_novaclient():
+    """Return the process-wide Nova client.
+
+    The microversion is negotiated with Nova only once every
+    [nova]version_check_interval seconds, the client and its keystone
+    session are shared by all the callers in between.
+    """
+    global _client, _client_checked_at
+    with _client_lock:
+        if (_client is None or time.time() - _client_checked_at >=
+                CONF.nova.version_check_interval):
+            _client = _negotiate_novaclient()
+            _client_checked_at = time.time()
+        return _client
+
+
+def reset_novaclient():
+    """Drop the cached client so that the microversion is negotiated again."""
+    global _client
+    with _client_lock:
+        _client = None
+
+
 def _reraise(desired_exc):
     six.reraise(type(desired_exc), desired_exc, sys.exc_info()[2])
 
@@ -103,7 +135,32 @@ def translate_nova_exception(method):
 
 class API(object):
 
+    def _get_server(self, instance_uuid):
+        try:
+            return get_novaclient().servers.get(instance_uuid).to_dict()
+        except (nova_exceptions.UnsupportedVersion,
+                nova_exceptions.NotAcceptable):
+            LOG.info('Nova rejected the negotiated compute API version, '
+                     'negotiate it again.')
+            reset_novaclient()
+            return get_novaclient().servers.get(instance_uuid).to_dict()
+
     @translate_nova_exception
     def get_instance(self, context, instance_uuid):
-        client = get_novaclient()
-        return client.servers.get(instance_uuid).to_dict()
+        ttl = CONF.nova.instance_cache_ttl
+        now = time.time()
+        cached = _instance_cache.get(instance_uuid)
+        if cached and cached[0] > now:
+            return dict(cached[1])
+
+        server = self._get_server(instance_uuid)
+        if ttl > 0:
+            if len(_instance_cache) >= INSTANCE_CACHE_MAX_SIZE:
+                for uuid, (expires_at, value) in list(
+                        _instance_cache.items()):
+                    if expires_at <= now:
+                        _instance_cache.pop(uuid, None)
+                if len(_instance_cache) >= INSTANCE_CACHE_MAX_SIZE:
+                    _instance_cache.clear()
+            _instance_cache[instance_uuid] = (now + ttl, server)
+        return dict(server)
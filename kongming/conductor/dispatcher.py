@@ -0,0 +1,316 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Background application of instance cpu mappings by the conductor.
+
+The RPC workers of the conductor only queue the mappings to apply. The
+queues are per host and drained by green threads sending the mappings of
+a host to its agent in batches, under a global and a per-agent limit of
+concurrent calls, and recording the results when the agent answers. The
+mappings of an instance are only taken by one drainer at a time, they
+are applied and recorded in the order they are queued.
+"""
+
+import collections
+
+from eventlet import greenthread
+from eventlet import semaphore
+from oslo_context import context as oslo_context
+from oslo_log import log as logging
+import oslo_messaging as messaging
+import six
+
+from kongming.common import cpuset
+from kongming.common import exception
+from kongming.common import placement
+from kongming.common import states
+from kongming.common import topology
+from kongming.conf import CONF
+from kongming import objects
+
+
+LOG = logging.getLogger(__name__)
+
+
+class MappingDispatcher(object):
+    """Queue instance cpu mappings and apply them per host."""
+
+    def __init__(self, agent_rpcapi, host=None):
+        self.agent_rpcapi = agent_rpcapi
+        self.host = host or CONF.host
+        self._queues = collections.defaultdict(collections.deque)
+        # Number of green threads draining the queue of every host.
+        self._drainers = collections.defaultdict(int)
+        # Instances of every host whose mappings are being applied.
+        self._applying = collections.defaultdict(set)
+        # Topology of the hosts, read once per drain of their queue.
+        self._topologies = {}
+        self._semaphore = semaphore.Semaphore(
+            CONF.conductor.max_concurrent_agent_calls)
+
+    def submit(self, context, mapping_obj, operation=None):
+        """Queue a mapping to apply on the host of the mapping.
+
+        :param mapping_obj: the InstanceCPUMapping to apply.
+        :param operation: the MappingOperation tracking the application.
+        """
+        host = mapping_obj.host
+        if not host:
+            self._record(context, mapping_obj, operation,
+                         'The instance of the mapping has no host.')
+            return
+        if operation is not None and operation.conductor != self.host:
+            # The queue is only kept in memory, the conductor recovers the
+            # operations it owns when it restarts.
+            operation.conductor = self.host
+            operation.save(context)
+        self._queues[host].append((context, mapping_obj, operation))
+        if (self._drainers[host] <
+                CONF.conductor.max_concurrent_calls_per_agent):
+            self._drainers[host] += 1
+            greenthread.spawn_n(self._drain, host)
+
+    def pending(self, host=None):
+        """Return the number of queued mappings, of a host or of all."""
+        if host is not None:
+            return len(self._queues.get(host, ()))
+        return sum(len(queue) for queue in self._queues.values())
+
+    def _drain(self, host):
+        queue = self._queues[host]
+        applying = self._applying[host]
+        try:
+            while queue:
+                batch = self._take_batch(queue, applying)
+                if not batch:
+                    # The drainers applying the instances left in the
+                    # queue take them once done.
+                    break
+                try:
+                    with self._semaphore:
+                        self._apply_batch(host, batch)
+                finally:
+                    applying.difference_update(
+                        mapping_obj.instance_uuid
+                        for _c, mapping_obj, _o in batch)
+        finally:
+            self._drainers[host] -= 1
+            if not self._drainers[host]:
+                del self._drainers[host]
+                self._applying.pop(host, None)
+                self._topologies.pop(host, None)
+                if not queue:
+                    self._queues.pop(host, None)
+
+    @staticmethod
+    def _take_batch(queue, applying):
+        """Pop the next batch of mappings from the queue of a host.
+
+        The mappings of the instances being applied by another drainer
+        stay queued, in order.
+
+        :param applying: uuids of the instances being applied, the
+                         instances of the batch are added.
+        """
+        batch = []
+        taken = set()
+        skipped = []
+        while queue and len(batch) < CONF.conductor.max_mappings_per_call:
+            item = queue.popleft()
+            instance_uuid = item[1].instance_uuid
+            if instance_uuid in applying and instance_uuid not in taken:
+                skipped.append(item)
+                continue
+            batch.append(item)
+            taken.add(instance_uuid)
+            applying.add(instance_uuid)
+        queue.extendleft(reversed(skipped))
+        return batch
+
+    def _apply_batch(self, host, batch):
+        """Resolve a batch of mappings and send it to the agent."""
+        to_send = []
+        for context, mapping_obj, operation in batch:
+            try:
+                if operation is not None:
+                    operation.start(context)
+                agent_mapping = self._resolve(context, mapping_obj)
+            except (exception.CPUPlacementFailed, exception.CPUClaimConflict,
+                    exception.NotFound) as e:
+                LOG.error('Instance CPU mapping for instance: %(uuid)s can '
+                          'not be placed: %(error)s',
+                          {'uuid': mapping_obj.instance_uuid, 'error': e})
+                self._record(context, mapping_obj, operation,
+                             six.text_type(e))
+                continue
+            except Exception as e:
+                LOG.exception('Failed to prepare the instance CPU mapping '
+                              'for instance: %s', mapping_obj.instance_uuid)
+                self._record(context, mapping_obj, operation,
+                             six.text_type(e))
+                continue
+            to_send.append((context, mapping_obj, operation, agent_mapping))
+
+        if not to_send:
+            return
+
+        try:
+            results = self.agent_rpcapi.update_instance_cpu_mappings(
+                oslo_context.get_admin_context(), host,
+                [agent_mapping for _c, _m, _o, agent_mapping in to_send])
+        except messaging.MessagingException as e:
+            LOG.error('Instance CPU mappings can not be applied by the '
+                      'agent of host %(host)s: %(error)s',
+                      {'host': host, 'error': e})
+            error = six.text_type(e) or e.__class__.__name__
+            results = dict((mapping_obj.instance_uuid, error)
+                           for _c, mapping_obj, _o, _a in to_send)
+
+        for context, mapping_obj, operation, agent_mapping in to_send:
+            error = results.get(mapping_obj.instance_uuid,
+                                'The agent did not apply the mapping.')
+            self._record(context, mapping_obj, operation, error)
+
+    def _resolve(self, context, mapping_obj):
+        """Return the mapping to send to the agent.
+
+        Automatic mappings are resolved into a per-vCPU pinning from the
+        host topology and the CPUs used by other instances, the stored
+        mapping keeps its "auto" value. The resolved CPUs are claimed in
+        the DB before the mapping is sent, a concurrent placement of the
+        same CPUs by another drainer or conductor fails to claim them and
+        is resolved again.
+        """
+        host = mapping_obj.host
+        policy = placement.get_auto_policy(mapping_obj.cpu_mappings)
+        if not policy:
+            # The CPUs of explicit mappings are read from the mappings.
+            objects.InstanceCPUClaimList.release(
+                context, mapping_obj.instance_uuid)
+            return mapping_obj
+
+        instance = objects.Instance.get(context, mapping_obj.instance_uuid)
+        cpu_topology, host_cpus = self._get_topology(context, host)
+        if cpu_topology is None:
+            raise exception.HostNotFound(host_name=host)
+
+        agent_mapping = mapping_obj.obj_clone()
+        attempts = CONF.conductor.placement_attempts
+        for attempt in range(1, attempts + 1):
+            used_cpus = self._get_used_cpus(
+                context, host, host_cpus, mapping_obj.instance_uuid)
+            agent_mapping.cpu_mappings = placement.solve(
+                cpu_topology, used_cpus, len(instance.cpu_mappings), policy)
+            try:
+                objects.InstanceCPUClaimList.claim(
+                    context, host, mapping_obj.instance_uuid,
+                    agent_mapping.cpu_mappings)
+                break
+            except exception.CPUClaimConflict:
+                if attempt == attempts:
+                    raise
+                LOG.debug('Host CPUs %(mapping)s of host %(host)s have been '
+                          'claimed concurrently, place the instance CPU '
+                          'mapping for instance: %(uuid)s again.',
+                          {'mapping': agent_mapping.cpu_mappings,
+                           'host': host,
+                           'uuid': mapping_obj.instance_uuid})
+
+        LOG.info('Instance CPU mapping for instance: %(uuid)s placed on '
+                 'host cpus %(mapping)s with policy %(policy)s.',
+                 {'uuid': mapping_obj.instance_uuid,
+                  'mapping': agent_mapping.cpu_mappings, 'policy': policy})
+        return agent_mapping
+
+    def _get_topology(self, context, host):
+        """Return the topology and the CPUs of a host.
+
+        The host is read once per drain of its queue.
+        """
+        if host not in self._topologies:
+            try:
+                cpu_topology = objects.Host.get(context, host).cpu_topology
+            except exception.HostNotFound:
+                cpu_topology = None
+            self._topologies[host] = (cpu_topology,
+                                      topology.get_host_cpus(cpu_topology))
+        return self._topologies[host]
+
+    @staticmethod
+    def _get_used_cpus(context, host, host_cpus, instance_uuid):
+        """Return the CPUs of a host used by the instances but one.
+
+        The CPUs are used once pinned as reported by the agent, claimed by
+        an automatic mapping, or requested by an explicit mapping, not
+        applied yet or failed to apply.
+        """
+        used_cpus = (
+            objects.InstanceVCPUPinList.get_pinned_cpus(
+                context, host, exclude_uuid=instance_uuid) |
+            objects.InstanceCPUClaimList.get_claimed_cpus(
+                context, host, exclude_uuid=instance_uuid))
+
+        for record in objects.InstanceCPUMapping.list_records(
+                context, filters={'host': host}, project_only=False):
+            if (record.instance_uuid == instance_uuid or
+                    not record.cpu_mappings or
+                    placement.get_auto_policy(record.cpu_mappings)):
+                continue
+            pinned = cpuset.CPUSet()
+            for cpus in cpuset.parse_vcpu_pinning(
+                    record.cpu_mappings).values():
+                pinned = pinned | cpus
+            # Floating vCPUs allowed on every host CPU do not use any.
+            if not host_cpus.issubset(pinned):
+                used_cpus = used_cpus | pinned
+        return used_cpus
+
+    def _record(self, context, mapping_obj, operation, error):
+        """Record the result of a mapping and of its operation."""
+        if error == states.SUPERSEDED:
+            # The newer mapping of the instance records its own result.
+            LOG.debug('Instance CPU mapping for instance: %s has been '
+                      'superseded by a newer one.',
+                      mapping_obj.instance_uuid)
+            if operation is not None:
+                try:
+                    operation.finish(context, superseded=True)
+                except Exception:
+                    LOG.exception('Failed to record the result of the '
+                                  'operation of instance: %s',
+                                  mapping_obj.instance_uuid)
+            return
+
+        try:
+            if error:
+                mapping_obj.status = states.FAILED
+                LOG.debug('Instance CPU mapping for instance: %s update '
+                          'failed, set status to "failed".',
+                          mapping_obj.instance_uuid)
+            else:
+                mapping_obj.status = states.SUCCEED
+                LOG.debug('Instance CPU mapping for instance: %s updated '
+                          'successfully, set status to "succeed".',
+                          mapping_obj.instance_uuid)
+            # A newer update of the mapping records its own result.
+            if not mapping_obj.save_with_retry(
+                    context, unless_changed=('cpu_mappings',)):
+                LOG.info('Instance CPU mapping for instance: %s has been '
+                         'updated while it was applied, its result is not '
+                         'recorded.', mapping_obj.instance_uuid)
+
+            if operation is not None:
+                operation.finish(context, error=error)
+        except Exception:
+            LOG.exception('Failed to record the result of the instance CPU '
+                          'mapping for instance: %s',
+                          mapping_obj.instance_uuid)
@@ -12,12 +12,21 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import datetime
+
+from oslo_context import context as oslo_context
 from oslo_log import log as logging
 import oslo_messaging as messaging
+from oslo_service import periodic_task
+from oslo_utils import timeutils
 
 from kongming.agent import rpcapi as agent_rpcapi
+from kongming.common import cpuset
 from kongming.common import exception
+from kongming.common import placement
 from kongming.common import states
+from kongming.common import topology
+from kongming.conductor import dispatcher
 from kongming.conf import CONF
 from kongming import objects
 
@@ -25,33 +34,101 @@ from kongming import objects
 LOG = logging.getLogger(__name__)
 
 
-class ConductorManager(object):
+class ConductorManager(periodic_task.PeriodicTasks):
     """Kongming Conductor manager main class."""
 
-    RPC_API_VERSION = '1.0'
+    RPC_API_VERSION = '1.4'
     target = messaging.Target(version=RPC_API_VERSION)
 
     def __init__(self, topic, host=None):
-        super(ConductorManager, self).__init__()
+        super(ConductorManager, self).__init__(CONF)
         self.topic = topic
         self.host = host or CONF.host
         self.agent_rpcapi = agent_rpcapi.EngineAPI()
+        self.dispatcher = dispatcher.MappingDispatcher(self.agent_rpcapi,
+                                                       self.host)
+
+    def init_host(self):
+        self._recover_mapping_operations(oslo_context.get_admin_context())
+
+    def _recover_mapping_operations(self, context):
+        """Queue again the operations left unfinished by a restart.
+
+        The queues of the dispatcher are only kept in memory, the
+        operations the conductor had queued or was running when it stopped
+        would stay unfinished and never be purged otherwise.
+        """
+        operations = objects.MappingOperation.get_unfinished(context,
+                                                             self.host)
+        for operation in operations:
+            try:
+                last = objects.MappingOperation.get_last(
+                    context, operation.instance_uuid)
+                if last.uuid != operation.uuid:
+                    operation.finish(context, superseded=True)
+                    continue
+                mapping_obj = objects.InstanceCPUMapping.get(
+                    context, operation.instance_uuid)
+            except exception.InstanceCPUMappingNotFound:
+                operation.finish(context,
+                                 error='The mapping has been deleted.')
+                continue
+            except Exception:
+                LOG.exception('Failed to recover mapping operation %s.',
+                              operation.uuid)
+                continue
+            self.dispatcher.submit(context, mapping_obj, operation)
+        if operations:
+            LOG.info('Recovered %(count)s unfinished mapping operations of '
+                     'conductor %(host)s.',
+                     {'count': len(operations), 'host': self.host})
 
     def periodic_tasks(self, context, raise_on_error=False):
-        pass
-
-    def update_instance_cpu_mapping(self, context, mapping_obj):
-        result = self.agent_rpcapi.update_instance_cpu_mapping(
-            context, mapping_obj)
-        if result:
-            mapping_obj.status = states.SUCCEED
-            mapping_obj.save()
-            LOG.debug('Instance CPU mapping for instance: %s updated '
-                      'successfully, set status to "succeed".',
-                      mapping_obj.instance_uuid)
-        else:
-            LOG.debug('Instance CPU mapping for instance: %s update '
-                      'failed.', mapping_obj.instance_uuid)
+        return self.run_periodic_tasks(context, raise_on_error=raise_on_error)
+
+    @periodic_task.periodic_task(
+        spacing=CONF.conductor.purge_operations_interval)
+    def _purge_mapping_operations(self, context):
+        """Delete the mapping operations finished for too long.
+
+        Every creation, update and re-application of a mapping records an
+        operation, they are only kept for [conductor]operation_retention.
+        """
+        if not CONF.conductor.operation_retention:
+            return
+        finished_before = timeutils.utcnow() - datetime.timedelta(
+            seconds=CONF.conductor.operation_retention)
+        count = objects.MappingOperation.purge(context, finished_before)
+        if count:
+            LOG.info('Purged %(count)s mapping operations finished before '
+                     '%(time)s.', {'count': count, 'time': finished_before})
+
+    def _get_operation(self, context, operation_uuid):
+        if operation_uuid is None:
+            return None
+        try:
+            return objects.MappingOperation.get(context, operation_uuid)
+        except exception.MappingOperationNotFound:
+            LOG.warning('Mapping operation %s not found, the mapping is '
+                        'applied without tracking.', operation_uuid)
+
+    def update_instance_cpu_mapping(self, context, mapping_obj,
+                                    operation_uuid=None):
+        self.dispatcher.submit(
+            context, mapping_obj, self._get_operation(context, operation_uuid))
+
+    def update_instance_cpu_mappings(self, context, mappings,
+                                     operation_uuids):
+        """Queue a batch of mappings of a single host.
+
+        The mappings of an instance are applied in order, see
+        MappingDispatcher.
+        """
+        for mapping_obj in mappings:
+            self.dispatcher.submit(
+                context, mapping_obj,
+                self._get_operation(
+                    context, operation_uuids.get(mapping_obj.instance_uuid)))
 
     def check_and_update_instance_cpu_mapping(self, context,
                                               instance_uuid,
@@ -64,18 +141,88 @@ class ConductorManager(object):
                       'exists in the system, do nothing.',
                       instance_uuid)
         else:
+            # Mappings created with wait_until_active have no host until
+            # their instance is active.
+            waiting = not db_mapping.host
             db_mapping.host = instance_host
-            result = self.agent_rpcapi.update_instance_cpu_mapping(
-                context, db_mapping)
-            if result:
-                db_mapping.status = states.SUCCEED
-                db_mapping.save()
-                LOG.debug('Instance CPU mapping for instance: %s updated '
-                          'successfully, set status to "succeed".',
-                          db_mapping.instance_uuid)
-            else:
-                LOG.debug('Instance CPU mapping for instance: %s update '
-                          'failed.', db_mapping.instance_uuid)
+            self.dispatcher.submit(
+                context, db_mapping,
+                self._get_sync_operation(context, db_mapping, waiting))
+
+    def reconcile_instance_cpu_mappings(self, context, host):
+        """Apply again the mappings of the active instances of a host.
+
+        Called by the agents on startup, after a host reboot the live
+        pinning of the instances is lost. Explicit mappings are always
+        sent again, the agent skips the vCPUs already pinned as requested.
+        Automatic mappings are only placed again when the instance is not
+        pinned anymore, not to move instances after an agent restart.
+        """
+        instances = dict(
+            (instance.uuid, instance) for instance in
+            objects.Instance.get_instances_by_host_name(context, host))
+        try:
+            host_cpus = topology.get_host_cpus(
+                objects.Host.get(context, host).cpu_topology)
+        except exception.HostNotFound:
+            host_cpus = cpuset.CPUSet()
+
+        mappings = objects.InstanceCPUMapping.list(
+            context, filters={'host': host}, project_only=False)
+        # Explicit mappings are queued first, the host CPUs they take back
+        # are pinned before the automatic mappings are placed.
+        mappings = sorted(
+            mappings, key=lambda mapping_obj: bool(
+                placement.get_auto_policy(mapping_obj.cpu_mappings)))
+        count = 0
+        for mapping_obj in mappings:
+            instance = instances.get(mapping_obj.instance_uuid)
+            if instance is None:
+                continue
+            if (placement.get_auto_policy(mapping_obj.cpu_mappings) and
+                    self._is_pinned(instance, host_cpus)):
+                continue
+            self.dispatcher.submit(
+                context, mapping_obj,
+                self._get_sync_operation(context, mapping_obj))
+            count += 1
+        LOG.info('Apply again %(count)s instance CPU mappings of host '
+                 '%(host)s.', {'count': count, 'host': host})
+
+    @staticmethod
+    def _is_pinned(instance, host_cpus):
+        """Return whether every vCPU of an instance is pinned."""
+        vcpu_cpus = (instance.cpu_mappings or {}).values()
+        return bool(vcpu_cpus) and not any(
+            host_cpus.issubset(cpuset.decode_cpus(cpus))
+            for cpus in vcpu_cpus)
+
+    def _get_sync_operation(self, context, mapping_obj, waiting=False):
+        """Return the operation tracking a mapping applied by the conductor.
+
+        A mapping created with wait_until_active is applied once its
+        instance is active, under the CREATE operation queued by the API.
+        Other re-applications get an operation of their own, the queued
+        operation of a creation or update being applied belongs to it.
+
+        :param waiting: whether the mapping waited for its instance to be
+                        active.
+        """
+        if waiting:
+            operation = objects.MappingOperation.get_last(
+                context, mapping_obj.instance_uuid)
+            if (operation is not None and
+                    operation.action == states.CREATE and
+                    operation.status == states.QUEUED):
+                return operation
+
+        operation = objects.MappingOperation(
+            context, instance_uuid=mapping_obj.instance_uuid,
+            project_id=mapping_obj.project_id, user_id=mapping_obj.user_id,
+            action=states.SYNC, status=states.QUEUED,
+            cpu_mappings=mapping_obj.cpu_mappings, conductor=self.host)
+        operation.create()
+        return operation
 
     def check_and_update_host_resources(self, context, host):
         try:
@@ -83,19 +230,64 @@ class ConductorManager(object):
         except exception.HostNotFound:
             host.create()
         else:
-            db_host.cpu_topolody = host.cpu_topology
-            db_host.save()
+            if db_host.cpu_topology == host.cpu_topology:
+                return
+            db_host.cpu_topology = host.cpu_topology
+            db_host.save_with_retry(context)
         LOG.debug('Host %s updated successfully.', host.host_name)
 
-    def check_and_update_instances(self, context, host, instances):
-        for instance in instances:
-            try:
-                db_instance = objects.Instance.get(context, instance.uuid)
-            except exception.InstanceNotFound:
-                instance.create()
-            else:
-                db_instance.cpu_mappings = instance.cpu_mappings
-                db_instance.host = instance.host
-                db_instance.status = instance.status
-                db_instance.save()
-            LOG.debug('Instance %s updated successfully.', instance.uuid)
+    def check_and_update_instances(self, context, host, instances,
+                                   generation=None):
+        """Reconcile the complete set of instances reported by an agent."""
+        if generation is None:
+            # Reports from agents older than RPC API 1.1 may be partial.
+            objects.InstanceList.bulk_upsert(context, host, instances, [])
+        else:
+            objects.InstanceList.bulk_upsert(context, host, instances)
+            self._set_instance_generation(context, host, generation)
+        LOG.debug('Instances of host %s updated successfully.', host)
+
+    def update_instances_delta(self, context, host, generation, instances,
+                               removed):
+        """Apply the instances changed on a host since the last report.
+
+        :returns: False if the generation does not follow the last one
+                  applied for the host, in which case the agent has to send
+                  a full report through check_and_update_instances.
+        """
+        try:
+            db_host = objects.Host.get(context, host)
+        except exception.HostNotFound:
+            LOG.debug('Host %s is unknown, request a full resync.', host)
+            return False
+
+        if db_host.instance_generation != generation - 1:
+            LOG.info('Instance generation of host %(host)s diverged '
+                     '(expected %(expected)s, got %(got)s), request a full '
+                     'resync.',
+                     {'host': host,
+                      'expected': db_host.instance_generation + 1,
+                      'got': generation})
+            return False
+
+        objects.InstanceList.bulk_upsert(context, host, instances, removed)
+
+        db_host.instance_generation = generation
+        try:
+            db_host.save(context)
+        except exception.ConcurrentUpdate:
+            # Another report of the host has been applied in the meantime,
+            # the generations can not be trusted anymore.
+            LOG.info('Host %s has been updated concurrently, request a '
+                     'full resync.', host)
+            return False
+        LOG.debug('Instances of host %s updated successfully.', host)
+        return True
+
+    def _set_instance_generation(self, context, host, generation):
+        try:
+            db_host = objects.Host.get(context, host)
+        except exception.HostNotFound:
+            return
+        db_host.instance_generation = generation
+        db_host.save_with_retry(context)
@@ -31,10 +31,15 @@ class ConductorAPI(object):
     API version history:
 
     |    1.0 - Initial version.
+    |    1.1 - Add generation to check_and_update_instances and add
+    |          update_instances_delta.
+    |    1.2 - Add operation_uuid to update_instance_cpu_mapping.
+    |    1.3 - Add update_instance_cpu_mappings.
+    |    1.4 - Add reconcile_instance_cpu_mappings.
 
     """
 
-    RPC_API_VERSION = '1.0'
+    RPC_API_VERSION = '1.4'
 
     def __init__(self, topic=None):
         super(ConductorAPI, self).__init__()
@@ -46,15 +51,37 @@ class ConductorAPI(object):
                                      version_cap=self.RPC_API_VERSION,
                                      serializer=serializer)
 
-    def create_instance_cpu_mapping(self, context, mapping_obj):
-        cctxt = self.client.prepare(topic=self.topic)
-        return cctxt.cast(context, 'update_instance_cpu_mapping',
-                          mapping_obj=mapping_obj)
-
-    def update_instance_cpu_mapping(self, context, mapping_obj):
-        cctxt = self.client.prepare(topic=self.topic)
-        return cctxt.cast(context, 'update_instance_cpu_mapping',
-                          mapping_obj=mapping_obj)
+    def create_instance_cpu_mapping(self, context, mapping_obj,
+                                    operation_uuid=None):
+        return self.update_instance_cpu_mapping(
+            context, mapping_obj, operation_uuid=operation_uuid)
+
+    def update_instance_cpu_mapping(self, context, mapping_obj,
+                                    operation_uuid=None):
+        kwargs = {'mapping_obj': mapping_obj}
+        version = '1.0'
+        if operation_uuid is not None:
+            kwargs['operation_uuid'] = operation_uuid
+            version = '1.2'
+        cctxt = self.client.prepare(topic=self.topic, version=version)
+        return cctxt.cast(context, 'update_instance_cpu_mapping', **kwargs)
+
+    def update_instance_cpu_mappings(self, context, mappings,
+                                     operation_uuids):
+        """Apply a batch of mappings of a single host.
+
+        :param mappings: InstanceCPUMapping objects of the same host.
+        :param operation_uuids: a dict mapping the instance uuids to the
+                                uuid of the operation of their mapping.
+        """
+        cctxt = self.client.prepare(topic=self.topic, version='1.3')
+        return cctxt.cast(context, 'update_instance_cpu_mappings',
+                          mappings=mappings, operation_uuids=operation_uuids)
+
+    def reconcile_instance_cpu_mappings(self, context, host):
+        cctxt = self.client.prepare(topic=self.topic, version='1.4')
+        return cctxt.cast(context, 'reconcile_instance_cpu_mappings',
+                          host=host)
 
     def check_and_update_instance_cpu_mapping(self, context,
                                               instance_uuid,
@@ -68,7 +95,16 @@ class ConductorAPI(object):
         cctxt = self.client.prepare(topic=self.topic)
         return cctxt.call(context, 'check_and_update_host_resources', host=host)
 
-    def check_and_update_instances(self, context, host, instance_list):
-        cctxt = self.client.prepare(topic=self.topic)
+    def check_and_update_instances(self, context, host, instance_list,
+                                   generation=None):
+        cctxt = self.client.prepare(topic=self.topic, version='1.1')
         return cctxt.call(context, 'check_and_update_instances',
-                          host=host, instances=instance_list)
+                          host=host, instances=instance_list,
+                          generation=generation)
+
+    def update_instances_delta(self, context, host, generation,
+                               instance_list, removed):
+        cctxt = self.client.prepare(topic=self.topic, version='1.1')
+        return cctxt.call(context, 'update_instances_delta',
+                          host=host, generation=generation,
+                          instances=instance_list, removed=removed)
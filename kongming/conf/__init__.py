@@ -14,12 +14,14 @@ from oslo_config import cfg
 
 from kongming.conf import agent
 from kongming.conf import api
+from kongming.conf import conductor
 from kongming.conf import database
 from kongming.conf import default
 from kongming.conf import nova
 
 CONF = cfg.CONF
 api.register_opts(CONF)
+conductor.register_opts(CONF)
 database.register_opts(CONF)
 default.register_opts(CONF)
 agent.register_opts(CONF)
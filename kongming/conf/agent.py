@@ -25,9 +25,94 @@ executor_opts = [
                default=60,
                help=_('Interval between syncing the resources from underlying '
                       'hypervisor, in seconds.')),
+    cfg.BoolOpt('enable_libvirt_events',
+                default=True,
+                help=_('Register for libvirt domain lifecycle and tuning '
+                       'events and sync only the affected domain when they '
+                       'fire. The periodic full sync is then only performed '
+                       'every "full_sync_interval" seconds as a safety '
+                       'net.')),
+    cfg.IntOpt('full_sync_interval',
+               default=600,
+               help=_('Interval between full resource syncs when libvirt '
+                      'events are enabled, in seconds.')),
+    cfg.StrOpt('driver',
+               default='libvirt.LibvirtDriver',
+               help=_('Hypervisor driver used by the agent, relative to the '
+                      'kongming.virt package. "fake.FakeDriver" simulates '
+                      'the domains of a host in memory, see the '
+                      '[fake_driver] options.')),
+    cfg.IntOpt('pin_workers',
+               default=8,
+               min=1,
+               help=_('Maximum number of vCPUs pinned concurrently by the '
+                      'agent.')),
+    cfg.BoolOpt('persistent_pinning',
+                default=False,
+                help=_('Also write the vCPU pinning to the persistent '
+                       'definition of the domains, so that it survives '
+                       'guest and host restarts. Otherwise only the live '
+                       'domains are pinned.')),
+    cfg.BoolOpt('reconcile_on_startup',
+                default=True,
+                help=_('Ask the conductor to apply again the cpu mappings of '
+                       'the instances of the host once the agent reported '
+                       'them after its start, e.g. after a host reboot.')),
+    cfg.IntOpt('mapping_workers',
+               default=8,
+               min=1,
+               help=_('Maximum number of instances whose cpu mapping is '
+                      'adjusted concurrently by the agent.')),
+]
+
+
+fake_driver_opts = [
+    cfg.StrOpt('hostname',
+               help=_('Host name reported by the fake driver, defaults to '
+                      'the host option.')),
+    cfg.IntOpt('instances',
+               default=100,
+               min=0,
+               help=_('Number of active domains simulated by the fake '
+                      'driver.')),
+    cfg.IntOpt('vcpus',
+               default=4,
+               min=1,
+               help=_('Number of vCPUs of every simulated domain.')),
+    cfg.IntOpt('sockets',
+               default=2,
+               min=1,
+               help=_('Number of sockets of the simulated host.')),
+    cfg.IntOpt('cells_per_socket',
+               default=1,
+               min=1,
+               help=_('Number of NUMA cells per socket of the simulated '
+                      'host.')),
+    cfg.IntOpt('cores_per_cell',
+               default=8,
+               min=1,
+               help=_('Number of cores per NUMA cell of the simulated '
+                      'host.')),
+    cfg.IntOpt('threads_per_core',
+               default=2,
+               min=1,
+               help=_('Number of hyperthreads per core of the simulated '
+                      'host.')),
+    cfg.IntOpt('cores_per_cache',
+               default=4,
+               min=1,
+               help=_('Number of cores sharing a last level cache on the '
+                      'simulated host.')),
+    cfg.FloatOpt('latency',
+                 default=0.0,
+                 min=0.0,
+                 help=_('Simulated latency of every fake driver call, in '
+                        'seconds.')),
 ]
 
 
 def register_opts(conf):
     conf.register_opts(
         executor_opts, group="agent")
+    conf.register_opts(
+        fake_driver_opts, group="fake_driver")
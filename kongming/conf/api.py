@@ -45,6 +45,22 @@ opts = [
                       "host URL. If the API is operating behind a proxy, you "
                       "will want to change this to represent the proxy's URL. "
                       "Defaults to None.")),
+    cfg.IntOpt('max_limit',
+               default=1000,
+               min=1,
+               help=_('The maximum number of items returned in a single '
+                      'response from a collection resource.')),
+    cfg.IntOpt('max_wait',
+               default=60,
+               min=0,
+               help=_('The maximum number of seconds a request can wait for '
+                      'a mapping operation to finish with the "wait" query '
+                      'parameter.')),
+    cfg.IntOpt('max_batch_size',
+               default=200,
+               min=1,
+               help=_('The maximum number of mappings of a single batch '
+                      'request.')),
 ]
 
 opt_group = cfg.OptGroup(name='api',
@@ -0,0 +1,60 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from oslo_config import cfg
+
+from kongming.common.i18n import _
+
+
+opts = [
+    cfg.IntOpt('max_concurrent_agent_calls',
+               default=64,
+               min=1,
+               help=_('Maximum number of mapping batches the conductor '
+                      'sends to the agents at the same time, over all the '
+                      'hosts.')),
+    cfg.IntOpt('max_concurrent_calls_per_agent',
+               default=1,
+               min=1,
+               help=_('Maximum number of mapping batches the conductor '
+                      'sends to a single agent at the same time.')),
+    cfg.IntOpt('max_mappings_per_call',
+               default=50,
+               min=1,
+               help=_('Maximum number of instance cpu mappings sent to an '
+                      'agent in a single RPC call.')),
+    cfg.IntOpt('placement_attempts',
+               default=3,
+               min=1,
+               help=_('Number of times an automatic mapping is placed when '
+                      'the host CPUs it is given have been claimed '
+                      'concurrently by another instance.')),
+    cfg.IntOpt('operation_retention',
+               default=7 * 24 * 3600,
+               min=0,
+               help=_('Number of seconds the finished mapping operations '
+                      'are kept before being purged. 0 disables the '
+                      'purge.')),
+    cfg.IntOpt('purge_operations_interval',
+               default=3600,
+               min=1,
+               help=_('Interval between two purges of the finished mapping '
+                      'operations, in seconds.')),
+]
+
+opt_group = cfg.OptGroup(name='conductor',
+                         title='Options for the kongming-conductor service')
+
+
+def register_opts(conf):
+    conf.register_group(opt_group)
+    conf.register_opts(opts, group=opt_group)
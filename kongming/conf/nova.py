@@ -25,7 +25,17 @@ opts = [
                      'than 2.1 and not larger than the max supported '
                      'Compute API microversion. The current supported '
                      'Compute API versions can be checked using: '
-                     'nova version-list.')
+                     'nova version-list.'),
+    cfg.IntOpt('version_check_interval',
+               default=3600,
+               help=_('Interval between two checks of the compute API '
+                      'microversion supported by Nova, in seconds. The '
+                      'negotiated client is cached in between and checked '
+                      'again whenever Nova rejects the microversion.')),
+    cfg.IntOpt('instance_cache_ttl',
+               default=5,
+               help=_('Lifetime of the cached Nova servers, in seconds. Set '
+                      'to 0 to disable the cache.')),
 ]
 
 
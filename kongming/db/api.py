@@ -44,8 +44,13 @@ class Connection(object):
     # InstanceCPUMapping
     @abc.abstractmethod
     def instance_cpu_mapping_list(
-            self, context, limit, marker, sort_key, sort_dir, project_only):
-        """Return a list of Mapping objects."""
+            self, context, limit, marker, sort_key, sort_dir, filters,
+            project_only, columns=None):
+        """Return a list of Mapping objects.
+
+        :param columns: names of the only columns to read, named tuples of
+                        these columns are returned instead of Mappings.
+        """
 
     @abc.abstractmethod
     def instance_cpu_mapping_get(cls, context, instance_uuid):
@@ -56,34 +61,134 @@ class Connection(object):
     def instance_cpu_mapping_create(self, context=None):
         """Create a Mapping record in the DB."""
 
+    @abc.abstractmethod
+    def instance_cpu_mapping_bulk_create(self, context, mappings,
+                                         operations):
+        """Create Mappings and their operations in one transaction.
+
+        :param mappings: a list of dicts of mapping values.
+        :param operations: a list of dicts of operation values.
+        :returns: the created mapping and operation rows.
+        """
+
+    @abc.abstractmethod
+    def instance_cpu_mapping_bulk_update(self, context, updates, operations,
+                                         expected_versions=None):
+        """Update Mappings and create their operations in one transaction.
+
+        :param updates: a dict mapping instance uuids to the values to
+                        update.
+        :param operations: a list of dicts of operation values.
+        :param expected_versions: a dict mapping instance uuids to the
+                                  version of the mapping read by the caller.
+        :returns: the updated mapping and operation rows.
+        :raises: ConcurrentUpdate if a mapping is not at its expected
+                 version.
+        """
+
     @abc.abstractmethod
     def instance_cpu_mapping_destroy(self, context=None):
         """Delete the Mapping from the DB."""
 
     @abc.abstractmethod
-    def instance_cpu_mapping_update(self, context, instance_uuid, values):
-        """Update a Mapping"""
+    def instance_cpu_mapping_update(self, context, instance_uuid, values,
+                                    expected_version=None):
+        """Update a Mapping.
+
+        :param expected_version: the version of the mapping read by the
+                                 caller, the update is only applied if the
+                                 mapping is still at this version.
+        :raises: ConcurrentUpdate if the mapping has been updated since.
+        """
+
+    # MappingOperation
+    @abc.abstractmethod
+    def mapping_operation_create(self, context, values):
+        """Create a mapping operation record in the DB."""
+
+    @abc.abstractmethod
+    def mapping_operation_get(self, context, uuid):
+        """Get a mapping operation by uuid."""
+
+    @abc.abstractmethod
+    def mapping_operation_get_last(self, context, instance_uuid):
+        """Get the most recent operation of an instance mapping."""
+
+    @abc.abstractmethod
+    def mapping_operation_get_unfinished(self, context, conductor):
+        """Return the queued and running operations of a conductor.
+
+        :param conductor: host name of the conductor applying the
+                          operations.
+        :returns: the operation rows, oldest first.
+        """
+
+    @abc.abstractmethod
+    def mapping_operation_update(self, context, uuid, values):
+        """Update a mapping operation by uuid."""
+
+    @abc.abstractmethod
+    def mapping_operation_purge(self, context, finished_before):
+        """Delete the operations finished before a time.
+
+        :returns: the number of deleted operations.
+        """
+
+    @abc.abstractmethod
+    def host_list(self, context, limit, marker, sort_key, sort_dir,
+                  with_instances, columns=None):
+        """Return a list of hosts.
+
+        :param columns: see instance_cpu_mapping_list().
+        """
 
     @abc.abstractmethod
-    def host_get_by_name(self, context, host_name):
-        """Get host by name."""
+    def host_get_by_name(self, context, host_name, with_instances=False):
+        """Get host by name.
+
+        :param with_instances: also load the instances of the host, in the
+                               same query.
+        """
 
     @abc.abstractmethod
-    def host_update(self, context, host_name, updates):
-        """Update host by name."""
+    def host_update(self, context, host_name, updates,
+                    expected_version=None):
+        """Update host by name.
+
+        :param expected_version: see instance_cpu_mapping_update().
+        """
 
     @abc.abstractmethod
     def host_create(self, context, values):
         """Create a new host."""
 
     @abc.abstractmethod
-    def instance_update(self, context, uuid, updates):
-        """Update instance by uuid."""
+    def instance_update(self, context, uuid, updates, expected_version=None):
+        """Update instance by uuid.
+
+        :param expected_version: see instance_cpu_mapping_update().
+        """
 
     @abc.abstractmethod
     def instance_create(self, context, values):
         """Create a new instance."""
 
+    @abc.abstractmethod
+    def instance_bulk_upsert(self, context, host, instances, removed=None):
+        """Reconcile the instances reported by a host in one transaction.
+
+        :param host: name of the reporting host.
+        :param instances: a list of dicts of instance values.
+        :param removed: uuids of the instances removed from the host. If
+                        None, ``instances`` is the complete set of instances
+                        on the host and every other row of the host is
+                        deleted.
+        """
+
+    @abc.abstractmethod
+    def instance_destroy(self, context, uuid):
+        """Delete an instance by uuid."""
+
     @abc.abstractmethod
     def instance_get(self, context, uuid):
         """Get an instance by uuid"""
@@ -91,3 +196,52 @@ class Connection(object):
     @abc.abstractmethod
     def instances_get_by_host_name(self, context, host_name):
         """Get a list of instances by hostname"""
+
+    @abc.abstractmethod
+    def instance_count_by_host_names(self, context, host_names):
+        """Return a dict mapping host names to their number of instances."""
+
+    # InstanceVCPUPin
+    @abc.abstractmethod
+    def vcpu_pin_get_by_pcpus(self, context, host, pcpus):
+        """Return the vCPU pins using some host CPUs of a host.
+
+        :param host: name of the host.
+        :param pcpus: ids of the host CPUs.
+        :returns: the pin rows, ordered by host CPU.
+        """
+
+    @abc.abstractmethod
+    def vcpu_pin_get_pcpu_usage(self, context, hosts, exclude_uuid=None):
+        """Return the number of vCPUs pinned to every host CPU of hosts.
+
+        :param hosts: names of the hosts.
+        :param exclude_uuid: uuid of an instance whose pins are ignored.
+        :returns: a dict mapping every host name to a dict mapping the
+                  pinned host CPUs to their number of vCPUs.
+        """
+
+    # InstanceCPUClaim
+    @abc.abstractmethod
+    def cpu_claim_replace(self, context, instance_uuid, host, claims):
+        """Replace the host CPUs claimed by an instance in one transaction.
+
+        :param instance_uuid: uuid of the instance.
+        :param host: name of the host of the claimed CPUs.
+        :param claims: a list of dicts with the vcpu and pcpu keys.
+        :raises: CPUClaimConflict if another instance has claimed one of
+                 the host CPUs.
+        """
+
+    @abc.abstractmethod
+    def cpu_claim_destroy(self, context, instance_uuid):
+        """Release all the host CPUs claimed by an instance."""
+
+    @abc.abstractmethod
+    def cpu_claim_get_pcpus(self, context, host, exclude_uuid=None):
+        """Return the host CPUs claimed on a host.
+
+        :param host: name of the host.
+        :param exclude_uuid: uuid of an instance whose claims are ignored.
+        :returns: a list of host CPU ids.
+        """
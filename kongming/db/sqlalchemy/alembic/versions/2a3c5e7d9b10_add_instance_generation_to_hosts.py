@@ -0,0 +1,34 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""add instance_generation to hosts
+
+Revision ID: 2a3c5e7d9b10
+Revises: f50980397351
+Create Date: 2018-08-06 10:12:43.102245
+
+"""
+
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2a3c5e7d9b10'
+down_revision = 'f50980397351'
+
+
+def upgrade():
+    op.add_column('hosts',
+                  sa.Column('instance_generation', sa.Integer(),
+                            nullable=False, server_default='0'))
@@ -0,0 +1,34 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""widen instance_cpu_mappings.cpu_mappings for per-vCPU pinning
+
+Revision ID: 4c1e8a2f6d35
+Revises: 2a3c5e7d9b10
+Create Date: 2018-08-13 15:40:02.517730
+
+"""
+
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4c1e8a2f6d35'
+down_revision = '2a3c5e7d9b10'
+
+
+def upgrade():
+    op.alter_column('instance_cpu_mappings', 'cpu_mappings',
+                    existing_type=sa.String(length=255),
+                    type_=sa.Text(), existing_nullable=True)
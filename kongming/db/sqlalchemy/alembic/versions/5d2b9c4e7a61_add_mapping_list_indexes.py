@@ -0,0 +1,36 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""add indexes for listing instance_cpu_mappings
+
+Revision ID: 5d2b9c4e7a61
+Revises: 4c1e8a2f6d35
+Create Date: 2018-08-20 09:26:51.880214
+
+"""
+
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '5d2b9c4e7a61'
+down_revision = '4c1e8a2f6d35'
+
+
+def upgrade():
+    op.create_index('instance_cpu_mappings_host_idx',
+                    'instance_cpu_mappings', ['host', 'id'])
+    op.create_index('instance_cpu_mappings_status_idx',
+                    'instance_cpu_mappings', ['status', 'id'])
+    op.create_index('instance_cpu_mappings_project_id_idx',
+                    'instance_cpu_mappings', ['project_id', 'id'])
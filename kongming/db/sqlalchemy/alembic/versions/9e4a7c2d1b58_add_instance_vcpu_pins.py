@@ -0,0 +1,70 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""add instance_vcpu_pins table and instances host index
+
+Revision ID: 9e4a7c2d1b58
+Revises: 7b3e0f1c9a42
+Create Date: 2018-09-03 10:41:52.170233
+
+"""
+
+
+from alembic import op
+from oslo_serialization import jsonutils
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9e4a7c2d1b58'
+down_revision = '7b3e0f1c9a42'
+
+
+def upgrade():
+    pins = op.create_table(
+        'instance_vcpu_pins',
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('host', sa.String(length=255), nullable=False),
+        sa.Column('pcpu', sa.Integer(), nullable=False),
+        sa.Column('instance_uuid', sa.String(length=36), nullable=False),
+        sa.Column('vcpu', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+        mysql_ENGINE='InnoDB',
+        mysql_DEFAULT_CHARSET='UTF8'
+    )
+    op.create_index('instance_vcpu_pins_host_pcpu_idx',
+                    'instance_vcpu_pins', ['host', 'pcpu'])
+    op.create_index('instance_vcpu_pins_instance_uuid_idx',
+                    'instance_vcpu_pins', ['instance_uuid'])
+    op.create_index('instances_host_idx', 'instances', ['host'])
+
+    # Fill the table from the pinning last reported by the agents.
+    instances = sa.table('instances',
+                         sa.column('uuid', sa.String),
+                         sa.column('host', sa.String),
+                         sa.column('cpu_mappings', sa.Text))
+    rows = []
+    for uuid, host, cpu_mappings in op.get_bind().execute(
+            sa.select([instances.c.uuid, instances.c.host,
+                       instances.c.cpu_mappings])):
+        if not host or not cpu_mappings:
+            continue
+        for vcpu, cpumap in jsonutils.loads(cpu_mappings).items():
+            if all(cpumap):
+                continue
+            rows.extend({'host': host, 'pcpu': pcpu, 'instance_uuid': uuid,
+                         'vcpu': int(vcpu)}
+                        for pcpu, pinned in enumerate(cpumap) if pinned)
+    if rows:
+        op.bulk_insert(pins, rows)
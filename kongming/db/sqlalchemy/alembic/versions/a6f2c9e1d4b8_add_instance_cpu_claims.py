@@ -0,0 +1,48 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""add instance_cpu_claims table
+
+Revision ID: a6f2c9e1d4b8
+Revises: e8b4d2f7a3c9
+Create Date: 2018-09-25 14:36:08.702915
+
+"""
+
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a6f2c9e1d4b8'
+down_revision = 'e8b4d2f7a3c9'
+
+
+def upgrade():
+    op.create_table(
+        'instance_cpu_claims',
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('host', sa.String(length=255), nullable=False),
+        sa.Column('pcpu', sa.Integer(), nullable=False),
+        sa.Column('instance_uuid', sa.String(length=36), nullable=False),
+        sa.Column('vcpu', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('host', 'pcpu',
+                            name='uniq_instance_cpu_claims0host0pcpu'),
+        mysql_ENGINE='InnoDB',
+        mysql_DEFAULT_CHARSET='UTF8'
+    )
+    op.create_index('instance_cpu_claims_instance_uuid_idx',
+                    'instance_cpu_claims', ['instance_uuid'])
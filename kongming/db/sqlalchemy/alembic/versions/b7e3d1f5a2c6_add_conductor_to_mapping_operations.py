@@ -0,0 +1,36 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""add the conductor of the mapping_operations
+
+Revision ID: b7e3d1f5a2c6
+Revises: a6f2c9e1d4b8
+Create Date: 2018-09-27 09:53:21.164027
+
+"""
+
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7e3d1f5a2c6'
+down_revision = 'a6f2c9e1d4b8'
+
+
+def upgrade():
+    op.add_column('mapping_operations',
+                  sa.Column('conductor', sa.String(length=255),
+                            nullable=True))
+    op.create_index('mapping_operations_conductor_status_idx',
+                    'mapping_operations', ['conductor', 'status'])
@@ -0,0 +1,35 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""add version to instance_cpu_mappings, hosts and instances
+
+Revision ID: c3d8f1a6e4b7
+Revises: 9e4a7c2d1b58
+Create Date: 2018-09-10 16:27:05.448913
+
+"""
+
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c3d8f1a6e4b7'
+down_revision = '9e4a7c2d1b58'
+
+
+def upgrade():
+    for table in ('instance_cpu_mappings', 'hosts', 'instances'):
+        op.add_column(table,
+                      sa.Column('version', sa.Integer(),
+                                nullable=False, server_default='0'))
@@ -0,0 +1,32 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""add an index on the finished_at of mapping_operations
+
+Revision ID: e8b4d2f7a3c9
+Revises: c3d8f1a6e4b7
+Create Date: 2018-09-21 10:12:44.518306
+
+"""
+
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'e8b4d2f7a3c9'
+down_revision = 'c3d8f1a6e4b7'
+
+
+def upgrade():
+    op.create_index('mapping_operations_finished_at_idx',
+                    'mapping_operations', ['finished_at'])
@@ -27,9 +27,14 @@ from oslo_utils import strutils
 from oslo_utils import uuidutils
 from sqlalchemy import orm
 from sqlalchemy.orm.exc import NoResultFound
+from sqlalchemy.orm.exc import StaleDataError
+from sqlalchemy import sql
 
+from kongming.common import cpuset
 from kongming.common import exception
 from kongming.common.i18n import _
+from kongming.common import states
+from kongming.common import topology
 from kongming.db import api
 from kongming.db.sqlalchemy import models
 
@@ -37,6 +42,8 @@ from kongming.db.sqlalchemy import models
 _CONTEXT = threading.local()
 LOG = log.getLogger(__name__)
 
+_MAPPING_FILTERS = ('instance_uuid', 'host', 'status', 'project_id')
+
 
 def get_backend():
     """The backend is this module itself."""
@@ -95,7 +102,12 @@ def add_identity_filter(query, value):
 
 
 def _paginate_query(context, model, limit=None, marker=None, sort_key=None,
-                    sort_dir=None, query=None):
+                    sort_dir=None, query=None, columns=None):
+    """Return a page of rows of a model.
+
+    :param columns: names of the only columns to read, the rows are then
+                    named tuples of these columns instead of model objects.
+    """
     if not query:
         query = model_query(context, model)
     sort_keys = ['id']
@@ -109,9 +121,99 @@ def _paginate_query(context, model, limit=None, marker=None, sort_key=None,
         raise exception.InvalidParameterValue(
             _('The sort_key value "%(key)s" is an invalid field for sorting')
             % {'key': sort_key})
+    if columns:
+        query = query.with_entities(
+            *[getattr(model, column) for column in columns])
     return query.all()
 
 
+def _is_stale_data(exc):
+    return isinstance(exc, StaleDataError)
+
+
+# Versioned rows (see models) are read without row locks, their UPDATE
+# does not match if they changed since they have been read and the
+# transaction is then retried.
+_retry_on_stale_data = oslo_db_api.wrap_db_retry(
+    max_retries=5, retry_interval=0.1, max_retry_interval=1,
+    retry_on_deadlock=True, exception_checker=_is_stale_data)
+
+
+def _check_version(ref, expected_version, resource, ident):
+    """Compare the version of a row with the one a caller has read.
+
+    :raises: ConcurrentUpdate if the row has been updated since.
+    """
+    if expected_version is not None and ref.version != expected_version:
+        raise exception.ConcurrentUpdate(
+            resource=resource, id=ident, version=ref.version,
+            expected=expected_version)
+
+
+def _get_host_cpus(context, host):
+    """Return the CPUSet of all the CPUs of a host, empty if unknown."""
+    row = model_query(context, models.Hosts,
+                      models.Hosts.cpu_topology).filter_by(
+        host_name=host).first()
+    return topology.get_host_cpus(row[0] if row else None)
+
+
+def _get_vcpu_pins(instance_uuid, host, cpu_mappings, host_cpus):
+    """Return the pin rows of the pinned vCPUs of an instance.
+
+    vCPUs allowed to run on every host CPU are floating, they do not pin
+    any host CPU and get no row, see placement.get_used_cpus().
+    """
+    pins = []
+    if not host:
+        return pins
+    for vcpu, cpus in (cpu_mappings or {}).items():
+        cpus = cpuset.decode_cpus(cpus)
+        if host_cpus.issubset(cpus):
+            continue
+        pins.extend({'host': host, 'pcpu': pcpu,
+                     'instance_uuid': instance_uuid, 'vcpu': int(vcpu)}
+                    for pcpu in cpus)
+    return pins
+
+
+def _replace_vcpu_pins(context, session, uuids, instances):
+    """Replace the pin rows of instances in the current transaction.
+
+    :param uuids: uuids of the instances whose rows are deleted.
+    :param instances: the Instance rows whose pins are inserted.
+    """
+    if uuids:
+        model_query(context, models.InstanceVCPUPin).filter(
+            models.InstanceVCPUPin.instance_uuid.in_(list(uuids))).delete(
+            synchronize_session=False)
+    host_cpus = {}
+    pins = []
+    for instance in instances:
+        if instance.host and instance.host not in host_cpus:
+            host_cpus[instance.host] = _get_host_cpus(context, instance.host)
+        pins.extend(_get_vcpu_pins(instance.uuid, instance.host,
+                                   instance.cpu_mappings,
+                                   host_cpus.get(instance.host)))
+    if pins:
+        session.bulk_insert_mappings(models.InstanceVCPUPin, pins)
+
+
+def _delete_cpu_claims(context, uuids, keep_host=None):
+    """Release the CPUs claimed by instances in the current transaction.
+
+    :param keep_host: name of a host whose claims are kept, the other
+                      claims of the instances are stale.
+    """
+    if not uuids:
+        return
+    query = model_query(context, models.InstanceCPUClaim).filter(
+        models.InstanceCPUClaim.instance_uuid.in_(list(uuids)))
+    if keep_host is not None:
+        query = query.filter(models.InstanceCPUClaim.host != keep_host)
+    query.delete(synchronize_session=False)
+
+
 class Connection(api.Connection):
     """SqlAlchemy connection."""
 
@@ -135,6 +237,58 @@ class Connection(api.Connection):
                     uuid=values['instance_uuid'])
             return mapping
 
+    @oslo_db_api.retry_on_deadlock
+    def instance_cpu_mapping_bulk_create(self, context, mappings,
+                                         operations):
+        refs = []
+        try:
+            with _session_for_write() as session:
+                for values in mappings:
+                    mapping = models.InstanceCPUMapping()
+                    mapping.update(values)
+                    session.add(mapping)
+                    refs.append(mapping)
+                operation_refs = self._add_mapping_operations(session,
+                                                              operations)
+                session.flush()
+        except db_exc.DBDuplicateEntry:
+            # The batch is rolled back as a whole, find which mapping
+            # already existed to report it.
+            uuids = [values['instance_uuid'] for values in mappings]
+            existing = model_query(
+                context, models.InstanceCPUMapping.instance_uuid).filter(
+                models.InstanceCPUMapping.instance_uuid.in_(uuids)).first()
+            raise exception.InstanceCPUMappingAlreadyExists(
+                uuid=existing[0] if existing else ', '.join(uuids))
+        return refs, operation_refs
+
+    @_retry_on_stale_data
+    def instance_cpu_mapping_bulk_update(self, context, updates, operations,
+                                         expected_versions=None):
+        for values in updates.values():
+            if 'instance_uuid' in values or 'id' in values:
+                msg = _("Cannot overwrite the id of an existing Mapping.")
+                raise exception.InvalidParameterValue(err=msg)
+        expected_versions = expected_versions or {}
+
+        with _session_for_write() as session:
+            query = model_query(context, models.InstanceCPUMapping).filter(
+                models.InstanceCPUMapping.instance_uuid.in_(list(updates)))
+            refs = query.all()
+            missing = set(updates) - set(ref.instance_uuid for ref in refs)
+            if missing:
+                raise exception.InstanceCPUMappingNotFound(
+                    uuid=', '.join(sorted(missing)))
+
+            for ref in refs:
+                _check_version(ref, expected_versions.get(ref.instance_uuid),
+                               'Instance CPU mapping', ref.instance_uuid)
+                ref.update(updates[ref.instance_uuid])
+            operation_refs = self._add_mapping_operations(session,
+                                                          operations)
+            session.flush()
+            return refs, operation_refs
+
     def instance_cpu_mapping_get(self, context, instance_uuid):
         query = model_query(
             context,
@@ -145,15 +299,34 @@ class Connection(api.Connection):
         except NoResultFound:
             raise exception.InstanceCPUMappingNotFound(uuid=instance_uuid)
 
-    def instance_cpu_mapping_list( self, context, limit=1000, marker=None,
-                                   sort_key=None, sort_dir=None,
-                                   project_only=True):
+    def instance_cpu_mapping_list(self, context, limit=1000, marker=None,
+                                  sort_key=None, sort_dir=None, filters=None,
+                                  project_only=True, columns=None):
         query = model_query(context, models.InstanceCPUMapping,
                             project_only=project_only)
+        for key, value in (filters or {}).items():
+            if key not in _MAPPING_FILTERS:
+                raise exception.InvalidParameterValue(
+                    err=_('Invalid filter: %s') % key)
+            if isinstance(value, (list, tuple, set)):
+                query = query.filter(
+                    getattr(models.InstanceCPUMapping, key).in_(value))
+            else:
+                query = query.filter_by(**{key: value})
+
+        if marker is not None:
+            try:
+                marker = self.instance_cpu_mapping_get(context, marker)
+            except exception.InstanceCPUMappingNotFound:
+                raise exception.InvalidParameterValue(
+                    err=_('The marker %s could not be found.') % marker)
+
         return _paginate_query(context, models.InstanceCPUMapping, limit,
-                               marker, sort_key, sort_dir, query)
+                               marker, sort_key, sort_dir, query,
+                               columns=columns)
 
-    def instance_cpu_mapping_update(self, context, instance_uuid, values):
+    def instance_cpu_mapping_update(self, context, instance_uuid, values,
+                                    expected_version=None):
         if 'instance_uuid' in values:
             msg = _("Cannot overwrite instance_uuid for an existing Mapping.")
             raise exception.InvalidParameterValue(err=msg)
@@ -162,18 +335,21 @@ class Connection(api.Connection):
             raise exception.InvalidParameterValue(err=msg)
 
         return self._do_update_instance_cpu_mapping(
-            context, instance_uuid, values)
+            context, instance_uuid, values, expected_version)
 
-    @oslo_db_api.retry_on_deadlock
-    def _do_update_instance_cpu_mapping(self, context, instance_uuid, values):
+    @_retry_on_stale_data
+    def _do_update_instance_cpu_mapping(self, context, instance_uuid, values,
+                                        expected_version=None):
         with _session_for_write():
             query = model_query(context, models.InstanceCPUMapping)
             query = add_identity_filter(query, instance_uuid)
             try:
-                ref = query.with_lockmode('update').one()
+                ref = query.one()
             except NoResultFound:
-                raise exception.InstanceCPUMappingNotFound(uuid=uuid)
+                raise exception.InstanceCPUMappingNotFound(uuid=instance_uuid)
 
+            _check_version(ref, expected_version, 'Instance CPU mapping',
+                           instance_uuid)
             ref.update(values)
         return ref
 
@@ -185,36 +361,129 @@ class Connection(api.Connection):
             count = query.delete()
             if count != 1:
                 raise exception.InstanceCPUMappingNotFound(uuid=instance_uuid)
+            _delete_cpu_claims(context, [instance_uuid])
 
     @oslo_db_api.retry_on_deadlock
-    def host_get_by_name(self, context, host_name):
-        query = model_query(
-            context,
-            models.Hosts).options(orm.joinedload('instances')).filter_by(
+    def mapping_operation_create(self, context, values):
+        if not values.get('uuid'):
+            values['uuid'] = uuidutils.generate_uuid()
+
+        operation = models.MappingOperation()
+        operation.update(values)
+
+        with _session_for_write() as session:
+            session.add(operation)
+            session.flush()
+            return operation
+
+    @staticmethod
+    def _add_mapping_operations(session, operations):
+        refs = []
+        for values in operations:
+            if not values.get('uuid'):
+                values['uuid'] = uuidutils.generate_uuid()
+            operation = models.MappingOperation()
+            operation.update(values)
+            session.add(operation)
+            refs.append(operation)
+        return refs
+
+    def mapping_operation_get(self, context, uuid):
+        query = model_query(context, models.MappingOperation).filter_by(
+            uuid=uuid)
+        try:
+            return query.one()
+        except NoResultFound:
+            raise exception.MappingOperationNotFound(uuid=uuid)
+
+    def mapping_operation_get_last(self, context, instance_uuid):
+        query = model_query(context, models.MappingOperation).filter_by(
+            instance_uuid=instance_uuid).order_by(
+            models.MappingOperation.id.desc())
+        return query.first()
+
+    def mapping_operation_get_unfinished(self, context, conductor):
+        query = model_query(context, models.MappingOperation).filter_by(
+            conductor=conductor).filter(
+            models.MappingOperation.status.in_([states.QUEUED,
+                                                states.RUNNING]))
+        return query.order_by(models.MappingOperation.id).all()
+
+    @oslo_db_api.retry_on_deadlock
+    def mapping_operation_update(self, context, uuid, values):
+        if 'uuid' in values or 'id' in values:
+            msg = _("Cannot overwrite the id of an existing operation.")
+            raise exception.InvalidParameterValue(err=msg)
+
+        # The dispatcher is the only writer of an operation, it does not
+        # need to be locked.
+        with _session_for_write():
+            query = model_query(context, models.MappingOperation).filter_by(
+                uuid=uuid)
+            count = query.update(values, synchronize_session=False)
+            if count != 1:
+                raise exception.MappingOperationNotFound(uuid=uuid)
+            return query.one()
+
+    @oslo_db_api.retry_on_deadlock
+    def mapping_operation_purge(self, context, finished_before):
+        # Only finished operations have a finished_at.
+        with _session_for_write():
+            query = model_query(context, models.MappingOperation).filter(
+                models.MappingOperation.finished_at < finished_before)
+            return query.delete(synchronize_session=False)
+
+    def host_list(self, context, limit=None, marker=None, sort_key=None,
+                  sort_dir=None, with_instances=False, columns=None):
+        query = model_query(context, models.Hosts)
+        if with_instances:
+            # Load the instances of the whole page in the same query
+            # instead of one query per host.
+            query = query.options(orm.joinedload('instances'))
+
+        if marker is not None:
+            try:
+                marker = model_query(context, models.Hosts).filter_by(
+                    host_name=marker).one()
+            except NoResultFound:
+                raise exception.InvalidParameterValue(
+                    err=_('The marker %s could not be found.') % marker)
+
+        return _paginate_query(context, models.Hosts, limit, marker,
+                               sort_key, sort_dir, query, columns=columns)
+
+    @oslo_db_api.retry_on_deadlock
+    def host_get_by_name(self, context, host_name, with_instances=False):
+        query = model_query(context, models.Hosts).filter_by(
             host_name=host_name)
+        if with_instances:
+            query = query.options(orm.joinedload('instances'))
         try:
             return query.one()
         except NoResultFound:
             raise exception.HostNotFound(host_name=host_name)
 
-    def host_update(self, context, host_name, updates):
+    def host_update(self, context, host_name, updates,
+                    expected_version=None):
         if 'id' in updates:
             msg = _("Cannot overwrite id for an existing Host.")
             raise exception.InvalidParameterValue(err=msg)
 
-        return self._do_update_host(context, host_name, updates)
+        return self._do_update_host(context, host_name, updates,
+                                    expected_version)
 
-    @oslo_db_api.retry_on_deadlock
-    def _do_update_host(self, context, host_name, updates):
+    @_retry_on_stale_data
+    def _do_update_host(self, context, host_name, updates,
+                        expected_version=None):
         with _session_for_write():
             query = model_query(
-                context, models.Hosts).options(
-                orm.joinedload('instances')).filter_by(host_name=host_name)
+                context, models.Hosts).filter_by(host_name=host_name)
             try:
-                ref = query.with_lockmode('update').one()
+                ref = query.one()
             except NoResultFound:
                 raise exception.HostNotFound(host_name=host_name)
 
+            _check_version(ref, expected_version, 'Host', host_name)
             ref.update(updates)
         return ref
 
@@ -232,19 +501,24 @@ class Connection(api.Connection):
                     host_name=values['host_name'])
             return host
 
-    @oslo_db_api.retry_on_deadlock
-    def instance_update(self, context, uuid, updates):
+    @_retry_on_stale_data
+    def instance_update(self, context, uuid, updates, expected_version=None):
         """Update instance by uuid."""
-        with _session_for_write():
+        with _session_for_write() as session:
             query = model_query(context,
                                 models.Instance).filter_by(
                                 uuid=uuid)
             try:
-                ref = query.with_lockmode('update').one()
+                ref = query.one()
             except NoResultFound:
                 raise exception.InstanceNotFound(reason=uuid)
 
+            _check_version(ref, expected_version, 'Instance', uuid)
             ref.update(updates)
+            if 'host' in updates or 'cpu_mappings' in updates:
+                _replace_vcpu_pins(context, session, [uuid], [ref])
+            if 'host' in updates:
+                _delete_cpu_claims(context, [uuid], keep_host=ref.host)
         return ref
 
     @oslo_db_api.retry_on_deadlock
@@ -259,8 +533,77 @@ class Connection(api.Connection):
             except db_exc.DBDuplicateEntry:
                 raise exception.InstanceAlreadyExists(
                     uuid=values['uuid'])
+            _replace_vcpu_pins(context, session, None, [instance])
             return instance
 
+    @_retry_on_stale_data
+    def instance_bulk_upsert(self, context, host, instances, removed=None):
+        reported = dict((values['uuid'], values) for values in instances)
+        if removed is not None and not reported and not removed:
+            return
+
+        with _session_for_write() as session:
+            query = model_query(context, models.Instance)
+            if removed is None:
+                query = query.filter(sql.or_(
+                    models.Instance.host == host,
+                    models.Instance.uuid.in_(list(reported))))
+            else:
+                query = query.filter(models.Instance.uuid.in_(
+                    list(reported) + list(removed)))
+
+            # Instances whose pin rows are replaced, and the rows of
+            # those still on a host.
+            changed = set()
+            pinned = []
+            # Instances gone from the host and moved to it, whose CPU
+            # claims on other hosts are released.
+            deleted = set()
+            moved = set()
+            for ref in query.all():
+                values = reported.pop(ref.uuid, None)
+                if values is None:
+                    # Only drop the row if the instance has not been
+                    # reported by another host in the meantime.
+                    if ref.host == host:
+                        session.delete(ref)
+                        changed.add(ref.uuid)
+                        deleted.add(ref.uuid)
+                    continue
+                updates = dict((key, value) for key, value in values.items()
+                               if ref[key] != value)
+                if updates:
+                    ref.update(updates)
+                    if 'host' in updates or 'cpu_mappings' in updates:
+                        changed.add(ref.uuid)
+                        pinned.append(ref)
+                    if 'host' in updates:
+                        moved.add(ref.uuid)
+
+            for values in reported.values():
+                instance = models.Instance()
+                instance.update(values)
+                session.add(instance)
+                changed.add(instance.uuid)
+                pinned.append(instance)
+            session.flush()
+            _replace_vcpu_pins(context, session, changed, pinned)
+            _delete_cpu_claims(context, deleted)
+            _delete_cpu_claims(context, moved, keep_host=host)
+
+    @oslo_db_api.retry_on_deadlock
+    def instance_destroy(self, context, uuid):
+        with _session_for_write():
+            query = model_query(context,
+                                models.Instance).filter_by(
+                                uuid=uuid)
+            count = query.delete()
+            if count != 1:
+                raise exception.InstanceNotFound(reason=uuid)
+            model_query(context, models.InstanceVCPUPin).filter_by(
+                instance_uuid=uuid).delete()
+            _delete_cpu_claims(context, [uuid])
+
     @oslo_db_api.retry_on_deadlock
     def instance_get(self, context, uuid):
         query = model_query(
@@ -287,3 +630,68 @@ class Connection(api.Connection):
             output.append(data)
 
         return output
+
+    def instance_count_by_host_names(self, context, host_names):
+        host_names = list(host_names)
+        counts = dict((host_name, 0) for host_name in host_names)
+        if not host_names:
+            return counts
+        query = model_query(
+            context, models.Instance, models.Instance.host,
+            sql.func.count(models.Instance.uuid)).filter(
+            models.Instance.host.in_(host_names)).group_by(
+            models.Instance.host)
+        counts.update(query.all())
+        return counts
+
+    def vcpu_pin_get_by_pcpus(self, context, host, pcpus):
+        query = model_query(context, models.InstanceVCPUPin).filter_by(
+            host=host).filter(models.InstanceVCPUPin.pcpu.in_(list(pcpus)))
+        return query.order_by(models.InstanceVCPUPin.pcpu,
+                              models.InstanceVCPUPin.instance_uuid,
+                              models.InstanceVCPUPin.vcpu).all()
+
+    def vcpu_pin_get_pcpu_usage(self, context, hosts, exclude_uuid=None):
+        hosts = list(hosts)
+        usage = dict((host, {}) for host in hosts)
+        if not hosts:
+            return usage
+        query = model_query(
+            context, models.InstanceVCPUPin, models.InstanceVCPUPin.host,
+            models.InstanceVCPUPin.pcpu,
+            sql.func.count(models.InstanceVCPUPin.id)).filter(
+            models.InstanceVCPUPin.host.in_(hosts))
+        if exclude_uuid is not None:
+            query = query.filter(
+                models.InstanceVCPUPin.instance_uuid != exclude_uuid)
+        query = query.group_by(models.InstanceVCPUPin.host,
+                               models.InstanceVCPUPin.pcpu)
+        for host, pcpu, count in query.all():
+            usage[host][pcpu] = count
+        return usage
+
+    @oslo_db_api.retry_on_deadlock
+    def cpu_claim_replace(self, context, instance_uuid, host, claims):
+        try:
+            with _session_for_write() as session:
+                _delete_cpu_claims(context, [instance_uuid])
+                session.bulk_insert_mappings(
+                    models.InstanceCPUClaim,
+                    [{'host': host, 'pcpu': claim['pcpu'],
+                      'instance_uuid': instance_uuid, 'vcpu': claim['vcpu']}
+                     for claim in claims])
+        except db_exc.DBDuplicateEntry:
+            raise exception.CPUClaimConflict(host=host, uuid=instance_uuid)
+
+    @oslo_db_api.retry_on_deadlock
+    def cpu_claim_destroy(self, context, instance_uuid):
+        with _session_for_write():
+            _delete_cpu_claims(context, [instance_uuid])
+
+    def cpu_claim_get_pcpus(self, context, host, exclude_uuid=None):
+        query = model_query(context, models.InstanceCPUClaim,
+                            models.InstanceCPUClaim.pcpu).filter_by(host=host)
+        if exclude_uuid is not None:
+            query = query.filter(
+                models.InstanceCPUClaim.instance_uuid != exclude_uuid)
+        return [row[0] for row in query.all()]
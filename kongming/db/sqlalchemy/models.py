@@ -21,6 +21,7 @@ from oslo_db.sqlalchemy import types as db_types
 import six.moves.urllib.parse as urlparse
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy import Column, String, Integer, Boolean, ForeignKey, Index
+from sqlalchemy import DateTime
 from sqlalchemy import orm
 from sqlalchemy import schema
 from sqlalchemy import Text
@@ -62,6 +63,9 @@ class InstanceCPUMapping(Base):
     __table_args__ = (
         schema.UniqueConstraint('instance_uuid',
                                 name='uniq_mappings0instance_uuid'),
+        Index('instance_cpu_mappings_host_idx', 'host', 'id'),
+        Index('instance_cpu_mappings_status_idx', 'status', 'id'),
+        Index('instance_cpu_mappings_project_id_idx', 'project_id', 'id'),
         table_args()
     )
 
@@ -71,7 +75,40 @@ class InstanceCPUMapping(Base):
     user_id = Column(String(36), nullable=False)
     host = Column(String(255), nullable=True)
     status = Column(String(255), nullable=True)
-    cpu_mappings = Column(String(255), nullable=True)
+    cpu_mappings = Column(Text, nullable=True)
+    version = Column(Integer, nullable=False, default=0, server_default='0')
+    # Every UPDATE of a versioned row increments its version and only
+    # matches the row if its version did not change since it has been
+    # read, see the DB API.
+    __mapper_args__ = {'version_id_col': version}
+
+
+class MappingOperation(Base):
+    """Represents an operation applying an InstanceCPUMapping."""
+
+    __tablename__ = 'mapping_operations'
+    __table_args__ = (
+        schema.UniqueConstraint('uuid',
+                                name='uniq_mapping_operations0uuid'),
+        Index('mapping_operations_instance_uuid_idx', 'instance_uuid'),
+        Index('mapping_operations_finished_at_idx', 'finished_at'),
+        Index('mapping_operations_conductor_status_idx', 'conductor',
+              'status'),
+        table_args()
+    )
+
+    id = Column(Integer, primary_key=True)
+    uuid = Column(String(36), nullable=False)
+    instance_uuid = Column(String(36), nullable=False)
+    project_id = Column(String(36), nullable=False)
+    user_id = Column(String(36), nullable=False)
+    action = Column(String(36), nullable=False)
+    status = Column(String(36), nullable=False)
+    cpu_mappings = Column(Text, nullable=True)
+    error = Column(Text, nullable=True)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    conductor = Column(String(255), nullable=True)
 
 
 class Hosts(Base):
@@ -87,6 +124,10 @@ class Hosts(Base):
     id = Column(Integer, primary_key=True)
     host_name = Column(String(255), nullable=True)
     cpu_topology = Column(db_types.JsonEncodedDict)
+    instance_generation = Column(Integer, nullable=False, default=0,
+                                 server_default='0')
+    version = Column(Integer, nullable=False, default=0, server_default='0')
+    __mapper_args__ = {'version_id_col': version}
 
 
 class Instance(Base):
@@ -96,6 +137,7 @@ class Instance(Base):
     __table_args__ = (
         schema.UniqueConstraint('uuid',
                                 name='uniq_instances0uuid'),
+        Index('instances_host_idx', 'host'),
         table_args()
     )
 
@@ -103,8 +145,55 @@ class Instance(Base):
     host = Column(String(255), nullable=True)
     status = Column(String(255), nullable=True)
     cpu_mappings = Column(db_types.JsonEncodedDict)
+    version = Column(Integer, nullable=False, default=0, server_default='0')
+    __mapper_args__ = {'version_id_col': version}
     host_ = orm.relationship(
         Hosts,
         backref=orm.backref('instances', uselist=True),
         foreign_keys=host,
         primaryjoin='Hosts.host_name == Instance.host')
+
+
+class InstanceVCPUPin(Base):
+    """Represents the pinning of a vCPU of an Instance to a host CPU.
+
+    The rows are derived from the cpu_mappings of the instances, one row
+    per pinned vCPU and host CPU, so that the instances using a host CPU
+    and the occupancy of the host CPUs can be queried by index.
+    """
+
+    __tablename__ = 'instance_vcpu_pins'
+    __table_args__ = (
+        Index('instance_vcpu_pins_host_pcpu_idx', 'host', 'pcpu'),
+        Index('instance_vcpu_pins_instance_uuid_idx', 'instance_uuid'),
+        table_args()
+    )
+
+    id = Column(Integer, primary_key=True)
+    host = Column(String(255), nullable=False)
+    pcpu = Column(Integer, nullable=False)
+    instance_uuid = Column(String(36), nullable=False)
+    vcpu = Column(Integer, nullable=False)
+
+
+class InstanceCPUClaim(Base):
+    """Represents a host CPU claimed by the automatic mapping of an Instance.
+
+    The conductor writes the claims in the transaction resolving an
+    automatic mapping, before the agent pins the instance. A host CPU can
+    only be claimed once, concurrent placements of the same CPUs conflict.
+    """
+
+    __tablename__ = 'instance_cpu_claims'
+    __table_args__ = (
+        schema.UniqueConstraint('host', 'pcpu',
+                                name='uniq_instance_cpu_claims0host0pcpu'),
+        Index('instance_cpu_claims_instance_uuid_idx', 'instance_uuid'),
+        table_args()
+    )
+
+    id = Column(Integer, primary_key=True)
+    host = Column(String(255), nullable=False)
+    pcpu = Column(Integer, nullable=False)
+    instance_uuid = Column(String(36), nullable=False)
+    vcpu = Column(Integer, nullable=False)
@@ -28,3 +28,6 @@ def register_all():
     __import__('kongming.objects.instance_cpu_mapping')
     __import__('kongming.objects.instance')
     __import__('kongming.objects.host')
+    __import__('kongming.objects.mapping_operation')
+    __import__('kongming.objects.vcpu_pin')
+    __import__('kongming.objects.cpu_claim')
@@ -12,14 +12,22 @@
 
 """Kongming common internal object model"""
 
+import datetime
+
+import iso8601
 import netaddr
+from oslo_log import log as logging
 from oslo_utils import versionutils
 from oslo_versionedobjects import base as object_base
 
+from kongming.common import exception
 from kongming import objects
 from kongming.objects import fields as object_fields
 
 
+LOG = logging.getLogger(__name__)
+
+
 class KongmingObjectRegistry(object_base.VersionedObjectRegistry):
     notification_classes = []
 
@@ -76,9 +84,10 @@ class KongmingObject(object_base.VersionedObject):
     }
 
     def as_dict(self):
+        # Attributes which are not loaded are skipped, not lazy-loaded.
         return dict((k, getattr(self, k))
                     for k in self.fields
-                    if hasattr(self, k))
+                    if self.obj_attr_is_set(k))
 
     def obj_refresh(self, loaded_object):
         """Applies updates for objects that inherit from base. KongmingObject.
@@ -123,6 +132,53 @@ class KongmingObject(object_base.VersionedObject):
                 for db_obj in db_objects]
 
 
+class CompareAndSwapMixin(object):
+    """Mixin of the objects saved with a compare and swap on their version.
+
+    The objects have a version field, their save() only updates the row if
+    its version is the expected one, and they implement refresh() to reload
+    themselves from the DB, dropping their pending changes.
+    """
+
+    def _get_expected_version(self):
+        """Return the version to compare and swap on save, if known."""
+        if self.obj_attr_is_set('version'):
+            return self.version
+        return None
+
+    def save_with_retry(self, context=None, unless_changed=(), attempts=5):
+        """Save the pending changes, retrying on concurrent updates.
+
+        The object is only saved if it did not change in the DB since it
+        has been read. When it did, the object is reloaded and its pending
+        changes are applied again and saved.
+
+        :param unless_changed: fields whose concurrent update makes the
+                               pending changes obsolete, they are then
+                               dropped.
+        :param attempts: number of saves to try.
+        :returns: False if the changes have been dropped, True otherwise.
+        :raises: ConcurrentUpdate if the last attempt failed.
+        """
+        changes = self.obj_get_changes()
+        for attempt in range(1, attempts + 1):
+            try:
+                self.save(context)
+                return True
+            except exception.ConcurrentUpdate as e:
+                if attempt == attempts:
+                    raise
+                LOG.debug('Retry the update of %(obj)s: %(error)s',
+                          {'obj': self.obj_name(), 'error': e})
+
+            read = dict((name, self[name]) for name in unless_changed)
+            self.refresh(context)
+            if any(self[name] != value for name, value in read.items()):
+                return False
+            for name, value in changes.items():
+                self[name] = value
+
+
 class KongmingObjectSerializer(object_base.VersionedObjectSerializer):
     # Base class to use for object hydration
     OBJ_BASE_CLASS = KongmingObject
@@ -143,3 +199,27 @@ class ObjectListBase(object_base.ObjectListBase):
         else:
             return primitive.get(key, default)
 
+
+class ReadOnlyRecord(object):
+    """A read only record of some columns of a DB row.
+
+    The list API calls read records instead of objects, skipping the
+    coercion and the change tracking of every field. Records can not be
+    saved nor sent over RPC, subclasses list the columns to read in their
+    __slots__.
+    """
+
+    __slots__ = ()
+
+    def __init__(self, db_row):
+        for name in self.__slots__:
+            value = getattr(db_row, name)
+            if (isinstance(value, datetime.datetime) and
+                    value.utcoffset() is None):
+                # Like the DateTimeField of the objects.
+                value = value.replace(tzinfo=iso8601.UTC)
+            setattr(self, name, value)
+
+    @classmethod
+    def from_db_rows(cls, db_rows):
+        return [cls(db_row) for db_row in db_rows]
@@ -0,0 +1,89 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from oslo_log import log as logging
+from oslo_versionedobjects import base as object_base
+
+from kongming.common import cpuset
+from kongming.db import api as dbapi
+from kongming.objects import base
+from kongming.objects import fields as object_fields
+
+
+LOG = logging.getLogger(__name__)
+
+
+@base.KongmingObjectRegistry.register
+class InstanceCPUClaim(base.KongmingObject,
+                       object_base.VersionedObjectDictCompat):
+    """A host CPU claimed by the automatic mapping of an instance.
+
+    The claims hold the CPUs of an automatic mapping from its placement by
+    the conductor until the mapping or the instance is deleted, whether or
+    not the agent has pinned the instance yet.
+    """
+
+    # Version 1.0: Initial version
+    VERSION = '1.0'
+
+    dbapi = dbapi.get_instance()
+
+    fields = {
+        'host': object_fields.StringField(nullable=False),
+        'pcpu': object_fields.IntegerField(nullable=False),
+        'instance_uuid': object_fields.UUIDField(nullable=False),
+        'vcpu': object_fields.IntegerField(nullable=False),
+    }
+
+
+@base.KongmingObjectRegistry.register
+class InstanceCPUClaimList(base.ObjectListBase,
+                           base.KongmingObject,
+                           object_base.VersionedObjectDictCompat):
+    # Version 1.0: Initial Version
+    VERSION = '1.0'
+
+    dbapi = dbapi.get_instance()
+
+    fields = {
+        'objects': object_fields.ListOfObjectsField('InstanceCPUClaim'),
+    }
+
+    @classmethod
+    def claim(cls, context, host, instance_uuid, cpu_mappings):
+        """Claim the host CPUs of a resolved mapping for an instance.
+
+        The previous claims of the instance are replaced.
+
+        :param cpu_mappings: a per-vCPU pinning spec, e.g. "0:4;1:5".
+        :raises: CPUClaimConflict if another instance has claimed one of
+                 the host CPUs.
+        """
+        claims = [{'vcpu': vcpu, 'pcpu': pcpu}
+                  for vcpu, cpus in cpuset.parse_vcpu_pinning(
+                      cpu_mappings).items()
+                  for pcpu in cpus]
+        cls.dbapi.cpu_claim_replace(context, instance_uuid, host, claims)
+
+    @classmethod
+    def release(cls, context, instance_uuid):
+        """Release the host CPUs claimed by an instance."""
+        cls.dbapi.cpu_claim_destroy(context, instance_uuid)
+
+    @classmethod
+    def get_claimed_cpus(cls, context, host, exclude_uuid=None):
+        """Return the CPUSet of the host CPUs claimed by instances.
+
+        :param exclude_uuid: uuid of an instance whose claims are ignored.
+        """
+        return cpuset.CPUSet(
+            cls.dbapi.cpu_claim_get_pcpus(context, host, exclude_uuid))
@@ -18,6 +18,9 @@ import six
 
 from oslo_versionedobjects import fields as object_fields
 
+from kongming.common import cpuset
+from kongming.common import topology
+
 
 # Import fields from oslo_versionedobjects
 IntegerField = object_fields.IntegerField
@@ -50,4 +53,36 @@ class FlexibleDictField(object_fields.AutoTypedField):
     def _null(self, obj, attr):
         if self.nullable:
             return {}
-        super(FlexibleDictField, self)._null(obj, attr)
\ No newline at end of file
+        super(FlexibleDictField, self)._null(obj, attr)
+
+
+class CPUTopology(FlexibleDict):
+    """A host cpu topology, see kongming.common.topology.
+
+    The groups of CPUs are coerced to cpuset strings, topologies with
+    lists of CPU ids read from older rows or agents are compacted.
+    """
+
+    @staticmethod
+    def coerce(obj, attr, value):
+        return topology.compact(FlexibleDict.coerce(obj, attr, value))
+
+
+class CPUTopologyField(FlexibleDictField):
+    AUTO_TYPE = CPUTopology()
+
+
+class VCPUPinning(FlexibleDict):
+    """A dict mapping the vCPU ids of an instance to cpuset strings.
+
+    The cpumap lists of booleans read from older rows or agents are
+    coerced to cpuset strings.
+    """
+
+    @staticmethod
+    def coerce(obj, attr, value):
+        return cpuset.encode_vcpu_cpus(FlexibleDict.coerce(obj, attr, value))
+
+
+class VCPUPinningField(FlexibleDictField):
+    AUTO_TYPE = VCPUPinning()
@@ -13,8 +13,11 @@
 #    under the License.
 
 from oslo_log import log as logging
+from oslo_utils import versionutils
 from oslo_versionedobjects import base as object_base
 
+from kongming.common import exception
+from kongming.common import topology
 from kongming.db import api as dbapi
 from kongming import objects
 from kongming.objects import base
@@ -27,24 +30,45 @@ OPTIONAL_ATTRS = ['instances']
 
 
 @base.KongmingObjectRegistry.register
-class Host(base.KongmingObject, object_base.VersionedObjectDictCompat):
+class Host(base.CompareAndSwapMixin, base.KongmingObject,
+           object_base.VersionedObjectDictCompat):
     # Version 1.0: Initial version
-    VERSION = '1.0'
+    # Version 1.1: Add instance_generation field
+    # Version 1.2: cpu_topology holds cpuset strings instead of lists, and
+    #              Instance version 1.1
+    # Version 1.3: Add version field and Instance version 1.2
+    VERSION = '1.3'
 
     dbapi = dbapi.get_instance()
 
     fields = {
         'id': object_fields.IntegerField(),
         'host_name': object_fields.StringField(nullable=True),
-        'cpu_topology': object_fields.FlexibleDictField(
-            nullable=True),
+        'cpu_topology': object_fields.CPUTopologyField(nullable=True),
+        'instance_generation': object_fields.IntegerField(),
+        'version': object_fields.IntegerField(),
         'instances': object_fields.ListOfObjectsField(
             'Instance', nullable=True)
     }
 
+    obj_relationships = {
+        'instances': [('1.0', '1.0'), ('1.2', '1.1'), ('1.3', '1.2')],
+    }
+
     def __init__(self, context=None, **kwargs):
         super(Host, self).__init__(context=context, **kwargs)
 
+    def obj_make_compatible(self, primitive, target_version):
+        super(Host, self).obj_make_compatible(primitive, target_version)
+        target_version = versionutils.convert_version_to_tuple(target_version)
+        if target_version < (1, 3):
+            primitive.pop('version', None)
+        if target_version < (1, 2) and primitive.get('cpu_topology'):
+            primitive['cpu_topology'] = topology.expand(
+                primitive['cpu_topology'])
+        if target_version < (1, 1):
+            primitive.pop('instance_generation', None)
+
     @staticmethod
     def _from_db_object(context, host, db_host, expected_attrs=None):
         if expected_attrs is None:
@@ -58,11 +82,29 @@ class Host(base.KongmingObject, object_base.VersionedObjectDictCompat):
                 host[name] = value
 
         if 'instances' in expected_attrs:
-            host._load_instances(host._context, host.host_name)
+            # The instances have been loaded with the host row.
+            host.instances = objects.Instance._from_db_object_list(
+                db_host['instances'], objects.Instance, context)
 
         host.obj_reset_changes()
         return host
 
+    def obj_load_attr(self, attrname):
+        """Load the instances of the host on first access.
+
+        Loading them with the host, through expected_attrs, saves a query
+        when they are known to be needed.
+        """
+        if attrname not in OPTIONAL_ATTRS:
+            raise exception.ObjectActionError(
+                action='obj_load_attr',
+                reason='attribute %s can not be loaded' % attrname)
+        LOG.debug('Lazy-loading %(attr)s of host %(host)s',
+                  {'attr': attrname, 'host': self.host_name})
+        self.instances = objects.Instance.get_instances_by_host_name(
+            self._context, self.host_name)
+        self.obj_reset_changes([attrname])
+
     @staticmethod
     def _from_db_object_list(db_objects, cls, context, expect_attrs=None):
         """Converts a list of database entities to a list of formal objects"""
@@ -71,21 +113,48 @@ class Host(base.KongmingObject, object_base.VersionedObjectDictCompat):
             context, cls(context), obj, expected_attrs=expect_attrs)
             for obj in db_objects]
 
-    def _load_instances(self, context, host_name):
-        self.instances = objects.Instance.get_instances_by_host_name(
-            context=context, host_name=host_name)
-
     @classmethod
-    def list(cls, context):
-        """Return a list of Mapping objects."""
-        db_hosts = cls.dbapi.host_list(context)
+    def list(cls, context, limit=None, marker=None, sort_key=None,
+             sort_dir=None, expected_attrs=None):
+        """Return a list of Host objects.
+
+        :param limit: maximum number of hosts to return.
+        :param marker: host_name of the last host of the previous page.
+        :param sort_key: column to sort results by.
+        :param sort_dir: direction to sort. "asc" or "desc".
+        :param expected_attrs: optional attributes to load, the instances
+                               of all the hosts are loaded in one query.
+        """
+        db_hosts = cls.dbapi.host_list(
+            context, limit=limit, marker=marker, sort_key=sort_key,
+            sort_dir=sort_dir,
+            with_instances='instances' in (expected_attrs or []))
         return Host._from_db_object_list(
-            db_hosts, cls, context)
+            db_hosts, cls, context, expect_attrs=expected_attrs)
+
+    @classmethod
+    def list_records(cls, context, limit=None, marker=None, sort_key=None,
+                     sort_dir=None):
+        """Return a list of read only HostRecords, without instances.
+
+        Takes the same parameters as list(), for the list API calls.
+        """
+        db_rows = cls.dbapi.host_list(
+            context, limit=limit, marker=marker, sort_key=sort_key,
+            sort_dir=sort_dir, with_instances=False,
+            columns=HostRecord.__slots__)
+        return HostRecord.from_db_rows(db_rows)
 
     @classmethod
     def get(cls, context, host_name, expected_attrs=None):
-        """Find a Mapping and return a Mapping object."""
-        db_host = cls.dbapi.host_get_by_name(context, host_name)
+        """Find a host by name and return a Host object.
+
+        :param expected_attrs: optional attributes to load with the host,
+                               the others are loaded on first access.
+        """
+        db_host = cls.dbapi.host_get_by_name(
+            context, host_name,
+            with_instances='instances' in (expected_attrs or []))
         host = Host._from_db_object(
             context, cls(context), db_host, expected_attrs)
         return host
@@ -102,8 +171,33 @@ class Host(base.KongmingObject, object_base.VersionedObjectDictCompat):
         self.obj_reset_changes()
 
     def save(self, context=None):
+        """Save the changes of the Host.
+
+        :raises: ConcurrentUpdate if the host has been updated since it has
+                 been read, see save_with_retry().
+        """
         updates = self.obj_get_changes()
+        updates.pop('version', None)
 
         if updates:
-            self.dbapi.host_update(
-                context, self.host_name, updates)
+            db_host = self.dbapi.host_update(
+                context, self.host_name, updates,
+                expected_version=self._get_expected_version())
+            self.version = db_host['version']
+            self.obj_reset_changes()
+
+    def refresh(self, context=None):
+        current = self.get(context, self.host_name)
+        self.obj_refresh(current)
+        self.obj_reset_changes()
+
+
+class HostRecord(base.ReadOnlyRecord):
+    """The columns of a Host shown by the API."""
+
+    __slots__ = ('host_name', 'cpu_topology', 'created_at', 'updated_at')
+
+    def __init__(self, db_row):
+        super(HostRecord, self).__init__(db_row)
+        # Like the CPUTopologyField of the objects.
+        self.cpu_topology = topology.compact(self.cpu_topology or {})
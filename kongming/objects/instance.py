@@ -13,8 +13,10 @@
 #    under the License.
 
 from oslo_log import log as logging
+from oslo_utils import versionutils
 from oslo_versionedobjects import base as object_base
 
+from kongming.common import cpuset
 from kongming.db import api as dbapi
 from kongming.objects import base
 from kongming.objects import fields as object_fields
@@ -23,10 +25,12 @@ LOG = logging.getLogger(__name__)
 
 
 @base.KongmingObjectRegistry.register
-class Instance(base.KongmingObject,
+class Instance(base.CompareAndSwapMixin, base.KongmingObject,
                object_base.VersionedObjectDictCompat):
     # Version 1.0: Initial version
-    VERSION = '1.0'
+    # Version 1.1: cpu_mappings holds cpuset strings instead of cpumaps
+    # Version 1.2: Add version field
+    VERSION = '1.2'
 
     dbapi = dbapi.get_instance()
 
@@ -34,13 +38,22 @@ class Instance(base.KongmingObject,
         'uuid': object_fields.UUIDField(nullable=True),
         'status': object_fields.StringField(nullable=True),
         'host': object_fields.StringField(nullable=True),
-        'cpu_mappings': object_fields.FlexibleDictField(
-            nullable=True),
+        'cpu_mappings': object_fields.VCPUPinningField(nullable=True),
+        'version': object_fields.IntegerField(),
     }
 
     def __init__(self, context=None, **kwargs):
         super(Instance, self).__init__(context=context, **kwargs)
 
+    def obj_make_compatible(self, primitive, target_version):
+        super(Instance, self).obj_make_compatible(primitive, target_version)
+        target_version = versionutils.convert_version_to_tuple(target_version)
+        if target_version < (1, 2):
+            primitive.pop('version', None)
+        if target_version < (1, 1) and primitive.get('cpu_mappings'):
+            primitive['cpu_mappings'] = cpuset.decode_vcpu_cpumaps(
+                primitive['cpu_mappings'])
+
     @staticmethod
     def _from_db_object(context, instance, db_instance, expected_attrs=None):
         if expected_attrs is None:
@@ -83,6 +96,11 @@ class Instance(base.KongmingObject,
             context, host_name)
         return Instance._from_db_object_list(db_instances, cls, context)
 
+    @classmethod
+    def count_by_host_names(cls, context, host_names):
+        """Return a dict mapping host names to their number of instances."""
+        return cls.dbapi.instance_count_by_host_names(context, host_names)
+
     def create(self, context=None):
         """Create a Mapping record in the DB."""
         values = self.obj_get_changes()
@@ -95,11 +113,25 @@ class Instance(base.KongmingObject,
         self.obj_reset_changes()
 
     def save(self, context=None):
+        """Save the changes of the Instance.
+
+        :raises: ConcurrentUpdate if the instance has been updated since it
+                 has been read, see save_with_retry().
+        """
         updates = self.obj_get_changes()
+        updates.pop('version', None)
 
         if updates:
-            self.dbapi.instance_update(
-                context, self.uuid, updates)
+            db_instance = self.dbapi.instance_update(
+                context, self.uuid, updates,
+                expected_version=self._get_expected_version())
+            self.version = db_instance['version']
+            self.obj_reset_changes()
+
+    def refresh(self, context=None):
+        current = self.get(context, self.uuid)
+        self.obj_refresh(current)
+        self.obj_reset_changes()
 
 
 @base.KongmingObjectRegistry.register
@@ -107,10 +139,34 @@ class InstanceList(base.ObjectListBase,
                    base.KongmingObject,
                    object_base.VersionedObjectDictCompat):
     # Version 1.0: Initial Version
-    VERSION = '1.0'
+    # Version 1.1: Instance version 1.1
+    # Version 1.2: Instance version 1.2
+    VERSION = '1.2'
 
     dbapi = dbapi.get_instance()
 
     fields = {
         'objects': object_fields.ListOfObjectsField('Instance'),
     }
+
+    child_versions = {
+        '1.0': '1.0',
+        '1.1': '1.1',
+        '1.2': '1.2',
+    }
+
+    @classmethod
+    def bulk_upsert(cls, context, host, instances, removed=None):
+        """Reconcile the instances reported by a host in one transaction.
+
+        :param host: name of the reporting host.
+        :param instances: Instance objects reported by the host.
+        :param removed: uuids of the instances removed from the host, if
+                        None every other instance of the host is removed.
+        """
+        values = [dict((name, instance[name]) for name in instance.fields
+                       if name not in ('created_at', 'updated_at',
+                                       'version') and
+                       instance.obj_attr_is_set(name))
+                  for instance in instances]
+        cls.dbapi.instance_bulk_upsert(context, host, values, removed)
@@ -14,6 +14,7 @@
 #    under the License.
 
 from oslo_log import log as logging
+from oslo_utils import versionutils
 from oslo_versionedobjects import base as object_base
 
 from kongming.db import api as dbapi
@@ -25,10 +26,11 @@ LOG = logging.getLogger(__name__)
 
 
 @base.KongmingObjectRegistry.register
-class InstanceCPUMapping(base.KongmingObject,
+class InstanceCPUMapping(base.CompareAndSwapMixin, base.KongmingObject,
                          object_base.VersionedObjectDictCompat):
     # Version 1.0: Initial version
-    VERSION = '1.0'
+    # Version 1.1: Add version field
+    VERSION = '1.1'
 
     dbapi = dbapi.get_instance()
 
@@ -39,13 +41,21 @@ class InstanceCPUMapping(base.KongmingObject,
         'user_id': object_fields.UUIDField(nullable=False),
         'cpu_mappings': object_fields.StringField(nullable=True),
         'host': object_fields.StringField(nullable=True),
-        'status': object_fields.StringField(nullable=True)
+        'status': object_fields.StringField(nullable=True),
+        'version': object_fields.IntegerField(),
     }
 
     def __init__(self, *args, **kwargs):
         super(InstanceCPUMapping, self).__init__(*args, **kwargs)
         self._orig_projects = {}
 
+    def obj_make_compatible(self, primitive, target_version):
+        super(InstanceCPUMapping, self).obj_make_compatible(
+            primitive, target_version)
+        target_version = versionutils.convert_version_to_tuple(target_version)
+        if target_version < (1, 1):
+            primitive.pop('version', None)
+
     @staticmethod
     def _from_db_object(context, mapping, db_mapping, expected_attrs=None):
         if expected_attrs is None:
@@ -68,12 +78,38 @@ class InstanceCPUMapping(base.KongmingObject,
                 for obj in db_objects]
 
     @classmethod
-    def list(cls, context):
-        """Return a list of Mapping objects."""
-        db_mappings = cls.dbapi.instance_cpu_mapping_list(context)
+    def list(cls, context, limit=None, marker=None, sort_key=None,
+             sort_dir=None, filters=None, project_only=True):
+        """Return a list of Mapping objects.
+
+        :param limit: maximum number of mappings to return.
+        :param marker: instance_uuid of the last mapping of the previous
+                       page.
+        :param sort_key: column to sort results by.
+        :param sort_dir: direction to sort. "asc" or "desc".
+        :param filters: dict of column values to filter the mappings by.
+        :param project_only: only return the mappings of the context
+                             project.
+        """
+        db_mappings = cls.dbapi.instance_cpu_mapping_list(
+            context, limit=limit, marker=marker, sort_key=sort_key,
+            sort_dir=sort_dir, filters=filters, project_only=project_only)
         return InstanceCPUMapping._from_db_object_list(
             db_mappings, cls, context)
 
+    @classmethod
+    def list_records(cls, context, limit=None, marker=None, sort_key=None,
+                     sort_dir=None, filters=None, project_only=True):
+        """Return a list of read only InstanceCPUMappingRecords.
+
+        Takes the same parameters as list(), for the list API calls.
+        """
+        db_rows = cls.dbapi.instance_cpu_mapping_list(
+            context, limit=limit, marker=marker, sort_key=sort_key,
+            sort_dir=sort_dir, filters=filters, project_only=project_only,
+            columns=InstanceCPUMappingRecord.__slots__)
+        return InstanceCPUMappingRecord.from_db_rows(db_rows)
+
     @classmethod
     def get(cls, context, mapping_uuid):
         """Find a Mapping and return a Mapping object."""
@@ -94,8 +130,87 @@ class InstanceCPUMapping(base.KongmingObject,
         self.obj_reset_changes()
 
     def save(self, context=None):
+        """Save the changes of the Mapping.
+
+        :raises: ConcurrentUpdate if the mapping has been updated since it
+                 has been read, see save_with_retry().
+        """
         updates = self.obj_get_changes()
+        updates.pop('version', None)
 
         if updates:
-            self.dbapi.instance_cpu_mapping_update(
-                context, self.instance_uuid, updates)
+            db_mapping = self.dbapi.instance_cpu_mapping_update(
+                context, self.instance_uuid, updates,
+                expected_version=self._get_expected_version())
+            self.version = db_mapping['version']
+            self.obj_reset_changes()
+
+    def refresh(self, context=None):
+        current = self.get(context, self.instance_uuid)
+        self.obj_refresh(current)
+        self.obj_reset_changes()
+
+
+class InstanceCPUMappingRecord(base.ReadOnlyRecord):
+    """The columns of a Mapping shown by the API."""
+
+    __slots__ = ('instance_uuid', 'project_id', 'user_id', 'cpu_mappings',
+                 'host', 'status', 'created_at', 'updated_at')
+
+
+@base.KongmingObjectRegistry.register
+class InstanceCPUMappingList(base.ObjectListBase,
+                             base.KongmingObject,
+                             object_base.VersionedObjectDictCompat):
+    # Version 1.0: Initial Version
+    VERSION = '1.0'
+
+    dbapi = dbapi.get_instance()
+
+    fields = {
+        'objects': object_fields.ListOfObjectsField('InstanceCPUMapping'),
+    }
+
+    @staticmethod
+    def _refresh(context, mappings, operations, db_mappings, db_operations):
+        db_mappings = dict((db_mapping['instance_uuid'], db_mapping)
+                           for db_mapping in db_mappings)
+        for mapping in mappings:
+            InstanceCPUMapping._from_db_object(
+                context, mapping, db_mappings[mapping.instance_uuid])
+        for operation, db_operation in zip(operations, db_operations):
+            operation._from_db_object(context, operation, db_operation)
+
+    @classmethod
+    def bulk_create(cls, context, mappings, operations):
+        """Create mappings and their operations in one transaction.
+
+        :param mappings: new InstanceCPUMapping objects.
+        :param operations: new MappingOperation objects of the mappings.
+        """
+        dbapi = cls.dbapi
+        db_mappings, db_operations = dbapi.instance_cpu_mapping_bulk_create(
+            context, [mapping.obj_get_changes() for mapping in mappings],
+            [operation.obj_get_changes() for operation in operations])
+        cls._refresh(context, mappings, operations, db_mappings,
+                     db_operations)
+
+    @classmethod
+    def bulk_save(cls, context, mappings, operations):
+        """Save mappings and create their operations in one transaction.
+
+        :param mappings: InstanceCPUMapping objects with pending changes.
+        :param operations: new MappingOperation objects of the mappings.
+        :raises: ConcurrentUpdate if a mapping has been updated since it
+                 has been read.
+        """
+        dbapi = cls.dbapi
+        db_mappings, db_operations = dbapi.instance_cpu_mapping_bulk_update(
+            context, dict((mapping.instance_uuid, mapping.obj_get_changes())
+                          for mapping in mappings),
+            [operation.obj_get_changes() for operation in operations],
+            expected_versions=dict(
+                (mapping.instance_uuid, mapping._get_expected_version())
+                for mapping in mappings))
+        cls._refresh(context, mappings, operations, db_mappings,
+                     db_operations)
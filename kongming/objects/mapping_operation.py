@@ -0,0 +1,145 @@
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from oslo_log import log as logging
+from oslo_utils import timeutils
+from oslo_utils import versionutils
+from oslo_versionedobjects import base as object_base
+
+from kongming.common import states
+from kongming.db import api as dbapi
+from kongming.objects import base
+from kongming.objects import fields as object_fields
+
+
+LOG = logging.getLogger(__name__)
+
+
+@base.KongmingObjectRegistry.register
+class MappingOperation(base.KongmingObject,
+                       object_base.VersionedObjectDictCompat):
+    """The asynchronous application of an instance cpu mapping."""
+
+    # Version 1.0: Initial version
+    # Version 1.1: Add conductor field
+    VERSION = '1.1'
+
+    dbapi = dbapi.get_instance()
+
+    fields = {
+        'id': object_fields.IntegerField(nullable=False),
+        'uuid': object_fields.UUIDField(nullable=False),
+        'instance_uuid': object_fields.UUIDField(nullable=False),
+        'project_id': object_fields.UUIDField(nullable=False),
+        'user_id': object_fields.UUIDField(nullable=False),
+        'action': object_fields.StringField(nullable=False),
+        'status': object_fields.StringField(nullable=False),
+        'cpu_mappings': object_fields.StringField(nullable=True),
+        'error': object_fields.StringField(nullable=True),
+        'started_at': object_fields.DateTimeField(nullable=True),
+        'finished_at': object_fields.DateTimeField(nullable=True),
+        'conductor': object_fields.StringField(nullable=True),
+        'created_at': object_fields.DateTimeField(nullable=True),
+        'updated_at': object_fields.DateTimeField(nullable=True),
+    }
+
+    def obj_make_compatible(self, primitive, target_version):
+        super(MappingOperation, self).obj_make_compatible(primitive,
+                                                          target_version)
+        target_version = versionutils.convert_version_to_tuple(target_version)
+        if target_version < (1, 1):
+            primitive.pop('conductor', None)
+
+    @staticmethod
+    def _from_db_object(context, operation, db_operation):
+        for name, field in operation.fields.items():
+            value = db_operation[name]
+            if isinstance(field, object_fields.IntegerField):
+                value = value if value is not None else 0
+            operation[name] = value
+
+        operation.obj_reset_changes()
+        return operation
+
+    @classmethod
+    def get(cls, context, uuid):
+        """Find an operation by uuid and return a MappingOperation."""
+        db_operation = cls.dbapi.mapping_operation_get(context, uuid)
+        return MappingOperation._from_db_object(
+            context, cls(context), db_operation)
+
+    @classmethod
+    def get_last(cls, context, instance_uuid):
+        """Return the most recent operation of an instance, or None."""
+        db_operation = cls.dbapi.mapping_operation_get_last(
+            context, instance_uuid)
+        if db_operation is None:
+            return None
+        return MappingOperation._from_db_object(
+            context, cls(context), db_operation)
+
+    @classmethod
+    def get_unfinished(cls, context, conductor):
+        """Return the queued and running operations of a conductor."""
+        db_operations = cls.dbapi.mapping_operation_get_unfinished(
+            context, conductor)
+        return [MappingOperation._from_db_object(
+            context, cls(context), db_operation)
+            for db_operation in db_operations]
+
+    @classmethod
+    def purge(cls, context, finished_before):
+        """Delete the operations finished before a time.
+
+        :returns: the number of deleted operations.
+        """
+        return cls.dbapi.mapping_operation_purge(context, finished_before)
+
+    @property
+    def finished(self):
+        return self.status in states.FINISHED_STATES
+
+    def create(self, context=None):
+        """Create a MappingOperation record in the DB."""
+        values = self.obj_get_changes()
+        db_operation = self.dbapi.mapping_operation_create(context, values)
+        self._from_db_object(context, self, db_operation)
+
+    def save(self, context=None):
+        updates = self.obj_get_changes()
+
+        if updates:
+            db_operation = self.dbapi.mapping_operation_update(
+                context, self.uuid, updates)
+            self._from_db_object(context, self, db_operation)
+
+    def start(self, context=None):
+        """Mark the operation as being applied."""
+        self.status = states.RUNNING
+        self.started_at = timeutils.utcnow()
+        self.save(context)
+
+    def finish(self, context=None, error=None, superseded=False):
+        """Mark the operation as succeeded, or failed with an error.
+
+        :param superseded: the mapping has not been applied because a newer
+                           mapping of the instance has been applied instead.
+        """
+        if superseded:
+            self.status = states.SUPERSEDED
+        else:
+            self.status = states.FAILED if error else states.SUCCEEDED
+        self.error = error
+        self.finished_at = timeutils.utcnow()
+        self.save(context)
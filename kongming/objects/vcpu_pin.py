@@ -0,0 +1,92 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from oslo_log import log as logging
+from oslo_versionedobjects import base as object_base
+
+from kongming.common import cpuset
+from kongming.db import api as dbapi
+from kongming.objects import base
+from kongming.objects import fields as object_fields
+
+
+LOG = logging.getLogger(__name__)
+
+
+@base.KongmingObjectRegistry.register
+class InstanceVCPUPin(base.KongmingObject,
+                      object_base.VersionedObjectDictCompat):
+    """The pinning of a vCPU of an instance to a host CPU.
+
+    The pins are maintained from the instances reported by the agents,
+    they are read only.
+    """
+
+    # Version 1.0: Initial version
+    VERSION = '1.0'
+
+    dbapi = dbapi.get_instance()
+
+    fields = {
+        'host': object_fields.StringField(nullable=False),
+        'pcpu': object_fields.IntegerField(nullable=False),
+        'instance_uuid': object_fields.UUIDField(nullable=False),
+        'vcpu': object_fields.IntegerField(nullable=False),
+    }
+
+    @staticmethod
+    def _from_db_object(context, pin, db_pin):
+        for name in pin.fields:
+            pin[name] = db_pin[name]
+
+        pin.obj_reset_changes()
+        return pin
+
+
+@base.KongmingObjectRegistry.register
+class InstanceVCPUPinList(base.ObjectListBase,
+                          base.KongmingObject,
+                          object_base.VersionedObjectDictCompat):
+    # Version 1.0: Initial Version
+    VERSION = '1.0'
+
+    dbapi = dbapi.get_instance()
+
+    fields = {
+        'objects': object_fields.ListOfObjectsField('InstanceVCPUPin'),
+    }
+
+    @classmethod
+    def get_by_pcpus(cls, context, host, pcpus):
+        """Return the vCPU pins using some host CPUs of a host."""
+        db_pins = cls.dbapi.vcpu_pin_get_by_pcpus(context, host, pcpus)
+        return [InstanceVCPUPin._from_db_object(
+            context, InstanceVCPUPin(context), db_pin) for db_pin in db_pins]
+
+    @classmethod
+    def get_pcpu_usage(cls, context, hosts, exclude_uuid=None):
+        """Return the number of vCPUs pinned to the CPUs of hosts.
+
+        :returns: a dict mapping every host name to a dict mapping the
+                  pinned host CPUs to their number of vCPUs.
+        """
+        return cls.dbapi.vcpu_pin_get_pcpu_usage(context, hosts,
+                                                 exclude_uuid)
+
+    @classmethod
+    def get_pinned_cpus(cls, context, host, exclude_uuid=None):
+        """Return the CPUSet of the host CPUs pinned by instances.
+
+        :param exclude_uuid: uuid of an instance whose pins are ignored.
+        """
+        usage = cls.get_pcpu_usage(context, [host], exclude_uuid)
+        return cpuset.CPUSet(usage[host])
@@ -0,0 +1,112 @@
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Hypervisor driver interface of the agent.
+
+The agent only talks to the hypervisor through a driver, the driver class
+is loaded from the [agent]driver option, relative to the kongming.virt
+package, e.g. "libvirt.LibvirtDriver" or "fake.FakeDriver".
+"""
+
+import abc
+
+from oslo_log import log as logging
+from oslo_utils import importutils
+import six
+
+from kongming.conf import CONF
+
+
+LOG = logging.getLogger(__name__)
+
+
+@six.add_metaclass(abc.ABCMeta)
+class HypervisorDriver(object):
+    """Base class for the hypervisor drivers."""
+
+    #: Whether the driver can deliver instance change events.
+    supports_events = False
+
+    @abc.abstractmethod
+    def get_hostname(self):
+        """Return the name of the host."""
+
+    @abc.abstractmethod
+    def get_max_cpu(self):
+        """Return the number of host CPUs."""
+
+    @abc.abstractmethod
+    def get_cpu_topology(self):
+        """Return the host cpu topology, see kongming.common.topology.
+
+        The groups of CPUs are cpuset strings, see topology.compact().
+        """
+
+    @abc.abstractmethod
+    def list_instances(self):
+        """Return the stats of the active instances.
+
+        :returns: a list of (uuid, status, vcpus) tuples, vcpus is None when
+                  the driver can not tell it without a per-instance call.
+        """
+
+    @abc.abstractmethod
+    def get_instance_stats(self, instance_uuid):
+        """Return the (uuid, status, vcpus) of an instance.
+
+        :returns: None if the instance does not exist or is not active.
+        """
+
+    @abc.abstractmethod
+    def get_vcpu_pin_info(self, instance_uuid, config=False):
+        """Return the cpumap of every vCPU of an instance.
+
+        :param config: return the pinning of the persistent definition of
+                       the instance instead of the live one.
+        :returns: a tuple with a tuple of booleans per vCPU, None when
+                  config is set and the instance is not persistent.
+        :raises: InstanceNotFound if the instance does not exist.
+        """
+
+    @abc.abstractmethod
+    def pin_vcpu(self, instance_uuid, vcpu, cpumap, persistent=False):
+        """Pin a vCPU of an instance.
+
+        This may be called concurrently from several green threads.
+
+        :param cpumap: a tuple of booleans, one per host CPU.
+        :param persistent: also pin the vCPU in the persistent definition
+                           of the instance so that the pinning survives
+                           restarts.
+        :returns: True if the vCPU has been pinned.
+        """
+
+    def register_event_handler(self, handler):
+        """Start delivering instance change events.
+
+        :param handler: a callable called from a green thread with the set
+                        of the uuids of the instances that changed.
+        """
+        raise NotImplementedError()
+
+
+def load_driver(driver=None):
+    """Load the hypervisor driver of the agent.
+
+    :param driver: the driver class relative to kongming.virt, defaults to
+                   the [agent]driver option.
+    """
+    driver = driver or CONF.agent.driver
+    LOG.info('Loading hypervisor driver %s', driver)
+    return importutils.import_object_ns('kongming.virt', driver)
@@ -0,0 +1,156 @@
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""A fake hypervisor driver simulating the domains of a host in memory.
+
+The simulated host topology, the number of domains and the latency of
+every call are configured with the [fake_driver] options, so that many
+agents can be run on a single machine to load test the API, the conductor
+and the agents without real hypervisors.
+"""
+
+import uuid
+
+from eventlet import greenthread
+from oslo_log import log as logging
+
+from kongming.common import exception
+from kongming.common import topology
+from kongming.conf import CONF
+from kongming.virt import driver
+
+
+LOG = logging.getLogger(__name__)
+
+
+def get_instance_uuid(hostname, index):
+    """Return the uuid of the index-th domain simulated on a host.
+
+    The uuids are stable across restarts so that simulated agents report
+    the same instances.
+    """
+    return str(uuid.uuid5(uuid.NAMESPACE_DNS, '%s-%d' % (hostname, index)))
+
+
+class FakeDriver(driver.HypervisorDriver):
+    """Hypervisor driver simulating domains in memory."""
+
+    supports_events = True
+
+    def __init__(self):
+        super(FakeDriver, self).__init__()
+        self._event_handler = None
+        self._hostname = CONF.fake_driver.hostname or CONF.host
+        self._cpu_topology, self._max_cpu = self._build_topology()
+
+        cpumap = (True,) * self._max_cpu
+        self._instances = {}
+        # Pinning of the persistent definition of the domains.
+        self._configs = {}
+        for index in range(CONF.fake_driver.instances):
+            instance_uuid = get_instance_uuid(self._hostname, index)
+            self._instances[instance_uuid] = [
+                cpumap for vcpu in range(CONF.fake_driver.vcpus)]
+            self._configs[instance_uuid] = list(
+                self._instances[instance_uuid])
+        LOG.info('Fake driver simulates %(instances)s domains on a host '
+                 'with %(cpus)s cpus.',
+                 {'instances': len(self._instances), 'cpus': self._max_cpu})
+
+    @staticmethod
+    def _build_topology():
+        """Build the simulated topology from the [fake_driver] options.
+
+        CPU ids are numbered like on Linux: the first thread of every core
+        first, then the second thread of every core and so on.
+        """
+        conf = CONF.fake_driver
+        cells = conf.sockets * conf.cells_per_socket
+        cores = cells * conf.cores_per_cell
+
+        sockets = {}
+        caches = []
+        for core in range(cores):
+            cell_id = core // conf.cores_per_cell
+            socket_id = cell_id // conf.cells_per_socket
+            threads = [core + thread * cores
+                       for thread in range(conf.threads_per_core)]
+            socket_cells = sockets.setdefault(
+                str(socket_id), {topology.CELLS: {}})[topology.CELLS]
+            cell_cores = socket_cells.setdefault(
+                str(cell_id), {topology.CORES: {}})[topology.CORES]
+            cell_cores[str(core)] = threads
+            if core % conf.cores_per_cell % conf.cores_per_cache == 0:
+                caches.append([])
+            caches[-1].extend(threads)
+
+        cpu_topology = {topology.SOCKETS: sockets,
+                        topology.CACHES: caches}
+        return topology.compact(cpu_topology), cores * conf.threads_per_core
+
+    def _call(self):
+        """Simulate the latency of a hypervisor call."""
+        if CONF.fake_driver.latency:
+            greenthread.sleep(CONF.fake_driver.latency)
+
+    def _get(self, instance_uuid):
+        try:
+            return self._instances[instance_uuid]
+        except KeyError:
+            raise exception.InstanceNotFound(reason=instance_uuid)
+
+    def get_hostname(self):
+        return self._hostname
+
+    def get_max_cpu(self):
+        return self._max_cpu
+
+    def get_cpu_topology(self):
+        self._call()
+        return self._cpu_topology
+
+    def list_instances(self):
+        self._call()
+        return [(instance_uuid, 'Running', len(cpumaps))
+                for instance_uuid, cpumaps in self._instances.items()]
+
+    def get_instance_stats(self, instance_uuid):
+        self._call()
+        cpumaps = self._instances.get(instance_uuid)
+        if cpumaps is None:
+            return None
+        return instance_uuid, 'Running', len(cpumaps)
+
+    def get_vcpu_pin_info(self, instance_uuid, config=False):
+        self._call()
+        cpumaps = self._get(instance_uuid)
+        if config:
+            cpumaps = self._configs[instance_uuid]
+        return tuple(cpumaps)
+
+    def pin_vcpu(self, instance_uuid, vcpu, cpumap, persistent=False):
+        self._call()
+        cpumaps = self._get(instance_uuid)
+        if vcpu >= len(cpumaps) or len(cpumap) != self._max_cpu:
+            return False
+        cpumaps[vcpu] = tuple(cpumap)
+        if persistent:
+            self._configs[instance_uuid][vcpu] = tuple(cpumap)
+        if self._event_handler is not None:
+            # Like libvirt, notify the pinning change with a tuning event.
+            greenthread.spawn_n(self._event_handler, set([instance_uuid]))
+        return True
+
+    def register_event_handler(self, handler):
+        self._event_handler = handler
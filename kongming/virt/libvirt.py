@@ -0,0 +1,335 @@
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from __future__ import absolute_import
+
+import os
+
+from eventlet import greenio
+from eventlet import greenthread
+from eventlet import patcher
+from eventlet import tpool
+import libvirt
+import six
+from xml.etree import ElementTree
+
+from oslo_log import log as logging
+
+from kongming.common import cpuset
+from kongming.common import exception
+from kongming.common import topology
+from kongming.conf import CONF
+from kongming.virt import driver
+
+
+LOG = logging.getLogger(__name__)
+
+SYSFS_CPU_PATH = '/sys/devices/system/cpu'
+# Path of the host topology element in the libvirt capabilities.
+TOPOLOGY_PATH = ['capabilities', 'host', 'topology']
+
+DOMAIN_STATES = {
+    libvirt.VIR_DOMAIN_NOSTATE: "No State",
+    libvirt.VIR_DOMAIN_RUNNING: "Running",
+    libvirt.VIR_DOMAIN_BLOCKED: "Blocked",
+    libvirt.VIR_DOMAIN_PAUSED: "Paused",
+    libvirt.VIR_DOMAIN_SHUTDOWN: "Shutdown",
+    libvirt.VIR_DOMAIN_SHUTOFF: "Shutoff",
+    libvirt.VIR_DOMAIN_CRASHED: "Crashed",
+    libvirt.VIR_DOMAIN_PMSUSPENDED: "Suspended",
+}
+
+native_threading = patcher.original('threading')
+native_Queue = patcher.original('Queue' if six.PY2 else 'queue')
+
+
+class LibvirtDriver(driver.HypervisorDriver):
+    """Hypervisor driver for the local libvirt daemon."""
+
+    supports_events = True
+
+    def __init__(self):
+        super(LibvirtDriver, self).__init__()
+        self._event_queue = None
+        self._event_handler = None
+        self._bulk_stats_supported = True
+        # Domain handles by uuid, refreshed by every domain listing so
+        # that the per-domain calls do not need a lookup round-trip.
+        self._domains = {}
+        if CONF.agent.enable_libvirt_events:
+            # The default event loop implementation must be registered
+            # before the connection is opened.
+            libvirt.virEventRegisterDefaultImpl()
+        self.conn = libvirt.open('qemu:///system')
+
+    def get_hostname(self):
+        return self.conn.getHostname()
+
+    def get_max_cpu(self):
+        return self.conn.getInfo()[2]
+
+    def register_event_handler(self, handler):
+        """Start dispatching libvirt domain events.
+
+        libvirt delivers events from a native thread running its default
+        event loop, the events are handed over to a green thread through a
+        native queue and a pipe so that the sync itself runs under eventlet.
+        """
+        self._event_handler = handler
+        self._event_queue = native_Queue.Queue()
+        rpipe, wpipe = os.pipe()
+        self._event_notify_send = greenio.GreenPipe(wpipe, 'wb', 0)
+        self._event_notify_recv = greenio.GreenPipe(rpipe, 'rb', 0)
+
+        self.conn.domainEventRegisterAny(
+            None, libvirt.VIR_DOMAIN_EVENT_ID_LIFECYCLE,
+            self._domain_lifecycle_callback, None)
+        self.conn.domainEventRegisterAny(
+            None, libvirt.VIR_DOMAIN_EVENT_ID_TUNING,
+            self._domain_tuning_callback, None)
+
+        LOG.debug('Starting native libvirt event thread')
+        event_thread = native_threading.Thread(target=self._native_thread)
+        event_thread.setDaemon(True)
+        event_thread.start()
+
+        LOG.debug('Starting green event dispatch thread')
+        greenthread.spawn(self._dispatch_thread)
+
+    def _native_thread(self):
+        while True:
+            libvirt.virEventRunDefaultImpl()
+
+    def _dispatch_thread(self):
+        while True:
+            self._dispatch_events()
+
+    def _domain_lifecycle_callback(self, conn, dom, event, detail, opaque):
+        if event == libvirt.VIR_DOMAIN_EVENT_UNDEFINED:
+            return
+        self._queue_event(dom.UUIDString())
+
+    def _domain_tuning_callback(self, conn, dom, params, opaque):
+        self._queue_event(dom.UUIDString())
+
+    def _queue_event(self, instance_uuid):
+        """Called from the native thread to queue a domain for sync."""
+        self._event_queue.put(instance_uuid)
+        self._event_notify_send.write(b' ')
+        self._event_notify_send.flush()
+
+    def _dispatch_events(self):
+        """Hand the domains queued by libvirt events to the handler.
+
+        Several events for the same domain usually arrive in a burst, so the
+        queue is drained first and each domain is handed over only once.
+        """
+        try:
+            self._event_notify_recv.read(1)
+        except ValueError:
+            return
+
+        instance_uuids = set()
+        while not self._event_queue.empty():
+            instance_uuids.add(self._event_queue.get(block=False))
+        for instance_uuid in instance_uuids:
+            self._domains.pop(instance_uuid, None)
+
+        if instance_uuids:
+            self._event_handler(instance_uuids)
+
+    def _get_cache_groups(self, cpu_ids):
+        """Read the groups of CPUs sharing a last level cache from sysfs.
+
+        The last level cache of a CPU is its highest level cache index,
+        i.e. the L3 cache shared by a CCX on AMD hosts.
+        """
+        groups = set()
+        for cpu_id in cpu_ids:
+            cache_path = os.path.join(SYSFS_CPU_PATH, 'cpu%d' % cpu_id,
+                                      'cache')
+            try:
+                indexes = [name for name in os.listdir(cache_path)
+                           if name.startswith('index')]
+            except OSError:
+                continue
+            llc = None
+            for index in indexes:
+                try:
+                    with open(os.path.join(cache_path, index,
+                                           'level')) as f:
+                        level = int(f.read())
+                    with open(os.path.join(cache_path, index,
+                                           'shared_cpu_list')) as f:
+                        shared = f.read().strip()
+                except (IOError, OSError, ValueError):
+                    continue
+                if llc is None or level > llc[0]:
+                    llc = (level, shared)
+            if llc:
+                groups.add(cpuset.CPUSet.parse(llc[1]))
+        return [list(group) for group in
+                sorted(groups, key=lambda group: min(group))]
+
+    def get_cpu_topology(self):
+        """Build the structured cpu topology of the host.
+
+        Sockets, NUMA cells, cores and hyperthread siblings come from the
+        libvirt capabilities, the last level cache groups from sysfs.
+        Only the host topology subtree of the capabilities is parsed, the
+        parser stops at its end and skips the rest of the document.
+        """
+        caps = self.conn.getCapabilities()
+        if isinstance(caps, six.text_type):
+            caps = caps.encode('utf-8')
+
+        sockets = {}
+        cpu_ids = []
+        path = []
+        cell_id = None
+        for event, elem in ElementTree.iterparse(
+                six.BytesIO(caps), events=('start', 'end')):
+            if event == 'end':
+                if path == TOPOLOGY_PATH:
+                    break
+                path.pop()
+                elem.clear()
+                continue
+
+            path.append(elem.tag)
+            if path[:len(TOPOLOGY_PATH)] != TOPOLOGY_PATH:
+                continue
+            if elem.tag == 'cell':
+                cell_id = elem.get('id')
+            elif elem.tag == 'cpu' and path[-2] == 'cpus':
+                cpu_id = int(elem.get('id'))
+                # Older libvirt releases only report the cpu ids, every
+                # cpu is then a core of its own.
+                socket_id = elem.get('socket_id', '0')
+                core_id = elem.get('core_id', str(cpu_id))
+                if elem.get('die_id'):
+                    core_id = '%s.%s' % (elem.get('die_id'), core_id)
+                socket_cells = sockets.setdefault(
+                    socket_id, {topology.CELLS: {}})[topology.CELLS]
+                cores = socket_cells.setdefault(
+                    cell_id, {topology.CORES: {}})[topology.CORES]
+                cores.setdefault(core_id, []).append(cpu_id)
+                cpu_ids.append(cpu_id)
+
+        return topology.compact(
+            {topology.SOCKETS: sockets,
+             topology.CACHES: self._get_cache_groups(sorted(cpu_ids))})
+
+    def list_instances(self):
+        """List the active domains with their state and vCPU count.
+
+        The state and vCPU count of every domain are sampled with a single
+        getAllDomainStats() call, per-domain state() calls are only used
+        with libvirt releases that do not support the bulk stats API.
+        """
+        stats = None
+        if self._bulk_stats_supported:
+            try:
+                stats = self.conn.getAllDomainStats(
+                    libvirt.VIR_DOMAIN_STATS_STATE |
+                    libvirt.VIR_DOMAIN_STATS_VCPU,
+                    libvirt.VIR_CONNECT_GET_ALL_DOMAINS_STATS_ACTIVE)
+            except (AttributeError, libvirt.libvirtError) as e:
+                if (isinstance(e, libvirt.libvirtError) and
+                        e.get_error_code() != libvirt.VIR_ERR_NO_SUPPORT):
+                    raise
+                LOG.info('Bulk domain stats are not supported by libvirt, '
+                         'fall back to per-domain calls.')
+                self._bulk_stats_supported = False
+
+        if stats is None:
+            stats = [(dom, {'state.state': dom.state()[0]}) for dom in
+                     self.conn.listAllDomains(
+                         libvirt.VIR_CONNECT_LIST_DOMAINS_ACTIVE)]
+
+        self._domains = dict((dom.UUIDString(), dom) for dom, record in stats)
+        return [(dom.UUIDString(), DOMAIN_STATES[record['state.state']],
+                 record.get('vcpu.current'))
+                for dom, record in stats]
+
+    def _lookup(self, instance_uuid):
+        dom = self._domains.get(instance_uuid)
+        if dom is None:
+            try:
+                dom = self.conn.lookupByUUIDString(instance_uuid)
+            except libvirt.libvirtError as e:
+                if e.get_error_code() == libvirt.VIR_ERR_NO_DOMAIN:
+                    raise exception.InstanceNotFound(reason=instance_uuid)
+                raise
+        return dom
+
+    def _handle_no_domain(self, instance_uuid, error):
+        """Drop a domain handle which is no longer valid.
+
+        The cached handle of a domain which has been undefined since it
+        was listed raises VIR_ERR_NO_DOMAIN on its next call.
+
+        :raises: InstanceNotFound if the domain does not exist, the libvirt
+                 error otherwise.
+        """
+        self._domains.pop(instance_uuid, None)
+        if error.get_error_code() == libvirt.VIR_ERR_NO_DOMAIN:
+            raise exception.InstanceNotFound(reason=instance_uuid)
+        raise error
+
+    def get_instance_stats(self, instance_uuid):
+        try:
+            dom = self._lookup(instance_uuid)
+            try:
+                if not dom.isActive():
+                    return None
+                state = dom.state()[0]
+            except libvirt.libvirtError as e:
+                self._handle_no_domain(instance_uuid, e)
+        except exception.InstanceNotFound:
+            LOG.debug('Domain %s not found.', instance_uuid)
+            return None
+        return instance_uuid, DOMAIN_STATES[state], None
+
+    def get_vcpu_pin_info(self, instance_uuid, config=False):
+        dom = self._lookup(instance_uuid)
+        try:
+            if not config:
+                return tuple(tuple(cpumap) for cpumap in dom.vcpuPinInfo())
+            if not dom.isPersistent():
+                return None
+            return tuple(tuple(cpumap) for cpumap in
+                         dom.vcpuPinInfo(libvirt.VIR_DOMAIN_AFFECT_CONFIG))
+        except libvirt.libvirtError as e:
+            self._handle_no_domain(instance_uuid, e)
+
+    def pin_vcpu(self, instance_uuid, vcpu, cpumap, persistent=False):
+        try:
+            dom = self._lookup(instance_uuid)
+            flags = libvirt.VIR_DOMAIN_AFFECT_LIVE
+            if persistent and dom.isPersistent():
+                # Also write the pinning to the cputune element of the
+                # domain definition.
+                flags |= libvirt.VIR_DOMAIN_AFFECT_CONFIG
+            # The libvirt call blocks, run it in a native thread so that
+            # several vCPUs can be pinned at the same time.
+            ret = tpool.execute(dom.pinVcpuFlags, vcpu, cpumap, flags)
+        except libvirt.libvirtError as e:
+            if e.get_error_code() == libvirt.VIR_ERR_NO_DOMAIN:
+                self._domains.pop(instance_uuid, None)
+            LOG.error('Failed to pin vcpu %(vcpu)s of instance %(uuid)s: '
+                      '%(error)s',
+                      {'vcpu': vcpu, 'uuid': instance_uuid, 'error': e})
+            return False
+        return ret == 0